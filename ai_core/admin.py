@@ -1,3 +1,53 @@
 from django.contrib import admin
 
-# Register your models here.
+from .answer_cache import answer_cache
+from .jobs import requeue
+from .models import AnswerCacheEntry, Job
+
+
+# Admin for AnswerCacheEntry
+class AnswerCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['query', 'scope', 'hits', 'generation_seconds', 'created_at', 'last_hit_at']
+    search_fields = ['query', 'answer']
+    list_filter = ['scope', 'embedding_model', 'corpus_generation']
+    ordering = ['-created_at']
+    exclude = ['query_embedding']
+    actions = ['purge_scopes', 'purge_all']
+
+    @admin.action(description="Purge cached answers in the selected entries' scopes")
+    def purge_scopes(self, request, queryset):
+        deleted = sum(answer_cache.purge(scope) for scope in set(queryset.values_list('scope', flat=True)))
+        self.message_user(request, f"Purged {deleted} cached answers.")
+
+    @admin.action(description="Purge the whole answer cache")
+    def purge_all(self, request, queryset):
+        self.message_user(request, f"Purged {answer_cache.purge()} cached answers.")
+
+    def changelist_view(self, request, extra_context=None):
+        stats = answer_cache.stats()
+        self.message_user(
+            request,
+            f"Hit rate {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses), "
+            f"{stats['latency_saved_seconds']}s of generation latency saved.",
+        )
+        return super().changelist_view(request, extra_context)
+
+
+admin.site.register(AnswerCacheEntry, AnswerCacheEntryAdmin)
+
+
+# Admin for Job
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'user', 'attempts', 'max_attempts', 'created_at', 'finished_at']
+    search_fields = ['kind', 'key', 'last_error']
+    list_filter = ['status', 'kind']
+    ordering = ['-created_at']
+    readonly_fields = ['locked_by', 'locked_until', 'started_at', 'finished_at', 'created_at']
+    actions = ['requeue_dead']
+
+    @admin.action(description="Requeue the selected dead jobs")
+    def requeue_dead(self, request, queryset):
+        self.message_user(request, f"Requeued {requeue(queryset)} dead jobs.")
+
+
+admin.site.register(Job, JobAdmin)
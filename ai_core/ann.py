@@ -0,0 +1,198 @@
+import logging
+import os
+
+import numpy as np
+from django.conf import settings
+
+from .vector_index import engine_path, load_index_file, normalize_rows, top_k_positions
+
+logger = logging.getLogger(__name__)
+
+ASSIGN_BATCH_SIZE = 16384
+
+
+def spherical_kmeans(data, n_clusters, n_iter=20, seed=0):
+    """
+    Cluster L2-normalized rows by cosine similarity and return unit-length centroids.
+    Empty clusters are re-seeded from random rows so every centroid stays in use.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].astype(np.float32)
+
+    for _ in range(n_iter):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_clusters(matrix, centroids):
+    """Nearest centroid for every row, computed in blocks so memory-mapped matrices are streamed."""
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_BATCH_SIZE):
+        block = np.asarray(matrix[start:start + ASSIGN_BATCH_SIZE], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate search over a VectorIndex.
+
+    Rows are grouped by their nearest k-means centroid into inverted lists stored in
+    CSR form (`order` holds row positions grouped by list, `offsets` the list bounds).
+    A query scores only the rows in the `nprobe` lists whose centroids are closest.
+    A filtered query keeps probing lists, nearest first, until it has found top_k rows
+    of the selected partitions; partitions smaller than what the probes would read
+    are scanned exactly instead.
+    """
+
+    def __init__(self, centroids, offsets, order, index_generation=None, nprobe=8):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.order = order
+        self.index_generation = index_generation
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def nbytes(self):
+        return self.centroids.nbytes + self.offsets.nbytes + self.order.nbytes
+
+    @classmethod
+    def build(cls, index, nlist=None, n_iter=20, sample_size=20000, seed=0, nprobe=8):
+        """Train centroids on a sample of the index matrix and assign every row to a list."""
+        if len(index) == 0:
+            raise ValueError("Cannot build an IVF index over an empty vector index")
+        nlist = nlist or default_nlist(len(index))
+
+        rng = np.random.default_rng(seed)
+        if len(index) > sample_size:
+            sample_rows = np.sort(rng.choice(len(index), sample_size, replace=False))
+            sample = np.asarray(index.matrix[sample_rows], dtype=np.float32)
+        else:
+            sample = np.asarray(index.matrix, dtype=np.float32)
+
+        centroids = spherical_kmeans(sample, nlist, n_iter=n_iter, seed=seed)
+        assignments = assign_clusters(index.matrix, centroids)
+        order = np.argsort(assignments, kind='stable').astype(np.int64)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=offsets[1:])
+        return cls(centroids, offsets, order, index_generation=index.generation, nprobe=nprobe)
+
+    def candidate_rows(self, query, nprobe=None, partition_codes=None, partitions=None, min_rows=0):
+        """
+        Row positions in the probed inverted lists for a normalized query. With `partitions`,
+        only rows whose entry in `partition_codes` is one of them are kept, and lists beyond
+        the first `nprobe` are probed, nearest first, until at least `min_rows` are found.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        if partitions is None:
+            if nprobe < self.nlist:
+                probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            else:
+                probes = np.arange(self.nlist)
+            return np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+
+        found, count = [], 0
+        for probed, p in enumerate(np.argsort(-centroid_scores)):
+            if probed >= nprobe and count >= min_rows:
+                break
+            rows = self.order[self.offsets[p]:self.offsets[p + 1]]
+            rows = rows[np.isin(partition_codes[rows], partitions)]
+            found.append(rows)
+            count += len(rows)
+        return np.concatenate(found)
+
+    def search(self, index, query_embedding, top_k=5, nprobe=None, partitions=None):
+        """
+        Return (ids, scores) of the approximate top_k rows of `index`, best first,
+        optionally only among rows in the given partition codes.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if len(index) == 0 or top_k <= 0 or norm == 0 or query.shape[0] != index.dim:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = query / norm
+
+        if partitions is None:
+            rows = self.candidate_rows(query, nprobe)
+        else:
+            ranges = index.row_ranges(partitions)
+            selected = sum(end - start for start, end in ranges)
+            probed = len(index) * min(nprobe or self.nprobe, self.nlist) / self.nlist
+            if selected <= probed:
+                rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+            else:
+                rows = self.candidate_rows(query, nprobe, index.partition_codes, partitions,
+                                           min_rows=min(top_k, selected))
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows.sort()
+        scores = index.matrix[rows] @ query
+        top = top_k_positions(scores, top_k)
+        return index.ids[rows[top]], scores[top]
+
+    def save(self, path):
+        """Persist the index with an atomic rename, like the vector index file it belongs to."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        try:
+            np.savez(
+                tmp_path,
+                centroids=self.centroids,
+                offsets=self.offsets,
+                order=self.order,
+                index_generation=np.array(str(self.index_generation)),
+            )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        with np.load(path) as data:
+            return cls(
+                data['centroids'],
+                data['offsets'],
+                data['order'],
+                index_generation=str(data['index_generation']),
+                nprobe=nprobe,
+            )
+
+
+def default_nlist(count):
+    """Rule-of-thumb list count: about 4 * sqrt(N), at least 1."""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+def recall_at_k(approx_ids, exact_ids):
+    """Fraction of the exact top-k ids that the approximate search also returned."""
+    if len(exact_ids) == 0:
+        return 1.0
+    return len(set(approx_ids.tolist()) & set(exact_ids.tolist())) / len(exact_ids)
+
+
+def build_ivf_index(nlist=None, n_iter=20, sample_size=20000, path=None, index_path=None):
+    """
+    Build an IVF index over the index file at `index_path` (default: the current vector
+    index) and persist it next to that file.
+    """
+    from .vector_index import get_vector_index
+
+    index = load_index_file(index_path) if index_path else get_vector_index()
+    ivf = IVFIndex.build(index, nlist=nlist, n_iter=n_iter, sample_size=sample_size,
+                         nprobe=settings.VECTOR_IVF_NPROBE)
+    ivf.save(path or engine_path(index_path, 'ivf'))
+    return ivf
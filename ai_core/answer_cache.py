@@ -0,0 +1,152 @@
+"""
+Semantic answer cache: past (query embedding, answer) pairs are reused when a new
+query's embedding is close enough to a stored one, so paraphrases of a popular
+question skip retrieval and the LLM round-trip.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import SharedCounters
+from .utils import embedding_to_bytes
+from .vector_index import VectorIndex, corpus_state
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CANDIDATES = 5
+
+
+def filter_scope(filters):
+    """
+    Answer scope of a retrieval filter (see vector_index.select_partitions), so an answer
+    is only reused for queries searching the same partitions; '' for an unfiltered search.
+    """
+    return ";".join(
+        f"{field}={values if isinstance(values, str) else ','.join(sorted(values))}"
+        for field, values in sorted((filters or {}).items())
+    )
+
+
+class SemanticAnswerCache:
+    """
+    Answers stored in AnswerCacheEntry, scoped by retrieval filter (see filter_scope) and embedding model.
+    Only answers retrieved from the current corpus generation are served, so adding or
+    changing chunks retires the answers drawn from the old ones.
+
+    Each worker keeps one in-memory vector index per scope over the stored query
+    embeddings and rebuilds it when the scope's row fingerprint changes, so entries
+    written or purged by other workers are picked up on the next lookup.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.counters = SharedCounters('answer-cache', ('hits', 'misses', 'saved_ms'))
+
+    def entries(self, scope=''):
+        """Entries of `scope` answered from the active model's current corpus generation."""
+        from .models import AnswerCacheEntry
+
+        model, generation = corpus_state()
+        return AnswerCacheEntry.objects.filter(scope=scope, embedding_model=model, corpus_generation=generation)
+
+    def cutoff(self):
+        return timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+
+    def _index(self, scope):
+        entries = self.entries(scope)
+        state = (corpus_state(), *entries.aggregate(count=Count('id'), last=Max('id')).values())
+        index = self._indexes.get(scope)
+        if index is not None and index.state == state:
+            return index
+        with self._lock:
+            index = VectorIndex.from_rows(
+                ((entry_id, embedding, scope) for entry_id, embedding in
+                 entries.values_list('id', 'query_embedding').iterator(chunk_size=1000)),
+                state=state,
+            )
+            self._indexes[scope] = index
+        return index
+
+    def lookup(self, query_embedding, scope=''):
+        """Return the freshest stored entry similar enough to the query, or None."""
+        started = time.perf_counter()
+        ids, scores = self._index(scope).search(query_embedding, top_k=LOOKUP_CANDIDATES)
+        ids = [entry_id for entry_id, score in zip(ids.tolist(), scores.tolist())
+               if score >= settings.ANSWER_CACHE_THRESHOLD]
+
+        entry = None
+        if ids:
+            fresh = self.entries(scope).filter(id__in=ids, created_at__gte=self.cutoff()).in_bulk()
+            entry = next((fresh[entry_id] for entry_id in ids if entry_id in fresh), None)
+
+        if entry is None:
+            self.counters.incr('misses')
+            return None
+
+        self.entries(scope).filter(id=entry.id).update(hits=F('hits') + 1, last_hit_at=timezone.now())
+        saved = entry.generation_seconds - (time.perf_counter() - started)
+        self.counters.incr('hits')
+        self.counters.incr('saved_ms', max(0, int(saved * 1000)))
+        return entry
+
+    def store(self, query, query_embedding, answer, generation_seconds, scope=''):
+        """
+        Save an answer, then drop the scope's expired entries, those of older corpus
+        generations and the least recently used beyond the size limit.
+        """
+        from .models import AnswerCacheEntry
+
+        model, generation = corpus_state()
+        AnswerCacheEntry.objects.create(
+            scope=scope,
+            embedding_model=model,
+            corpus_generation=generation,
+            query=query,
+            query_embedding=embedding_to_bytes(query_embedding),
+            answer=answer,
+            generation_seconds=generation_seconds,
+        )
+        AnswerCacheEntry.objects.filter(scope=scope, embedding_model=model).exclude(corpus_generation=generation).delete()
+        entries = self.entries(scope)
+        entries.filter(created_at__lt=self.cutoff()).delete()
+        overflow = list(
+            entries.order_by(Coalesce('last_hit_at', 'created_at').desc())
+            .values_list('id', flat=True)[settings.ANSWER_CACHE_MAX_ENTRIES:]
+        )
+        if overflow:
+            AnswerCacheEntry.objects.filter(id__in=overflow).delete()
+
+    def purge(self, scope=None):
+        """Delete all cached answers, or only those of one scope. Returns the number deleted."""
+        from .models import AnswerCacheEntry
+
+        entries = AnswerCacheEntry.objects.all() if scope is None else AnswerCacheEntry.objects.filter(scope=scope)
+        deleted, _ = entries.delete()
+        with self._lock:
+            self._indexes.clear()
+        logger.info(f"Purged {deleted} cached answers (scope={scope!r})")
+        return deleted
+
+    def stats(self):
+        """Hit rate and total latency saved across workers, plus the number of stored answers."""
+        from .models import AnswerCacheEntry
+
+        totals = self.counters.totals()
+        lookups = totals['hits'] + totals['misses']
+        return {
+            'hits': totals['hits'],
+            'misses': totals['misses'],
+            'hit_rate': totals['hits'] / lookups if lookups else 0.0,
+            'latency_saved_seconds': round(totals['saved_ms'] / 1000, 1),
+            'entries': AnswerCacheEntry.objects.count(),
+        }
+
+
+answer_cache = SemanticAnswerCache()
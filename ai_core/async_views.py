@@ -0,0 +1,27 @@
+"""
+Async counterparts of the Django helpers the LLM-bound views use.
+
+Under ASGI an async view holds no worker thread while it waits on the model, so one
+process can serve hundreds of concurrent generations. Django's LoginRequiredMixin and
+render() are synchronous and would touch the session and the database on the event
+loop; these versions load the user with request.auser() and render in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.shortcuts import render
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """LoginRequiredMixin for views whose handlers are all `async def`."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Load the user once, so request.user is a plain object in the async handlers
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+async def arender(request, template_name, context=None):
+    """render() from an async view; template context processors may query the database."""
+    return await sync_to_async(render)(request, template_name, context)
@@ -0,0 +1,256 @@
+"""
+Retrieval benchmarks over synthetic or stored corpora.
+
+Synthetic corpora are drawn from a mixture of topic clusters, so approximate engines
+see a realistic, non-uniform distribution. Each corpus goes through the same path as
+real chunks (serialized embeddings → index file → memory-mapped VectorIndex), then
+every engine is built over it and measured for latency and recall@k against exact
+brute-force search.
+"""
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from .ann import IVFIndex, recall_at_k
+from .quantization import QUANTIZERS
+from .utils import embedding_to_bytes
+from .vector_index import load_index_file, write_index_file
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ('brute', 'ivf', 'int8', 'pq')
+SYNTHETIC_PARTITIONS = [
+    ('WAEC Syllabus', 'SSS', 'History'),
+    ('History Textbook', 'SSS', 'History'),
+    ('JSS Handbook', 'JSS', ''),
+    ('Primary School Handbook', 'Primary', ''),
+]
+GENERATE_BLOCK_SIZE = 8192
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(samples_ms):
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+class SyntheticCorpus:
+    """Embeddings clustered around `topics` random unit vectors; the same seed always gives the same corpus."""
+
+    def __init__(self, dim=768, topics=64, spread=0.6, seed=0):
+        self.dim = dim
+        self.spread = spread
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.centers = rng.standard_normal((topics, dim)).astype(np.float32)
+        self.centers /= np.linalg.norm(self.centers, axis=1, keepdims=True)
+
+    def sample(self, count, rng):
+        topics = rng.integers(len(self.centers), size=count)
+        noise = rng.standard_normal((count, self.dim)).astype(np.float32) * (self.spread / np.sqrt(self.dim))
+        return self.centers[topics] + noise
+
+    def rows(self, size):
+        """(id, serialized embedding, partition) rows grouped by partition, generated block by block."""
+        per_partition = np.diff(np.linspace(0, size, len(SYNTHETIC_PARTITIONS) + 1).astype(np.int64))
+        rng = np.random.default_rng(self.seed + 1)
+        chunk_id = 0
+        for partition, count in zip(SYNTHETIC_PARTITIONS, per_partition):
+            for start in range(0, count, GENERATE_BLOCK_SIZE):
+                for vector in self.sample(min(GENERATE_BLOCK_SIZE, count - start), rng):
+                    chunk_id += 1
+                    yield chunk_id, embedding_to_bytes(vector), partition
+
+    def queries(self, count):
+        return self.sample(count, np.random.default_rng(self.seed + 2))
+
+
+def time_queries(search, queries):
+    """Per-query latencies (ms) and results of running `search` on each query."""
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def time_batches(search_many, queries, batch_size):
+    """Per-batch latencies (ms) of running `search_many` on consecutive batches of queries."""
+    latencies = []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        started = time.perf_counter()
+        search_many(batch)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def build_engine(index, engine, nlist=None, subspaces=None):
+    """Attach the named engine's approximate structure to `index`; returns its size in bytes."""
+    index.ann = None
+    if engine == 'brute':
+        return 0
+    if engine == 'ivf':
+        ivf = IVFIndex.build(index, nlist=nlist)
+        index.ann = ivf
+        return ivf.nbytes
+    quantized = QUANTIZERS[engine].build(index, subspaces=subspaces)
+    index.ann = quantized
+    return quantized.nbytes
+
+
+def measure_queries(index, queries, k, batch_size, filters=None, exact=None):
+    """Single- and batch-query latency percentiles and recall@k against the `exact` result ids."""
+    exact = exact or [index.search(q, top_k=k, exact=True, filters=filters)[0] for q in queries]
+    single, found = time_queries(lambda q: index.search(q, top_k=k, filters=filters)[0], queries)
+    batches = time_batches(lambda batch: index.search_many(batch, top_k=k, filters=filters), queries, batch_size)
+    return {
+        "single_ms": percentiles(single),
+        "batch_ms": percentiles(batches),
+        "batch_ms_per_query": round(float(np.mean(batches)) / batch_size, 3),
+        "recall_at_k": round(float(np.mean([recall_at_k(f, e) for f, e in zip(found, exact)])), 4),
+    }
+
+
+def benchmark_index(index, queries, engines=ENGINES, k=5, batch_size=16, nlist=None, subspaces=None,
+                    filters=None):
+    """
+    Measure every engine on one index: build time, structure size, single-query and
+    batch latency percentiles, and recall@k against exact search. With `filters`, each
+    engine is also measured on the filtered search under "filtered".
+    """
+    index.ann = None
+    exact = [index.search(q, top_k=k, exact=True)[0] for q in queries]
+    exact_filtered = [index.search(q, top_k=k, exact=True, filters=filters)[0] for q in queries] if filters else None
+    results = []
+    for engine in engines:
+        start = time.perf_counter()
+        try:
+            nbytes = build_engine(index, engine, nlist=nlist, subspaces=subspaces)
+        except ValueError as e:
+            logger.warning(f"Skipping {engine}: {e}")
+            results.append({"engine": engine, "error": str(e)})
+            continue
+        build_seconds = time.perf_counter() - start
+
+        result = {
+            "engine": engine,
+            "build_seconds": round(build_seconds, 3),
+            "structure_bytes": int(nbytes),
+            **measure_queries(index, queries, k, batch_size, exact=exact),
+        }
+        if filters:
+            result["filtered"] = measure_queries(index, queries, k, batch_size, filters=filters, exact=exact_filtered)
+        result["peak_rss_bytes"] = peak_rss_bytes()
+        results.append(result)
+    index.ann = None
+    return results
+
+
+def benchmark_synthetic(size, dim=768, queries=200, seed=0, workdir=None, **options):
+    """
+    Generate a synthetic corpus of `size` chunks, write and load it as an index file,
+    and benchmark every engine on it. The index file lives in a temporary directory
+    (under `workdir`, which is created if needed).
+    """
+    corpus = SyntheticCorpus(dim=dim, seed=seed)
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="retrieval-bench-", dir=workdir)
+    path = os.path.join(directory, "index.bin")
+    try:
+        start = time.perf_counter()
+        header = write_index_file(path, corpus.rows(size), model="synthetic")
+        ingest_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = load_index_file(path)
+        load_seconds = time.perf_counter() - start
+
+        query_vectors = corpus.queries(queries)
+        return {
+            "corpus": "synthetic",
+            "size": size,
+            "dim": dim,
+            "partitions": len(header["partitions"]),
+            "ingest_seconds": round(ingest_seconds, 3),
+            "ingest_chunks_per_second": round(size / ingest_seconds, 1) if ingest_seconds else None,
+            "load_seconds": round(load_seconds, 4),
+            "index_file_bytes": os.path.getsize(path),
+            "matrix_bytes": size * dim * 4,
+            "filters": {'document_type': SYNTHETIC_PARTITIONS[0][0]},
+            "engines": benchmark_index(
+                index, query_vectors, **options, filters={'document_type': SYNTHETIC_PARTITIONS[0][0]},
+            ),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_stored(queries=200, seed=0, **options):
+    """Benchmark every engine on the live vector index, querying with jittered corpus vectors."""
+    from .vector_index import get_vector_index
+
+    index = get_vector_index()
+    if len(index) == 0:
+        raise ValueError("The vector index is empty")
+    ann = index.ann
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(index), min(queries, len(index)), replace=False))
+    query_vectors = np.asarray(index.matrix[rows], dtype=np.float32)
+    query_vectors += rng.normal(scale=0.05 / np.sqrt(index.dim), size=query_vectors.shape).astype(np.float32)
+    try:
+        engines = benchmark_index(index, query_vectors, **options)
+    finally:
+        index.ann = ann
+    return {
+        "corpus": "stored",
+        "size": len(index),
+        "dim": index.dim,
+        "partitions": len(index.partitions),
+        "matrix_bytes": len(index) * index.dim * 4,
+        "engines": engines,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, min_delta_ms=0.1):
+    """
+    Regressions of `results` against a previous run: p95 single-query latency more than
+    `tolerance` (and at least `min_delta_ms`) slower, or lower recall@k, for the same
+    corpus, size and engine.
+    """
+    def keyed(run):
+        measurements = {}
+        for corpus in run["corpora"]:
+            for engine in corpus["engines"]:
+                if "error" in engine:
+                    continue
+                measurements[(corpus["corpus"], corpus["size"], engine["engine"], "all")] = engine
+                if "filtered" in engine:
+                    measurements[(corpus["corpus"], corpus["size"], engine["engine"], "filtered")] = engine["filtered"]
+        return measurements
+
+    previous = keyed(baseline)
+    regressions = []
+    for key, engine in keyed(results).items():
+        before = previous.get(key)
+        if before is None:
+            continue
+        slowdown = engine["single_ms"]["p95"] - before["single_ms"]["p95"]
+        if slowdown > before["single_ms"]["p95"] * tolerance and slowdown >= min_delta_ms:
+            regressions.append({"key": list(key), "metric": "single_ms.p95",
+                                "before": before["single_ms"]["p95"], "after": engine["single_ms"]["p95"]})
+        if engine["recall_at_k"] < before["recall_at_k"] - 0.005:
+            regressions.append({"key": list(key), "metric": "recall_at_k",
+                                "before": before["recall_at_k"], "after": engine["recall_at_k"]})
+    return regressions
@@ -0,0 +1,195 @@
+"""
+Two-level caches for retrieval: a bounded in-process LRU in front of Django's
+cache framework, which is shared by every worker (settings.CACHES).
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+STATS_FLUSH_EVERY = 50
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query used in cache keys."""
+    return " ".join(text.lower().split())
+
+
+def make_key(*parts):
+    """Stable, backend-safe cache key from arbitrary parts."""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU holding at most `max_size` entries."""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedCounters:
+    """
+    Named counters summed across workers.
+
+    Increments are buffered per process and added to the shared cache every
+    STATS_FLUSH_EVERY increments, so counting does not cost a cache write per event.
+    """
+
+    def __init__(self, namespace, names, alias='default'):
+        self.namespace = namespace
+        self.names = tuple(names)
+        self.alias = alias
+        self._pending = dict.fromkeys(self.names, 0)
+        self._events = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _key(self, name):
+        return f"{self.namespace}:stats:{name}"
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._pending[name] += amount
+            self._events += 1
+            if self._events < STATS_FLUSH_EVERY:
+                return
+            pending, self._pending, self._events = self._pending, dict.fromkeys(self.names, 0), 0
+        self._flush(pending)
+
+    def _flush(self, pending):
+        for name, amount in pending.items():
+            if not amount:
+                continue
+            try:
+                if not self.shared.add(self._key(name), amount, None):
+                    self.shared.incr(self._key(name), amount)
+            except Exception as e:
+                logger.warning(f"Could not record {self.namespace} counters: {e}")
+
+    def totals(self):
+        """Shared totals plus this process's unflushed increments."""
+        with self._lock:
+            pending = dict(self._pending)
+        totals = {}
+        for name in self.names:
+            try:
+                shared = self.shared.get(self._key(name), 0)
+            except Exception:
+                shared = 0
+            totals[name] = shared + pending[name]
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._pending, self._events = dict.fromkeys(self.names, 0), 0
+        self.shared.delete_many([self._key(name) for name in self.names])
+
+
+class TwoLevelCache:
+    """
+    Process-local LRU backed by a shared cache alias.
+
+    Lookups try the LRU first, then the shared store (promoting hits into the LRU).
+    Keys must already encode everything that makes an entry stale, such as the
+    embedding model or the index generation, so rebuilt indexes never see old entries.
+    """
+
+    def __init__(self, namespace, max_local=1024, timeout=None, alias='default'):
+        self.namespace = namespace
+        self.local = LRUCache(max_local)
+        self.timeout = timeout
+        self.alias = alias
+        self.counters = SharedCounters(namespace, ('local_hits', 'shared_hits', 'misses'), alias)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _shared_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self.counters.incr('local_hits')
+            return value
+        try:
+            value = self.shared.get(self._shared_key(key), _MISSING)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed for {self.namespace}: {e}")
+            value = _MISSING
+        if value is not _MISSING:
+            self.local.set(key, value)
+            self.counters.incr('shared_hits')
+            return value
+        self.counters.incr('misses')
+        return default
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        try:
+            self.shared.set(self._shared_key(key), value, self.timeout)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed for {self.namespace}: {e}")
+
+    def stats(self):
+        """Hit/miss totals across workers and the hit rate."""
+        totals = self.counters.totals()
+        lookups = sum(totals.values())
+        hits = totals['local_hits'] + totals['shared_hits']
+        return {
+            'namespace': self.namespace,
+            **totals,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'local_entries': len(self.local),
+        }
+
+    def reset_stats(self):
+        self.counters.reset()
+
+
+query_embedding_cache = TwoLevelCache(
+    'query-embedding',
+    max_local=settings.RETRIEVAL_CACHE_LOCAL_SIZE,
+    timeout=settings.RETRIEVAL_CACHE_TIMEOUT,
+)
+retrieval_cache = TwoLevelCache(
+    'retrieval',
+    max_local=settings.RETRIEVAL_CACHE_LOCAL_SIZE,
+    timeout=settings.RETRIEVAL_CACHE_TIMEOUT,
+)
@@ -0,0 +1,208 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+When the same request is already in flight, a caller waits for that call's result
+instead of making its own: thirty students generating a quiz on the same topic at
+the same moment cost one model call. Only concurrent calls are coalesced; once a
+call has finished, the next identical request makes a new one, so this is not a
+response cache.
+
+  - Within a process, callers of the same key (threads, or async tasks on any event
+    loop) share one future.
+  - Across workers, the caller that adds the key's lock to the shared cache
+    (settings.CACHES) makes the call and publishes the result for `result_ttl` seconds;
+    callers in other workers poll for it. A lock whose owner dies expires after the
+    flight timeout, and a waiter that sees the lock go away without a result makes
+    its own call. How strict the lock is depends on the cache backend's add(); with
+    the database cache, two workers may occasionally both make the call.
+
+Errors are shared with callers waiting in the same process only; waiters in other
+workers fall back to their own call.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from .caching import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls by key, in this process and across workers sharing a cache."""
+
+    def __init__(self, namespace, poll_interval=0.1, result_ttl=10, alias='default'):
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.alias = alias
+        self.counters = SharedCounters(
+            namespace, ('requests', 'upstream_calls', 'coalesced_local', 'coalesced_shared'), alias,
+        )
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _lock_key(self, key):
+        return f"{self.namespace}:lock:{key}"
+
+    def _result_key(self, key, flight_id):
+        return f"{self.namespace}:result:{key}:{flight_id}"
+
+    def _join(self, key):
+        """The in-process flight for `key` and whether this caller leads it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Future()
+            # A running future cannot be cancelled by one waiter on behalf of the others
+            flight.set_running_or_notify_cancel()
+            return flight, True
+
+    def _land(self, key, flight, result=None, error=None):
+        """End the in-process flight, handing its result (or error) to the callers waiting on it."""
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def _land_task(self, key, flight, task):
+        error = asyncio.CancelledError() if task.cancelled() else task.exception()
+        self._land(key, flight, None if error else task.result(), error)
+
+    def do(self, key, call, timeout):
+        """
+        Result of `call()`, or of an identical call already in flight. `timeout` bounds
+        how long the call can take (retries included); it is the cross-worker lock's lifetime.
+        """
+        flight, leader = self._join(key)
+        self.counters.incr('requests')
+        if not leader:
+            self.counters.incr('coalesced_local')
+            return flight.result()
+
+        try:
+            result = self._lead(key, call, timeout)
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, result)
+        return result
+
+    def _lead(self, key, call, timeout):
+        flight_id = uuid.uuid4().hex
+        # add() is None when the cache is unavailable: call without coalescing across workers
+        if self._cache('add', self._lock_key(key), flight_id, timeout) is not False:
+            try:
+                result = call()
+                self.counters.incr('upstream_calls')
+                self._cache('set', self._result_key(key, flight_id), result, self.result_ttl)
+                return result
+            finally:
+                self._cache('delete', self._lock_key(key))
+
+        # Another worker is making this call; wait for it to publish the result
+        owner = None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            current = self._cache('get', self._lock_key(key))
+            owner = current or owner
+            result = self._cache('get', self._result_key(key, owner)) if owner else None
+            if result is not None:
+                self.counters.incr('coalesced_shared')
+                return result
+            if current is None:
+                break
+            time.sleep(self.poll_interval)
+        logger.info(f"{self.namespace}: the other worker's call ended without a result; calling directly")
+        self.counters.incr('upstream_calls')
+        return call()
+
+    async def ado(self, key, call, timeout):
+        """
+        Async do(): `call` is a coroutine function. The leading call runs as its own task,
+        so a leader whose request is cancelled (client disconnect) still completes it
+        for the callers waiting on it.
+        """
+        flight, leader = self._join(key)
+        await self._acount('requests')
+        if not leader:
+            await self._acount('coalesced_local')
+            return await asyncio.wrap_future(flight)
+
+        task = asyncio.ensure_future(self._alead(key, call, timeout))
+        task.add_done_callback(lambda done: self._land_task(key, flight, done))
+        return await asyncio.shield(task)
+
+    async def _alead(self, key, call, timeout):
+        flight_id = uuid.uuid4().hex
+        if await self._acache('add', self._lock_key(key), flight_id, timeout) is not False:
+            try:
+                result = await call()
+                await self._acount('upstream_calls')
+                await self._acache('set', self._result_key(key, flight_id), result, self.result_ttl)
+                return result
+            finally:
+                await self._acache('delete', self._lock_key(key))
+
+        owner = None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            current = await self._acache('get', self._lock_key(key))
+            owner = current or owner
+            result = await self._acache('get', self._result_key(key, owner)) if owner else None
+            if result is not None:
+                await self._acount('coalesced_shared')
+                return result
+            if current is None:
+                break
+            await asyncio.sleep(self.poll_interval)
+        logger.info(f"{self.namespace}: the other worker's call ended without a result; calling directly")
+        await self._acount('upstream_calls')
+        return await call()
+
+    def _cache(self, method, *args):
+        """Call a shared cache method; a cache failure means no cross-worker coalescing, not an error."""
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as e:
+            logger.warning(f"{self.namespace}: shared cache {method} failed: {e}")
+            return None
+
+    async def _acache(self, method, *args):
+        try:
+            return await getattr(self.shared, f"a{method}")(*args)
+        except Exception as e:
+            logger.warning(f"{self.namespace}: shared cache {method} failed: {e}")
+            return None
+
+    async def _acount(self, name):
+        # Counters flush to the shared cache, which may be the database
+        await sync_to_async(self.counters.incr)(name)
+
+    def stats(self):
+        """Request and upstream call totals across workers, and the share of requests coalesced."""
+        totals = self.counters.totals()
+        coalesced = totals['coalesced_local'] + totals['coalesced_shared']
+        return {
+            'namespace': self.namespace,
+            **totals,
+            'coalesced': coalesced,
+            'coalescing_ratio': coalesced / totals['requests'] if totals['requests'] else 0.0,
+            'in_flight': len(self._flights),
+        }
+
+    def reset_stats(self):
+        self.counters.reset()
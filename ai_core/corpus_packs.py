@@ -0,0 +1,212 @@
+"""
+Corpus packs: prebuilt, versioned bundles of embedded chunks that a deployment can
+load without extracting PDFs or calling an embedding API.
+
+A pack is a directory holding
+  manifest.json     name, version, embedding model, dimension, chunk count,
+                    partitions and the sha256 of every other file
+  chunks.jsonl.gz   one JSON object per chunk (text, metadata, source, partition)
+  embeddings.npy    float32 matrix, row i is the embedding of chunk line i
+The pack checksum is the sha256 of the sorted file checksums, so two packs with the
+same checksum hold identical data.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from django.db import transaction
+
+from .embeddings import active_embedding_model
+from .utils import embedding_from_bytes, embedding_to_bytes
+from .vector_index import PARTITION_FIELDS, bump_corpus_generation, model_chunks
+
+logger = logging.getLogger(__name__)
+
+PACK_FORMAT_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+CHUNKS_FILENAME = "chunks.jsonl.gz"
+EMBEDDINGS_FILENAME = "embeddings.npy"
+IMPORT_BATCH_SIZE = 1000
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pack_checksum(files):
+    """Checksum of a whole pack from its manifest's file entries."""
+    joined = "\n".join(f"{name}:{files[name]['sha256']}" for name in sorted(files))
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest()
+
+
+def export_pack(path, name, version, queryset=None):
+    """
+    Write the active model's chunks (or `queryset`, which must hold only that model's
+    chunks) to a pack directory and return its manifest. Rows are streamed, so memory
+    is bounded by one chunk rather than the corpus.
+    """
+    model = active_embedding_model()
+    queryset = model_chunks() if queryset is None else queryset
+    if queryset.exclude(embedding_model=model).exists():
+        raise ValueError(f"Corpus packs hold a single embedding model; the queryset mixes in models other than {model}")
+    count = queryset.count()
+    if count == 0:
+        raise ValueError("No chunks to export")
+
+    os.makedirs(path, exist_ok=True)
+    chunks_path = os.path.join(path, CHUNKS_FILENAME)
+    embeddings_path = os.path.join(path, EMBEDDINGS_FILENAME)
+    matrix = None
+    partitions = set()
+    rows = queryset.order_by(*PARTITION_FIELDS, 'id').values_list(
+        'document_type', 'class_level', 'subject', 'source', 'content_hash', 'chunk_text', 'metadata', 'embedding',
+    )
+    written = 0
+    with gzip.open(chunks_path, 'wt', encoding='utf-8') as f:
+        for document_type, class_level, subject, source, content_hash, text, metadata, embedding in rows.iterator(
+                chunk_size=2000):
+            vector = embedding_from_bytes(embedding)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(embeddings_path, mode='w+', dtype='<f4',
+                                                   shape=(count, vector.shape[0]))
+            if vector.shape[0] != matrix.shape[1]:
+                raise ValueError(f"Chunk embedding has dimension {vector.shape[0]}, expected {matrix.shape[1]}")
+            matrix[written] = vector
+            f.write(json.dumps({
+                'document_type': document_type,
+                'class_level': class_level,
+                'subject': subject,
+                'source': source,
+                'content_hash': content_hash,
+                'chunk_text': text,
+                'metadata': metadata,
+            }, ensure_ascii=False) + "\n")
+            partitions.add((document_type, class_level, subject))
+            written += 1
+    if written != count:
+        raise ValueError(f"Corpus changed during export ({written} chunks written, {count} expected)")
+    matrix.flush()
+    dim = matrix.shape[1]
+    del matrix
+
+    files = {
+        filename: {'sha256': file_sha256(os.path.join(path, filename)),
+                   'bytes': os.path.getsize(os.path.join(path, filename))}
+        for filename in (CHUNKS_FILENAME, EMBEDDINGS_FILENAME)
+    }
+    manifest = {
+        'format_version': PACK_FORMAT_VERSION,
+        'name': name,
+        'version': version,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'embedding_model': model,
+        'dim': dim,
+        'chunks': count,
+        'partitions': [dict(zip(PARTITION_FIELDS, key)) for key in sorted(partitions)],
+        'files': files,
+        'checksum': pack_checksum(files),
+    }
+    with open(os.path.join(path, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Exported corpus pack {name} {version} ({count} chunks) to {path}")
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{path} is not a corpus pack (no {MANIFEST_FILENAME})")
+    if manifest.get('format_version') != PACK_FORMAT_VERSION:
+        raise ValueError(f"Unsupported corpus pack format version: {manifest.get('format_version')}")
+    return manifest
+
+
+def verify_pack(path):
+    """Check every file against the manifest checksums; returns the manifest or raises ValueError."""
+    manifest = read_manifest(path)
+    for filename, expected in manifest['files'].items():
+        file_path = os.path.join(path, filename)
+        if not os.path.exists(file_path):
+            raise ValueError(f"Corpus pack file missing: {filename}")
+        if file_sha256(file_path) != expected['sha256']:
+            raise ValueError(f"Checksum mismatch for {filename}; the pack is corrupt or was modified")
+    if pack_checksum(manifest['files']) != manifest['checksum']:
+        raise ValueError("Pack checksum does not match its file checksums")
+    return manifest
+
+
+def import_pack(path, replace=True, force=False):
+    """
+    Load a verified pack into DocumentChunk with bulk inserts; no embeddings are computed.
+
+    With `replace`, stored chunks of every (document_type, source) in the pack, and in
+    the installed version of the same pack, are deleted first, so importing a newer
+    version of a pack swaps its content. The whole import runs in one transaction.
+    A pack whose checksum is already installed is skipped unless `force`. Returns a
+    dict with the manifest, counts and whether it was skipped.
+    """
+    from .models import CorpusPack, DocumentChunk
+
+    manifest = verify_pack(path)
+    model = active_embedding_model()
+    if manifest['embedding_model'] != model:
+        raise ValueError(
+            f"Pack was embedded with {manifest['embedding_model']} but the active embedding model is {model}"
+        )
+    installed = CorpusPack.objects.filter(name=manifest['name']).first()
+    if installed is not None and installed.checksum == manifest['checksum'] and not force:
+        return {'manifest': manifest, 'added': 0, 'removed': 0, 'skipped': True}
+
+    matrix = np.load(os.path.join(path, EMBEDDINGS_FILENAME), mmap_mode='r')
+    if matrix.shape != (manifest['chunks'], manifest['dim']):
+        raise ValueError(f"Embedding matrix has shape {matrix.shape}, manifest says "
+                         f"({manifest['chunks']}, {manifest['dim']})")
+
+    with gzip.open(os.path.join(path, CHUNKS_FILENAME), 'rt', encoding='utf-8') as f:
+        sources = {(row['document_type'], row['source']) for row in map(json.loads, f)}
+
+    added = removed = 0
+    with transaction.atomic():
+        if replace:
+            previous = {tuple(pair) for pair in installed.sources} if installed is not None else set()
+            for document_type, source in sources | previous:
+                removed += DocumentChunk.objects.filter(document_type=document_type, source=source).delete()[0]
+
+        batch = []
+        with gzip.open(os.path.join(path, CHUNKS_FILENAME), 'rt', encoding='utf-8') as f:
+            for position, line in enumerate(f):
+                batch.append(DocumentChunk(
+                    **json.loads(line),
+                    embedding=embedding_to_bytes(matrix[position]),
+                    embedding_model=model,
+                ))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    DocumentChunk.objects.bulk_create(batch)
+                    added += len(batch)
+                    batch = []
+        if batch:
+            DocumentChunk.objects.bulk_create(batch)
+            added += len(batch)
+        if added != manifest['chunks']:
+            raise ValueError(f"Pack lists {manifest['chunks']} chunks but holds {added}")
+        bump_corpus_generation(model)
+
+        CorpusPack.objects.update_or_create(name=manifest['name'], defaults={
+            'version': manifest['version'],
+            'checksum': manifest['checksum'],
+            'embedding_model': model,
+            'chunks': added,
+            'sources': sorted(sources),
+        })
+    logger.info(f"Imported corpus pack {manifest['name']} {manifest['version']}: {added} added, {removed} removed")
+    return {'manifest': manifest, 'added': added, 'removed': removed, 'skipped': False}
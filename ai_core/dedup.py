@@ -0,0 +1,180 @@
+"""
+Near-duplicate chunk detection with MinHash and locality-sensitive hashing.
+
+Repeated headers, footers, tables of contents and passages reprinted across
+editions produce chunks that are almost, but not exactly, identical, so content
+hashes miss them. Each chunk is reduced to a MinHash signature over its word
+shingles; signatures are bucketed by bands (LSH) so only chunks sharing a band are
+compared, and a pair counts as a duplicate when the estimated Jaccard similarity of
+their shingle sets reaches the threshold. Chunks are only compared within one partition
+(document type, class level, subject; see vector_index.partition_key), so a passage
+shared by two partitions is kept in both and filtered searches of either still find it.
+"""
+import logging
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from .vector_index import PARTITION_FIELDS, partition_key
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_WORDS = 5
+# Hash parameters are kept below 2**31 so a * x + b never overflows uint64 for 32-bit x
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """Set of 32-bit hashes of the lowercased word `size`-grams of the text."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {zlib.crc32(gram.encode('utf-8')) for gram in grams}
+
+
+class MinHasher:
+    """MinHash signatures of `num_perm` universal hash functions, all computed with numpy."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        values = np.fromiter(shingles(text), dtype=np.uint64)
+        hashed = (self.a[:, None] * values[None, :] + self.b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+def estimated_similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return float(np.count_nonzero(signature_a == signature_b)) / len(signature_a)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of chunk signatures, each tagged with the source it came from and
+    bucketed by partition, so only chunks of the same partition are compared.
+
+    `bands` * rows-per-band must equal `num_perm`; more bands find pairs further below
+    the threshold at the cost of more candidate comparisons. Entries of a source can
+    be discarded before that source is re-synced, so a revised passage is never
+    dropped as a duplicate of the outdated version it replaces.
+    """
+
+    def __init__(self, threshold=None, num_perm=None, bands=None):
+        self.threshold = settings.INGESTION_DEDUP_THRESHOLD if threshold is None else threshold
+        num_perm = num_perm or settings.MINHASH_PERMUTATIONS
+        self.bands = bands or settings.MINHASH_BANDS
+        if num_perm % self.bands:
+            raise ValueError(f"{num_perm} MinHash permutations cannot be split into {self.bands} bands")
+        self.rows = num_perm // self.bands
+        self.hasher = MinHasher(num_perm)
+        self.entries = {}
+        self.buckets = defaultdict(list)
+        self._next_key = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_corpus(cls, queryset=None, exclude_source=None, **kwargs):
+        """Index the stored chunks (all of them by default), skipping one source if given."""
+        from .models import DocumentChunk
+
+        index = cls(**kwargs)
+        queryset = DocumentChunk.objects.all() if queryset is None else queryset
+        if exclude_source is not None:
+            queryset = queryset.exclude(source=exclude_source)
+        rows = queryset.order_by('id').values_list('source', 'chunk_text', *PARTITION_FIELDS).iterator(chunk_size=2000)
+        for source, text, *partition in rows:
+            index.add(index.hasher.signature(text), source, partition=partition)
+        return index
+
+    def _band_keys(self, signature, partition):
+        partition = partition_key(partition or '')
+        return [
+            (partition, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def add(self, signature, source=None, key=None, partition=None):
+        """Index a signature in `partition`; returns its key (generated unless given)."""
+        if key is None:
+            key = self._next_key
+            self._next_key += 1
+        self.entries[key] = (signature, source)
+        for band_key in self._band_keys(signature, partition):
+            self.buckets[band_key].append(key)
+        return key
+
+    def find(self, signature, partition=None):
+        """
+        (key, similarity) of the most similar entry of `partition` at or above the
+        threshold, or None.
+        """
+        best = None
+        checked = set()
+        for band_key in self._band_keys(signature, partition):
+            for key in self.buckets.get(band_key, ()):
+                if key in checked or key not in self.entries:
+                    continue
+                checked.add(key)
+                similarity = estimated_similarity(signature, self.entries[key][0])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+        return best
+
+    def check(self, text, source=None, partition=None):
+        """
+        Return True if the text is a near-duplicate of an indexed chunk of the same
+        partition; otherwise index it under `source` and return False.
+        """
+        signature = self.hasher.signature(text)
+        if self.find(signature, partition) is not None:
+            return True
+        self.add(signature, source, partition=partition)
+        return False
+
+    def discard_source(self, source):
+        """Forget every entry of one source (bucket lists are cleaned up lazily)."""
+        for key in [key for key, (_, entry_source) in self.entries.items() if entry_source == source]:
+            del self.entries[key]
+
+
+def ingestion_dedup_index(exclude_source=None):
+    """Corpus index for ingestion, or None when settings.INGESTION_DEDUP is off."""
+    if not settings.INGESTION_DEDUP:
+        return None
+    return NearDuplicateIndex.from_corpus(exclude_source=exclude_source)
+
+
+def find_corpus_duplicates(queryset=None, threshold=None):
+    """
+    Scan stored chunks in id order and return {duplicate_id: original_id} for every chunk
+    that is a near-duplicate of an earlier one in the same partition; originals are the
+    first chunk of each group.
+    """
+    from .models import DocumentChunk
+
+    index = NearDuplicateIndex(threshold=threshold)
+    queryset = DocumentChunk.objects.all() if queryset is None else queryset
+    duplicates = {}
+    rows = queryset.order_by('id').values_list('id', 'chunk_text', *PARTITION_FIELDS).iterator(chunk_size=2000)
+    for chunk_id, text, *partition in rows:
+        signature = index.hasher.signature(text)
+        match = index.find(signature, partition)
+        if match is None:
+            index.add(signature, key=chunk_id, partition=partition)
+        else:
+            duplicates[chunk_id] = match[0]
+    logger.info(f"Found {len(duplicates)} near-duplicate chunks")
+    return duplicates
@@ -0,0 +1,132 @@
+"""
+Embedding backends. Every stored chunk records the model that embedded it, and
+indexes are only built from, and queried with, the active backend's model.
+"""
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+GEMINI_EMBEDDING_MODEL = "text-embedding-004"
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class EmbeddingBackend:
+    """
+    Turns texts into vectors. `model` identifies the vector space and is stored with
+    every chunk; `batch_size` and `max_workers` are the defaults get_embeddings uses.
+    """
+
+    model = None
+    batch_size = 100
+    max_workers = 1
+
+    def embed(self, texts):
+        """Embed one batch of texts; returns a list of vectors in input order."""
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        return self.embed([text])[0]
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """Google GenAI embed_content API; the client is created on first use."""
+
+    model = GEMINI_EMBEDDING_MODEL
+    batch_size = 100
+    max_workers = 4
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        return self._client
+
+    def embed(self, texts):
+        result = self.client.models.embed_content(model=self.model, contents=texts)
+        return [embedding.values for embedding in result.embeddings]
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    Local CPU embeddings with sentence-transformers (see requirements-ml.txt).
+
+    The model is loaded on first use, inputs are encoded in batches of `batch_size`,
+    and torch is limited to `threads` intra-op threads so ingestion does not starve
+    the web workers sharing the container. Embedding runs under a lock because one
+    model instance is shared by all threads.
+    """
+
+    max_workers = 1
+
+    def __init__(self, model_name, batch_size=32, threads=2, device='cpu'):
+        self.model = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._model is None:
+            try:
+                import torch
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImproperlyConfigured(
+                    "The local embedding backend needs sentence-transformers and torch: "
+                    "pip install -r requirements-ml.txt"
+                ) from e
+            torch.set_num_threads(self.threads)
+            logger.info(f"Loading embedding model {self.model} on {self.device} with {self.threads} threads")
+            self._model = SentenceTransformer(self.model, device=self.device)
+        return self._model
+
+    def embed(self, texts):
+        with self._lock:
+            model = self.load()
+            vectors = model.encode(
+                list(texts),
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return list(np.asarray(vectors, dtype=np.float32))
+
+
+def get_embedding_backend(name=None):
+    """Process-wide backend selected by name or settings.EMBEDDING_BACKEND ('gemini' or 'local')."""
+    name = name or settings.EMBEDDING_BACKEND
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+    with _backends_lock:
+        if name not in _backends:
+            if name == 'gemini':
+                _backends[name] = GeminiEmbeddingBackend()
+            elif name == 'local':
+                _backends[name] = SentenceTransformerBackend(
+                    settings.LOCAL_EMBEDDING_MODEL,
+                    batch_size=settings.LOCAL_EMBEDDING_BATCH_SIZE,
+                    threads=settings.LOCAL_EMBEDDING_THREADS,
+                    device=settings.LOCAL_EMBEDDING_DEVICE,
+                )
+            else:
+                raise ValueError(f"Unknown embedding backend: {name}")
+        return _backends[name]
+
+
+def active_embedding_model():
+    """Model id of the active backend; chunks and indexes are tagged with it."""
+    return get_embedding_backend().model
@@ -0,0 +1,405 @@
+"""
+Streaming PDF ingestion: pages are extracted one at a time, split into chunks,
+embedded in batches and inserted in batches, so memory stays bounded by the
+batch size rather than the size of the book.
+"""
+import hashlib
+import logging
+import re
+from itertools import islice
+from queue import Empty
+
+from django.conf import settings
+from PyPDF2 import PdfReader
+
+from .dedup import ingestion_dedup_index
+from .embeddings import get_embedding_backend
+from .utils import EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS, embedding_to_bytes, get_embeddings
+from .vector_index import bump_corpus_generation
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 300
+MAX_PARAGRAPH_CHARS = 10000
+INSERT_BATCH_SIZE = EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_WORKERS
+# Batches an extraction worker may have waiting in its queue before it blocks
+EXTRACTION_QUEUE_BATCHES = 2
+
+
+def chunk_hash(text):
+    """Content hash used to recognize chunks that are already stored."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items from an iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def iter_pdf_pages(pdf_path):
+    """Yield (page_number, text) for each page, extracting one page at a time."""
+    reader = PdfReader(pdf_path)
+    for page_number, page in enumerate(reader.pages, start=1):
+        yield page_number, page.extract_text() or ""
+
+
+def iter_fixed_chunks(pages, size=CHUNK_SIZE):
+    """
+    Split a stream of pages into fixed-size chunks as if the pages were one string,
+    yielding (chunk_text, metadata) with the first and last page each chunk spans.
+    """
+    buffer = ""
+    buffer_pages = []
+    for page_number, text in pages:
+        if not text:
+            continue
+        buffer += text
+        buffer_pages.append((len(buffer), page_number))
+        while len(buffer) >= size:
+            yield buffer[:size], _page_span(buffer_pages, size)
+            buffer = buffer[size:]
+            buffer_pages = [(end - size, page) for end, page in buffer_pages if end - size > 0]
+    if buffer:
+        yield buffer, _page_span(buffer_pages, len(buffer))
+
+
+def _page_span(buffer_pages, length):
+    """First and last page covering buffer[:length]; buffer_pages holds (end offset, page) pairs."""
+    pages = []
+    for end, page in buffer_pages:
+        pages.append(page)
+        if end >= length:
+            break
+    return {"page": pages[0], "page_end": pages[-1]}
+
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+NUMBERED_HEADING_RE = re.compile(r"^(chapter|unit|section|topic|part)\b|^\d+(\.\d+)*\.?\s+[A-Z]", re.IGNORECASE)
+
+
+def count_tokens(text):
+    """Approximate token count (words and punctuation marks); no tokenizer dependency needed."""
+    return len(TOKEN_RE.findall(text))
+
+
+def looks_like_heading(line):
+    """Short lines without closing punctuation that are upper-case or numbered are treated as headings."""
+    if len(line) > 80 or line[-1] in ".,;:!?" or count_tokens(line) > 12:
+        return False
+    letters = [c for c in line if c.isalpha()]
+    if not letters:
+        return False
+    return line.isupper() or bool(NUMBERED_HEADING_RE.match(line))
+
+
+class SentenceChunker:
+    """
+    Split a stream of pages into chunks that end on sentence boundaries.
+
+    Lines are grouped into paragraphs (blank lines and headings break paragraphs,
+    page breaks do not), paragraphs are split into sentences, and sentences are packed
+    into chunks of about `target_tokens`, with the last `overlap_tokens` worth of
+    sentences repeated at the start of the next chunk. Sentences longer than the target
+    are split on word boundaries. Each chunk records its page span, the heading it falls
+    under and its character offset in the whitespace-normalized document text.
+    """
+
+    def __init__(self, target_tokens=200, overlap_tokens=40):
+        if overlap_tokens >= target_tokens:
+            raise ValueError("overlap_tokens must be smaller than target_tokens")
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def __call__(self, pages):
+        window = []
+        window_tokens = 0
+        for sentence in self.iter_sentences(pages):
+            if window and window_tokens + sentence["tokens"] > self.target_tokens:
+                yield self._emit(window)
+                window = self._overlap(window)
+                window_tokens = sum(s["tokens"] for s in window)
+            window.append(sentence)
+            window_tokens += sentence["tokens"]
+        if window:
+            yield self._emit(window)
+
+    def _overlap(self, window):
+        kept, tokens = [], 0
+        for sentence in reversed(window[1:]):
+            if tokens + sentence["tokens"] > self.overlap_tokens:
+                break
+            kept.insert(0, sentence)
+            tokens += sentence["tokens"]
+        return kept
+
+    def _emit(self, window):
+        first, last = window[0], window[-1]
+        metadata = {
+            "page": first["page"],
+            "page_end": last["page"],
+            "heading": first["heading"],
+            "offset": first["offset"],
+            "chunker": "sentence",
+        }
+        return " ".join(s["text"] for s in window), metadata
+
+    def iter_sentences(self, pages):
+        """Yield sentence dicts (text, tokens, page, heading, offset) from (page_number, text) pairs."""
+        state = {"heading": None, "offset": 0}
+        paragraph = []
+        paragraph_chars = 0
+        for page_number, text in pages:
+            for line in (text or "").splitlines():
+                line = " ".join(line.split())
+                if not line:
+                    yield from self._paragraph_sentences(paragraph, state)
+                    paragraph = []
+                elif looks_like_heading(line):
+                    yield from self._paragraph_sentences(paragraph, state)
+                    paragraph = []
+                    state["heading"] = line
+                else:
+                    paragraph.append((line, page_number))
+                    paragraph_chars += len(line) + 1
+                    # PDF text often has no blank lines, so long runs are cut at a sentence end to bound memory.
+                    if paragraph_chars >= MAX_PARAGRAPH_CHARS or (
+                            paragraph_chars >= MAX_PARAGRAPH_CHARS // 10 and line[-1] in ".!?"):
+                        yield from self._paragraph_sentences(paragraph, state)
+                        paragraph = []
+                if not paragraph:
+                    paragraph_chars = 0
+        yield from self._paragraph_sentences(paragraph, state)
+
+    def _paragraph_sentences(self, paragraph, state):
+        if not paragraph:
+            return
+        text, line_starts, position = "", [], 0
+        for line, page_number in paragraph:
+            line_starts.append((position, page_number))
+            text += line + " "
+            position = len(text)
+        text = text.rstrip()
+
+        start = 0
+        boundaries = [m.end() for m in SENTENCE_BOUNDARY_RE.finditer(text)] + [len(text)]
+        for end in boundaries:
+            sentence = text[start:end].strip()
+            if sentence:
+                page = next(p for pos, p in reversed(line_starts) if pos <= start)
+                for piece in self._split_long(sentence):
+                    yield {
+                        "text": piece,
+                        "tokens": count_tokens(piece),
+                        "page": page,
+                        "heading": state["heading"],
+                        "offset": state["offset"] + start,
+                    }
+            start = end
+        state["offset"] += len(text) + 1
+
+    def _split_long(self, sentence):
+        if count_tokens(sentence) <= self.target_tokens:
+            return [sentence]
+        pieces, current, tokens = [], [], 0
+        for word in sentence.split():
+            word_tokens = count_tokens(word)
+            if current and tokens + word_tokens > self.target_tokens:
+                pieces.append(" ".join(current))
+                current, tokens = [], 0
+            current.append(word)
+            tokens += word_tokens
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+
+def get_chunker(name=None):
+    """Chunker selected by name or settings.INGESTION_CHUNKER ('fixed' or 'sentence')."""
+    name = name or settings.INGESTION_CHUNKER
+    if name == 'sentence':
+        return SentenceChunker(settings.CHUNK_TARGET_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+    if name == 'fixed':
+        return iter_fixed_chunks
+    raise ValueError(f"Unknown chunker: {name}")
+
+
+def iter_pdf_chunks(pdf_path, chunker=None):
+    """Yield (chunk_text, metadata) for a PDF without holding the whole text in memory."""
+    chunker = chunker or get_chunker()
+    for chunk, metadata in chunker(iter_pdf_pages(pdf_path)):
+        yield chunk, {"source": pdf_path, **metadata}
+
+
+def _insert_chunks(batch, document_type, source, progress=None, class_level='', subject=''):
+    """Embed a batch of (content_hash, chunk_text, metadata) with the active backend and bulk-insert it."""
+    from .models import DocumentChunk
+
+    backend = get_embedding_backend()
+    embeddings = get_embeddings([chunk for _, chunk, _ in batch], progress=progress, backend=backend)
+    DocumentChunk.objects.bulk_create([
+        DocumentChunk(
+            document_type=document_type,
+            chunk_text=chunk,
+            embedding=embedding_to_bytes(embedding),
+            embedding_model=backend.model,
+            metadata=metadata,
+            source=source,
+            content_hash=content_hash,
+            class_level=class_level,
+            subject=subject,
+        )
+        for (content_hash, chunk, metadata), embedding in zip(batch, embeddings)
+    ])
+    bump_corpus_generation(backend.model)
+
+
+def process_pdf_in_batches(pdf_path, document_type, batch_size=INSERT_BATCH_SIZE, progress=None,
+                           class_level='', subject='', dedup=None):
+    """
+    Ingest every chunk of a PDF: extract pages → chunk → drop near-duplicates → embed in
+    batches → insert in batches. `dedup` is a NearDuplicateIndex of the corpus; by default
+    one is built when settings.INGESTION_DEDUP is on. Returns counts of added and duplicate chunks.
+    """
+    if dedup is None:
+        dedup = ingestion_dedup_index()
+    counts = {"added": 0, "duplicates": 0}
+    partition = (document_type, class_level, subject)
+
+    def unique_chunks():
+        for chunk, metadata in iter_pdf_chunks(pdf_path):
+            if dedup is not None and dedup.check(chunk, pdf_path, partition):
+                counts["duplicates"] += 1
+                continue
+            yield chunk_hash(chunk), chunk, metadata
+
+    for batch in batched(unique_chunks(), batch_size):
+        _insert_chunks(batch, document_type, pdf_path, progress=progress, class_level=class_level, subject=subject)
+        counts["added"] += len(batch)
+    return counts
+
+
+def extract_pdf_chunks(pdf_path, queue, chunker_name=None, batch_size=INSERT_BATCH_SIZE):
+    """
+    Extract and chunk a PDF, putting lists of up to `batch_size` (chunk_text, metadata) on
+    `queue` as they are produced and None when done. Module-level so it can run in a
+    process pool, where the CPU-bound PyPDF2 work does not contend for the main process's
+    GIL. With a bounded queue (see EXTRACTION_QUEUE_BATCHES) a worker that gets ahead of
+    the database writes waits instead of holding the whole PDF in memory.
+    """
+    try:
+        for batch in batched(iter_pdf_chunks(pdf_path, get_chunker(chunker_name)), batch_size):
+            queue.put(batch)
+    finally:
+        queue.put(None)
+
+
+def _next_batch(queue, future):
+    """Next batch an extract_pdf_chunks worker put on `queue`, or None once it has finished or died."""
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            if future.done() and queue.empty():
+                return None
+
+
+def iter_extracted_chunks(queue, future):
+    """
+    Yield the chunks an extract_pdf_chunks worker (running as `future`) puts on `queue`,
+    batch by batch, then re-raise the worker's error if it failed. Closing the generator
+    early drains the queue, so the worker is not left blocked on it.
+    """
+    try:
+        while (batch := _next_batch(queue, future)) is not None:
+            yield from batch
+    finally:
+        while _next_batch(queue, future) is not None:
+            pass
+    future.result()
+
+
+def sync_chunks(chunks, document_type, source, batch_size=INSERT_BATCH_SIZE, progress=None,
+                class_level='', subject='', dedup=None):
+    """
+    Incrementally sync the (chunk_text, metadata) stream of one source with the database.
+
+    Known content hashes for (document_type, source) are fetched in one query, only
+    chunks with new hashes are embedded and bulk-inserted, and stored chunks whose
+    text no longer appears in the source (or duplicate rows of the same text) are deleted.
+    Chunks embedded by a model other than the active backend's count as unknown: they
+    are re-embedded and the old rows removed, so one source never mixes models.
+    Stored chunks are moved to the given class level and subject if those changed.
+    New chunks that are near-duplicates of other chunks in the same partition, or of
+    earlier chunks of this source, are skipped (see ai_core.dedup); `dedup` may be a shared
+    NearDuplicateIndex, otherwise one is built when settings.INGESTION_DEDUP is on.
+    Only chunk hashes are kept in memory. Returns counts of added, removed, unchanged,
+    relabelled and duplicate chunks.
+    """
+    from .models import DocumentChunk
+
+    known = {}
+    stale_ids = []
+    stored = DocumentChunk.objects.filter(document_type=document_type, source=source)
+    relabelled = stored.exclude(class_level=class_level, subject=subject).update(
+        class_level=class_level, subject=subject
+    )
+    model = get_embedding_backend().model
+    if relabelled:
+        bump_corpus_generation(*stored.values_list('embedding_model', flat=True).distinct())
+    for content_hash, chunk_id, embedding_model in stored.order_by('id').values_list(
+            'content_hash', 'id', 'embedding_model'):
+        if content_hash in known or embedding_model != model:
+            stale_ids.append(chunk_id)
+        else:
+            known[content_hash] = chunk_id
+
+    if dedup is None:
+        dedup = ingestion_dedup_index(exclude_source=source)
+    else:
+        dedup.discard_source(source)
+
+    seen = set()
+    added = 0
+    duplicates = 0
+    partition = (document_type, class_level, subject)
+
+    def new_chunks():
+        nonlocal duplicates
+        for chunk, metadata in chunks:
+            content_hash = chunk_hash(chunk)
+            if content_hash in seen:
+                continue
+            seen.add(content_hash)
+            if content_hash in known:
+                if dedup is not None:
+                    dedup.add(dedup.hasher.signature(chunk), source, partition=partition)
+            elif dedup is not None and dedup.check(chunk, source, partition):
+                duplicates += 1
+            else:
+                yield content_hash, chunk, metadata
+
+    for batch in batched(new_chunks(), batch_size):
+        _insert_chunks(batch, document_type, source, progress=progress, class_level=class_level, subject=subject)
+        added += len(batch)
+
+    stale_ids.extend(chunk_id for content_hash, chunk_id in known.items() if content_hash not in seen)
+    for batch in batched(stale_ids, 500):
+        DocumentChunk.objects.filter(id__in=batch).delete()
+
+    return {
+        "added": added,
+        "removed": len(stale_ids),
+        "unchanged": len(seen) - added - duplicates,
+        "relabelled": relabelled,
+        "duplicates": duplicates,
+    }
+
+
+def update_pdf_data(pdf_path, document_type, batch_size=INSERT_BATCH_SIZE, progress=None,
+                    class_level='', subject='', dedup=None):
+    """Incrementally sync the chunks of one PDF with the database, streaming it page by page."""
+    return sync_chunks(iter_pdf_chunks(pdf_path), document_type, pdf_path, batch_size=batch_size, progress=progress,
+                       class_level=class_level, subject=subject, dedup=dedup)
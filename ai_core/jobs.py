@@ -0,0 +1,248 @@
+"""
+Database-backed background jobs for long AI generations.
+
+Views enqueue a Job and return at once; `manage.py run_jobs` workers claim due jobs and
+run their handlers. There is no broker: a job is claimed with a conditional UPDATE, so
+any number of workers can share the table and no attempt runs twice.
+
+  - A claimed job is hidden from other workers for its visibility timeout
+    (settings.JOB_VISIBILITY_TIMEOUT). If its worker dies or hangs, the job is taken
+    back when the timeout passes and counts as a failed attempt.
+  - A failed attempt is retried after an exponential backoff until the job has used
+    max_attempts (settings.JOB_MAX_ATTEMPTS). Then, or at once for a
+    PermanentJobError, the job is dead-lettered: status 'dead' with its last error,
+    until requeue() runs it again.
+
+Handlers are registered with @handler(kind) in ai_core/tasks.py. They receive the Job
+and return a JSON-serializable result; async handlers run on their own event loop.
+"""
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+from importlib import import_module
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = (JobStatus.QUEUED, JobStatus.RUNNING)
+FAILED_MESSAGE = "The job failed. Please try again."
+
+_handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for a failure that retrying cannot fix; the job is dead-lettered at once."""
+
+
+def handler(kind, visibility_timeout=None):
+    """Register a function as the handler of jobs of `kind`."""
+    def register(func):
+        _handlers[kind] = (func, visibility_timeout or settings.JOB_VISIBILITY_TIMEOUT)
+        return func
+    return register
+
+
+def get_handler(kind):
+    """(handler, visibility timeout) for `kind`, or None if no handler is registered."""
+    # Importing the tasks registers their handlers; not done at module load, as they import the views
+    import_module('ai_core.tasks')
+    return _handlers.get(kind)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def enqueue(kind, payload=None, user=None, key='', max_attempts=None):
+    """
+    Queue a job of `kind` and return it. With a `key`, an unfinished job of the same
+    kind and key is returned instead, so a double submit does not run the work twice;
+    the ai_core_job_unfinished_key constraint keeps two concurrent submits from both
+    inserting one.
+    """
+    fields = {
+        'kind': kind,
+        'key': key,
+        'user': user,
+        'payload': payload or {},
+        'max_attempts': max_attempts or settings.JOB_MAX_ATTEMPTS,
+    }
+    if not key:
+        return Job.objects.create(**fields)
+    unfinished = Job.objects.filter(kind=kind, key=key, status__in=UNFINISHED)
+    existing = unfinished.first()
+    if existing is None:
+        try:
+            with transaction.atomic():
+                return Job.objects.create(**fields)
+        except IntegrityError:
+            # Another submit queued the same job between the check and the insert
+            existing = unfinished.first()
+            if existing is None:
+                raise
+    return existing
+
+
+async def aenqueue(kind, payload=None, user=None, key='', max_attempts=None):
+    return await sync_to_async(enqueue)(kind, payload, user=user, key=key, max_attempts=max_attempts)
+
+
+def status_url(job):
+    return reverse('ai_core:job_status', args=[job.id])
+
+
+def retry_delay(attempts):
+    """Seconds before retrying a job that has failed `attempts` times."""
+    return min(settings.JOB_RETRY_BACKOFF_MAX, settings.JOB_RETRY_BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def claim(worker, limit=1, kinds=None):
+    """
+    Claim up to `limit` due jobs for `worker` and return them, oldest first. Each claim
+    is an UPDATE conditional on the job still being queued, so concurrent workers never
+    claim the same job.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=JobStatus.QUEUED, run_after__lte=now)
+    if kinds:
+        due = due.filter(kind__in=kinds)
+    claimed = []
+    for job_id, kind in due.order_by('run_after', 'id').values_list('id', 'kind')[:limit * 2]:
+        registered = get_handler(kind)
+        visibility_timeout = registered[1] if registered else settings.JOB_VISIBILITY_TIMEOUT
+        updated = Job.objects.filter(id=job_id, status=JobStatus.QUEUED).update(
+            status=JobStatus.RUNNING,
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+            started_at=now,
+        )
+        if updated:
+            claimed.append(Job.objects.get(id=job_id))
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def release_expired():
+    """
+    Take back running jobs whose visibility timeout has passed: requeue them, or
+    dead-letter those out of attempts. Returns (requeued, dead_lettered).
+    """
+    now = timezone.now()
+    expired = Job.objects.filter(status=JobStatus.RUNNING, locked_until__lt=now)
+    error = "Visibility timeout expired before the job finished (worker died or hung)"
+    dead = expired.filter(attempts__gte=F('max_attempts')).update(
+        status=JobStatus.DEAD, locked_by='', locked_until=None, finished_at=now, last_error=error,
+    )
+    requeued = expired.filter(attempts__lt=F('max_attempts')).update(
+        status=JobStatus.QUEUED, locked_by='', locked_until=None, run_after=now, last_error=error,
+    )
+    if requeued or dead:
+        logger.warning(f"Visibility timeout expired for {requeued + dead} jobs: {requeued} requeued, {dead} dead")
+    return requeued, dead
+
+
+def _finish(job, worker, **fields):
+    """Record the outcome of `job`'s attempt, unless the claim was lost to a visibility timeout."""
+    updated = Job.objects.filter(
+        id=job.id, status=JobStatus.RUNNING, locked_by=worker, attempts=job.attempts,
+    ).update(locked_by='', locked_until=None, **fields)
+    if not updated:
+        logger.warning(f"Job {job.id} finished after its claim expired; the result was discarded")
+    return bool(updated)
+
+
+def run_job(job, worker):
+    """Run one claimed attempt of `job` and record its result, retry or dead-lettering."""
+    registered = get_handler(job.kind)
+    started = timezone.now()
+    try:
+        if registered is None:
+            raise PermanentJobError(f"No handler registered for {job.kind}")
+        func = registered[0]
+        result = async_to_sync(func)(job) if iscoroutinefunction(func) else func(job)
+    except Exception as e:
+        error = "".join(traceback.format_exception(e))
+        now = timezone.now()
+        if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+            logger.error(f"Job {job.id} ({job.kind}) dead-lettered after {job.attempts} attempts: {e}")
+            _finish(job, worker, status=JobStatus.DEAD, finished_at=now, last_error=error)
+        else:
+            delay = retry_delay(job.attempts)
+            logger.warning(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}; retrying in {delay:.0f}s")
+            _finish(job, worker, status=JobStatus.QUEUED, run_after=now + timedelta(seconds=delay),
+                    last_error=error)
+        return False
+    logger.info(f"Job {job.id} ({job.kind}) succeeded in {(timezone.now() - started).total_seconds():.1f}s")
+    return _finish(job, worker, status=JobStatus.SUCCEEDED, result=result, finished_at=timezone.now(),
+                   last_error='')
+
+
+def requeue(queryset):
+    """
+    Run dead-lettered jobs again with a fresh set of attempts; returns how many were requeued.
+    A keyed job stays dead while another job of the same kind and key is unfinished (the
+    ai_core_job_unfinished_key constraint), so only the newest of several dead ones is requeued.
+    """
+    requeued = 0
+    for pk in queryset.filter(status=JobStatus.DEAD).order_by('-created_at').values_list('pk', flat=True):
+        try:
+            with transaction.atomic():
+                requeued += Job.objects.filter(pk=pk, status=JobStatus.DEAD).update(
+                    status=JobStatus.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None,
+                )
+        except IntegrityError:
+            continue
+    return requeued
+
+
+def purge_finished(days=None):
+    """Delete succeeded jobs that finished more than `days` (settings.JOB_RETENTION_DAYS) ago."""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS if days is None else days)
+    return Job.objects.filter(status=JobStatus.SUCCEEDED, finished_at__lt=cutoff).delete()[0]
+
+
+def stats():
+    """Job counts by status and kind, and the age of the oldest due job."""
+    counts = {status: 0 for status in JobStatus.values}
+    by_kind = {}
+    for row in Job.objects.values('kind', 'status').annotate(count=Count('id')):
+        counts[row['status']] += row['count']
+        by_kind.setdefault(row['kind'], {})[row['status']] = row['count']
+    oldest = (Job.objects.filter(status=JobStatus.QUEUED, run_after__lte=timezone.now())
+              .order_by('run_after').values_list('run_after', flat=True).first())
+    return {
+        'counts': counts,
+        'kinds': by_kind,
+        'oldest_due_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+    }
+
+
+def describe(job):
+    """The public state of a job, as returned by the status endpoint."""
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == JobStatus.SUCCEEDED:
+        data['result'] = job.result
+    elif job.status == JobStatus.DEAD:
+        data['error'] = FAILED_MESSAGE
+    return data
@@ -0,0 +1,175 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from .vector_index import (PARTITION_FIELDS, corpus_state, model_chunks, partition_key, select_partitions,
+                           top_k_positions)
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_lock = threading.Lock()
+_stale = True
+
+WORD_RE = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how in is it its of on or that the "
+    "their this to was were what when where which who why will with".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords."""
+    return [token for token in WORD_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over chunk_text.
+
+    Postings are stored per term as numpy arrays of document positions and term
+    frequencies, so scoring a query is a few vectorized scatter-adds into one score array.
+    Exact names, dates and treaty titles score highly here even when embeddings blur them.
+    Each document carries a partition code (see vector_index.partition_key). Documents
+    are grouped by partition, so `bounds[code]:bounds[code + 1]` are the positions of
+    partition `code` and a filtered search only scores the postings inside those ranges.
+    """
+
+    def __init__(self, ids, doc_lengths, postings, k1=1.5, b=0.75, state=None, partition_codes=None, partitions=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.postings = postings
+        self.partition_codes = (
+            np.asarray(partition_codes, dtype=np.int32) if partition_codes is not None
+            else np.zeros(len(self.ids), dtype=np.int32)
+        )
+        self.partitions = list(partitions) if partitions else [partition_key('')]
+        self.bounds = np.searchsorted(self.partition_codes, np.arange(len(self.partitions) + 1))
+        self.k1 = k1
+        self.b = b
+        self.state = state
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        self.length_norms = k1 * (1 - b + b * self.doc_lengths / (self.avg_length or 1.0))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows, state=None):
+        """Build from (id, text) or (id, text, partition) rows, which must arrive grouped by partition."""
+        ids, doc_lengths, partition_codes = [], [], []
+        partitions = {}
+        term_docs, term_freqs = {}, {}
+        for position, (chunk_id, text, *partition) in enumerate(rows):
+            counts = Counter(tokenize(text))
+            ids.append(chunk_id)
+            key = partition_key(partition[0] if partition else '')
+            if key not in partitions:
+                partitions[key] = len(partitions)
+            elif partitions[key] != len(partitions) - 1:
+                raise ValueError(f"Rows for partition {key} are not contiguous")
+            partition_codes.append(partitions[key])
+            doc_lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                term_docs.setdefault(term, []).append(position)
+                term_freqs.setdefault(term, []).append(freq)
+        postings = {
+            term: (np.array(docs, dtype=np.int32), np.array(term_freqs[term], dtype=np.float32))
+            for term, docs in term_docs.items()
+        }
+        return cls(ids, doc_lengths, postings, state=state, partition_codes=partition_codes, partitions=partitions)
+
+    @classmethod
+    def from_queryset(cls, queryset, state=None):
+        rows = (
+            queryset.order_by(*PARTITION_FIELDS, 'id')
+            .values_list('id', 'chunk_text', *PARTITION_FIELDS)
+            .iterator(chunk_size=2000)
+        )
+        return cls.from_rows(((chunk_id, text, key) for chunk_id, text, *key in rows), state=state)
+
+    def idf(self, term):
+        df = len(self.postings[term][0])
+        return math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=5, filters=None):
+        """
+        Return (ids, scores, coverage) of the top_k chunks by BM25, best first, where
+        coverage is the fraction of distinct query terms each returned chunk contains.
+        With filters only the documents of the matching partitions are scored.
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self.postings]
+        n_query_terms = len(set(tokenize(query)))
+        codes = select_partitions(self.partitions, filters)
+        if not terms or len(self) == 0 or top_k <= 0 or codes == []:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        # Score into one array over the selected position ranges, laid end to end
+        ranges = [(0, len(self))] if codes is None else [
+            (int(self.bounds[code]), int(self.bounds[code + 1])) for code in codes
+        ]
+        starts = np.cumsum([0] + [end - start for start, end in ranges])
+        scores = np.zeros(starts[-1], dtype=np.float32)
+        matched = np.zeros(starts[-1], dtype=np.int32)
+        for term in terms:
+            docs, freqs = self.postings[term]
+            idf = self.idf(term)
+            for (start, end), offset in zip(ranges, starts):
+                first, last = np.searchsorted(docs, (start, end))
+                range_docs, range_freqs = docs[first:last], freqs[first:last]
+                slots = range_docs - start + offset
+                scores[slots] += idf * range_freqs * (self.k1 + 1) / (range_freqs + self.length_norms[range_docs])
+                matched[slots] += 1
+
+        candidates = np.flatnonzero(scores)
+        top = candidates[top_k_positions(scores[candidates], top_k)]
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])[top]
+        return self.ids[positions], scores[top], matched[top] / n_query_terms
+
+    def is_confident(self, scores, coverage, ratio):
+        """
+        A lexical answer is trusted on its own when the best chunk contains every
+        query term and outscores the runner-up by at least `ratio`.
+        """
+        if len(scores) == 0 or coverage[0] < 1.0:
+            return False
+        return len(scores) == 1 or scores[0] >= ratio * scores[1]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)); returns ids best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def invalidate_lexical_index():
+    """Mark the in-process BM25 index as stale; it is rebuilt on the next search."""
+    global _stale
+    _stale = True
+
+
+def get_lexical_index():
+    """
+    Return the process-wide BM25 index over the chunks embedded by the active embedding
+    model (the same rows as the vector index), rebuilding it when they changed.
+    """
+    global _index, _stale
+
+    state = corpus_state()
+    if _index is not None and not _stale and _index.state == state:
+        return _index
+
+    with _index_lock:
+        if _index is not None and not _stale and _index.state == state:
+            return _index
+        _stale = False
+        _index = BM25Index.from_queryset(model_chunks(), state=state)
+        logger.info(f"Built BM25 index with {len(_index)} chunks and {len(_index.postings)} terms")
+        return _index
@@ -0,0 +1,311 @@
+"""
+Gateway for every chat-completion call to Groq.
+
+Each process holds one Groq client on one keep-alive httpx connection pool, created
+on first use (and again after a fork), so all features reuse warm connections.
+Calls get a per-feature timeout from settings.LLM_FEATURE_TIMEOUTS and are retried
+with jittered exponential backoff on rate limits (429), server errors (5xx),
+timeouts and connection failures; other errors are raised immediately. stream()
+yields a completion piece by piece for views that send it to the browser as it arrives.
+
+acomplete(), acomplete_json() and astream() are the same calls for async views: they
+use an AsyncGroq client, so under ASGI a waiting call holds no thread and one process
+can have hundreds of completions in flight. The ASGI server's event loop keeps one
+client for the life of the process; short-lived loops get one per call (see async_client).
+
+complete() and acomplete() coalesce identical concurrent requests (same prompt up to
+whitespace, model and parameters) into one upstream call whose content they all get,
+within the process and across workers (see ai_core/coalescing.py). Turn this off with
+settings.LLM_COALESCE; `manage.py llm_coalescing_stats` reports how many were coalesced.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import groq
+import httpx
+from django.conf import settings
+
+from .caching import make_key
+from .coalescing import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+VISION_MODEL = "llama-3.2-11b-vision-preview"
+
+single_flight = SingleFlight(
+    'llm-flight',
+    poll_interval=settings.LLM_COALESCE_POLL_INTERVAL,
+    result_ttl=settings.LLM_COALESCE_RESULT_TTL,
+)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """The process-wide Groq client; the SDK's own retries are off because complete() retries."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=settings.LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.LLM_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+                )
+                _client = groq.Groq(api_key=settings.GROQ_API_KEY, http_client=http_client, max_retries=0)
+                _client_pid = os.getpid()
+    return _client
+
+
+def new_async_client():
+    """A new AsyncGroq client with its own connection pool; like get_client(), without SDK retries."""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_ASYNC_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+    )
+    return groq.AsyncGroq(api_key=settings.GROQ_API_KEY, http_client=http_client, max_retries=0)
+
+
+def get_async_client():
+    """
+    The AsyncGroq client cached for the running event loop. An async connection pool
+    belongs to the loop that opened it, so each loop gets its own client, which is never
+    closed: only use this on a loop that lives as long as the process (see async_client).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = new_async_client()
+    return client
+
+
+@contextlib.asynccontextmanager
+async def async_client():
+    """
+    The AsyncGroq client for the calls made in the block. The ASGI server runs its event
+    loop on the main thread for the life of the process, and that loop keeps one cached
+    client with warm connections. Any other loop lives for a single call (async_to_sync
+    starts one for each async job handler, and for each async view under WSGI), so it gets
+    a new client that is closed when the block ends rather than a pool left open per loop.
+    """
+    if threading.current_thread() is threading.main_thread():
+        yield get_async_client()
+        return
+    client = new_async_client()
+    try:
+        yield client
+    finally:
+        await client.close()
+
+
+def feature_timeout(feature):
+    """Read timeout (seconds) for a feature's calls; connecting is capped by LLM_CONNECT_TIMEOUT."""
+    seconds = settings.LLM_FEATURE_TIMEOUTS.get(feature, settings.LLM_TIMEOUT)
+    return httpx.Timeout(seconds, connect=settings.LLM_CONNECT_TIMEOUT)
+
+
+def is_retryable(error):
+    if isinstance(error, (groq.RateLimitError, groq.APIConnectionError)):
+        return True
+    return isinstance(error, groq.APIStatusError) and error.status_code >= 500
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential delay, or the server's Retry-After when it sends one."""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+def _options(prompt, feature, model, temperature, max_tokens, **extra):
+    """Keyword arguments for chat.completions.create."""
+    messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+    options = {"model": model or settings.LLM_MODEL, "messages": messages, "temperature": temperature, **extra}
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    options["timeout"] = feature_timeout(feature)
+    return options
+
+
+def request_key(prompt, model, temperature, max_tokens):
+    """Coalescing key of a completion: its messages with whitespace normalized, model and parameters."""
+    messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+    normalized = [
+        {**message, "content": " ".join(message["content"].split())}
+        if isinstance(message.get("content"), str) else message
+        for message in messages
+    ]
+    return make_key(model or settings.LLM_MODEL, json.dumps(normalized, sort_keys=True), temperature, max_tokens)
+
+
+def flight_timeout(feature):
+    """Longest a feature's call can take with every retry; a coalesced call's lock lives this long."""
+    seconds = settings.LLM_FEATURE_TIMEOUTS.get(feature, settings.LLM_TIMEOUT)
+    retries = settings.LLM_MAX_RETRIES
+    return int(seconds * (retries + 1) + settings.LLM_BACKOFF_MAX * retries) + 1
+
+
+def _retry_delay(feature, error, attempt):
+    """Seconds to wait before retrying a failed call, or None if `error` should be raised."""
+    if not is_retryable(error) or attempt == settings.LLM_MAX_RETRIES:
+        return None
+    delay = backoff_delay(attempt, error)
+    logger.warning(f"LLM call for {feature} failed ({error.__class__.__name__}); retrying in {delay:.2f}s")
+    return delay
+
+
+def _request(prompt, feature, model, temperature, max_tokens, **extra):
+    """Send one chat completion request, retrying transient failures with jittered backoff."""
+    options = _options(prompt, feature, model, temperature, max_tokens, **extra)
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        try:
+            return get_client().chat.completions.create(**options)
+        except groq.GroqError as e:
+            delay = _retry_delay(feature, e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+async def _arequest(client, prompt, feature, model, temperature, max_tokens, **extra):
+    """_request on an async client; backoff waits without blocking the event loop."""
+    options = _options(prompt, feature, model, temperature, max_tokens, **extra)
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        try:
+            return await client.chat.completions.create(**options)
+        except groq.GroqError as e:
+            delay = _retry_delay(feature, e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+
+def complete(prompt, feature='default', model=None, temperature=0.7, max_tokens=None):
+    """
+    Content of one chat completion. `prompt` is a user message string or a list of
+    message dicts. Transient failures are retried up to settings.LLM_MAX_RETRIES
+    times; the last error is raised if every attempt fails.
+    """
+    def call():
+        return _request(prompt, feature, model, temperature, max_tokens).choices[0].message.content
+
+    start = time.perf_counter()
+    if settings.LLM_COALESCE:
+        content = single_flight.do(request_key(prompt, model, temperature, max_tokens), call, flight_timeout(feature))
+    else:
+        content = call()
+    logger.debug(f"LLM call for {feature} took {time.perf_counter() - start:.2f}s")
+    return content
+
+
+def stream(prompt, feature='default', model=None, temperature=0.7, max_tokens=None):
+    """
+    Yield the content of a chat completion piece by piece as it arrives. Opening the
+    stream is retried like complete(); an error after the first piece is raised, since
+    the caller has already used the partial output.
+    """
+    chunks = _request(prompt, feature, model, temperature, max_tokens, stream=True)
+    try:
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        chunks.close()
+
+
+async def acomplete(prompt, feature='default', model=None, temperature=0.7, max_tokens=None):
+    """Async complete()."""
+    async def call():
+        async with async_client() as client:
+            response = await _arequest(client, prompt, feature, model, temperature, max_tokens)
+        return response.choices[0].message.content
+
+    start = time.perf_counter()
+    if settings.LLM_COALESCE:
+        content = await single_flight.ado(
+            request_key(prompt, model, temperature, max_tokens), call, flight_timeout(feature)
+        )
+    else:
+        content = await call()
+    logger.debug(f"LLM call for {feature} took {time.perf_counter() - start:.2f}s")
+    return content
+
+
+async def astream(prompt, feature='default', model=None, temperature=0.7, max_tokens=None):
+    """Async stream(): an async generator of the completion's pieces."""
+    async with async_client() as client:
+        chunks = await _arequest(client, prompt, feature, model, temperature, max_tokens, stream=True)
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await chunks.close()
+
+
+def strip_code_fences(text):
+    """Remove a surrounding markdown code fence (```json ... ```) from model output."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.endswith("```"):
+            text = text[:-3]
+        text = text.strip()
+    return text
+
+
+def complete_json(prompt, feature='default', expect=list, attempts=2, **options):
+    """
+    Parsed JSON output of a completion, asking again (up to `attempts` times) when the
+    reply is not valid JSON or not a non-empty `expect`. Returns None if no attempt
+    succeeds; API errors are raised as in complete().
+    """
+    for attempt in range(attempts):
+        data = _parse_json(complete(prompt, feature=feature, **options), feature, expect, attempt)
+        if data is not None:
+            return data
+    return None
+
+
+async def acomplete_json(prompt, feature='default', expect=list, attempts=2, **options):
+    """Async complete_json()."""
+    for attempt in range(attempts):
+        data = _parse_json(await acomplete(prompt, feature=feature, **options), feature, expect, attempt)
+        if data is not None:
+            return data
+    return None
+
+
+def _parse_json(content, feature, expect, attempt):
+    """The reply parsed as a non-empty `expect`, or None (logged) if it is not one."""
+    try:
+        data = json.loads(strip_code_fences(content or ""))
+    except json.JSONDecodeError as e:
+        logger.warning(f"{feature} attempt {attempt + 1} returned invalid JSON: {e}")
+        return None
+    if isinstance(data, expect) and data:
+        return data
+    logger.warning(f"{feature} attempt {attempt + 1} returned an empty or unexpected {type(data).__name__}")
+    return None
@@ -0,0 +1,296 @@
+"""
+Concurrency load test for the LLM-bound views.
+
+A fake Groq endpoint answers every chat completion after a fixed delay, standing in
+for the model, so the test measures how many users waiting on a generation one web
+worker can serve. The app is started as one gunicorn sync worker (WSGI, the previous
+deployment) and as one uvicorn worker (ASGI), each pointed at the fake endpoint
+through GROQ_BASE_URL, and driven with increasing numbers of concurrent users.
+
+Every user posts the same generation, so completion coalescing (settings.LLM_COALESCE)
+would answer a whole level with one model call. It is off in the servers under test
+unless asked for; each level records the model calls it made.
+"""
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from django.utils.crypto import get_random_string
+
+from .benchmarks import percentiles
+
+logger = logging.getLogger(__name__)
+
+LOADTEST_EMAIL = "loadtest@smartpikin.local"
+# Marks a page that rendered the fake model's reply, so a failed generation is an error
+REPLY_MARKER = "Load test question"
+FAKE_REPLY = json.dumps([
+    {"question": f"{REPLY_MARKER} {number}", "options": ["A", "B", "C", "D"], "correct": 0,
+     "explanation": "Load test", "front": f"{REPLY_MARKER} {number}", "back": "Load test"}
+    for number in range(1, 6)
+])
+
+ENDPOINTS = {
+    'quiz': ('/ai_core/quiz/', {'topic': 'Photosynthesis', 'subject': 'Biology', 'level': 'SSS 1',
+                                'num_questions': '5'}),
+    'flashcards': ('/ai_core/flashcards/', {'topic': 'Photosynthesis', 'level': 'SSS 1', 'num_cards': '5'}),
+}
+SERVERS = {
+    'wsgi': ('eduBridge.wsgi:application', 'sync'),
+    'asgi': ('eduBridge.asgi:application', 'uvicorn_worker.UvicornWorker'),
+}
+DEFAULT_LEVELS = (1, 2, 5, 10, 25, 50, 100, 200, 400)
+
+
+class FakeCompletionServer:
+    """Chat completion endpoint on a background thread that replies after `latency` seconds."""
+
+    def __init__(self, latency=1.0, content=FAKE_REPLY):
+        self.latency = latency
+        self.body = json.dumps({
+            "id": "loadtest",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "loadtest",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.requests = 0
+        self.port = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, '127.0.0.1', 0, backlog=4096)
+            )
+            self.port = server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            server.close()
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait(10)
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(self.body) + self.body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def create_loadtest_user():
+    """A passwordless student account for the run; remove it with delete_loadtest_user()."""
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    # A run that was killed may have left its user behind
+    delete_loadtest_user()
+    return User.objects.create_user(LOADTEST_EMAIL, None, first_name='Load', last_name='Test', role='student')
+
+
+def delete_loadtest_user():
+    """Delete the load-test user and, by cascade, its profile and the content the run generated."""
+    from django.contrib.auth import get_user_model
+
+    get_user_model().objects.filter(email=LOADTEST_EMAIL).delete()
+
+
+def login_cookies(user):
+    """Session and CSRF cookies of `user`, plus the matching CSRF header."""
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    csrf_token = get_random_string(32)
+    cookies = {
+        settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value,
+        settings.CSRF_COOKIE_NAME: csrf_token,
+    }
+    return cookies, {'X-CSRFToken': csrf_token}
+
+
+class AppServer:
+    """The app under one gunicorn worker of the given kind ('wsgi' or 'asgi'), as a subprocess."""
+
+    def __init__(self, kind, llm_url, coalesce=False, startup_timeout=60):
+        self.kind = kind
+        self.llm_url = llm_url
+        self.coalesce = coalesce
+        self.startup_timeout = startup_timeout
+        self.port = free_port()
+        self.process = None
+        self.log = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        application, worker_class = SERVERS[self.kind]
+        if self.kind == 'asgi' and importlib.util.find_spec('uvicorn_worker') is None:
+            raise RuntimeError("uvicorn-worker is not installed (pip install -r requirements.txt)")
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', application, '--worker-class', worker_class, '--workers', '1',
+             '--bind', f'127.0.0.1:{self.port}', '--backlog', '4096', '--timeout', '300'],
+            env={**os.environ, 'GROQ_BASE_URL': self.llm_url, 'LLM_MAX_RETRIES': '0',
+                 'LLM_COALESCE': str(self.coalesce)},
+            stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                httpx.get(self.url + '/', timeout=1)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.25)
+        output = self.output()
+        self.__exit__()
+        raise RuntimeError(f"The {self.kind} server did not start:\n{output[-2000:]}")
+
+    def output(self):
+        self.log.seek(0)
+        return self.log.read().decode(errors='replace')
+
+    def __exit__(self, *exc):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+async def run_level(base_url, path, data, cookies, headers, users, requests_per_user, timeout):
+    """`users` concurrent clients each posting `requests_per_user` generations one after another."""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, headers=headers, timeout=timeout,
+                                 limits=limits) as client:
+        async def user():
+            nonlocal errors
+            for _ in range(requests_per_user):
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, data=data)
+                    ok = response.status_code == 200 and REPLY_MARKER in response.text
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(users)))
+        seconds = time.perf_counter() - started
+    return {
+        "users": users,
+        "requests": users * requests_per_user,
+        "errors": errors,
+        "seconds": round(seconds, 2),
+        "throughput_rps": round(len(latencies) / seconds, 2),
+        "latency_ms": percentiles(latencies) if latencies else None,
+    }
+
+
+def within_slo(level, latency, slo_factor):
+    """No failed requests and p95 latency at most `slo_factor` times the model's latency."""
+    return level["errors"] == 0 and level["latency_ms"]["p95"] <= latency * 1000 * slo_factor
+
+
+def run_load_test(servers=('wsgi', 'asgi'), levels=DEFAULT_LEVELS, latency=1.0, requests_per_user=3,
+                  timeout=30.0, slo_factor=2.0, endpoint='quiz', coalesce=False, progress=None):
+    """
+    Drive each server kind with increasing concurrent users until it misses the SLO.
+    With `coalesce`, the servers share identical concurrent completions.
+
+    Returns one entry per server with its measured levels and `max_users`, the largest
+    number of concurrent users one worker served within the SLO (0 if none), or an
+    `error` if the server could not be started.
+    """
+    path, data = ENDPOINTS[endpoint]
+    fake_llm = FakeCompletionServer(latency).start()
+    results = []
+    try:
+        cookies, headers = login_cookies(create_loadtest_user())
+        for kind in servers:
+            result = {"server": kind, "levels": [], "max_users": 0}
+            try:
+                with AppServer(kind, fake_llm.url, coalesce) as server:
+                    for users in sorted(levels):
+                        if progress:
+                            progress(f"{kind}: {users} concurrent users...")
+                        calls = fake_llm.requests
+                        level = asyncio.run(run_level(server.url, path, data, cookies, headers, users,
+                                                      requests_per_user, timeout))
+                        level["llm_calls"] = fake_llm.requests - calls
+                        level["within_slo"] = within_slo(level, latency, slo_factor)
+                        result["levels"].append(level)
+                        if not level["within_slo"]:
+                            break
+                        result["max_users"] = users
+            except RuntimeError as e:
+                logger.error(f"Load test of {kind} failed: {e}")
+                result["error"] = str(e)
+            results.append(result)
+    finally:
+        fake_llm.stop()
+        delete_loadtest_user()
+    return results
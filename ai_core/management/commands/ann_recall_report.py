@@ -0,0 +1,82 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ai_core.ann import IVFIndex, recall_at_k
+from ai_core.vector_index import get_vector_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Report recall@k and latency of the IVF index against exact search for a range of probe counts, "
+        "using corpus vectors as queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=5, help="Number of results per query.")
+        parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries.")
+        parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                            help="Probe counts to evaluate.")
+        parser.add_argument("--nlist", type=int, default=None,
+                            help="Build a throwaway IVF index with this many lists instead of the persisted one.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        index = get_vector_index()
+        if len(index) == 0:
+            self.stdout.write(self.style.ERROR("The vector index is empty."))
+            return
+
+        ivf = index.ann
+        if ivf is None or options["nlist"]:
+            ivf = IVFIndex.build(index, nlist=options["nlist"])
+
+        rng = np.random.default_rng(options["seed"])
+        rows = rng.choice(len(index), min(options["queries"], len(index)), replace=False)
+        # Jitter the sampled rows so queries are near, but not identical to, corpus vectors.
+        queries = np.asarray(index.matrix[rows], dtype=np.float32)
+        queries += rng.normal(scale=0.05 / np.sqrt(index.dim), size=queries.shape).astype(np.float32)
+        k = options["k"]
+
+        start = time.perf_counter()
+        exact = [index.search(q, top_k=k, exact=True)[0] for q in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        results = {
+            "corpus_size": len(index),
+            "nlist": ivf.nlist,
+            "k": k,
+            "queries": len(queries),
+            "exact_ms_per_query": round(exact_ms, 3),
+            "runs": [],
+        }
+        for nprobe in options["nprobe"]:
+            start = time.perf_counter()
+            approx = [ivf.search(index, q, top_k=k, nprobe=nprobe)[0] for q in queries]
+            elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            scanned = np.mean([len(ivf.candidate_rows(q / np.linalg.norm(q), nprobe)) for q in queries])
+            results["runs"].append({
+                "nprobe": nprobe,
+                "recall_at_k": round(float(np.mean([recall_at_k(a, e) for a, e in zip(approx, exact)])), 4),
+                "ms_per_query": round(elapsed_ms, 3),
+                "speedup": round(exact_ms / elapsed_ms, 2) if elapsed_ms else None,
+                "fraction_scanned": round(float(scanned) / len(index), 4),
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"Corpus: {len(index)} chunks, {ivf.nlist} lists, k={k}, {len(queries)} queries. "
+            f"Exact search: {exact_ms:.3f} ms/query"
+        )
+        self.stdout.write(f"{'nprobe':>7} {'recall@k':>9} {'ms/query':>9} {'speedup':>8} {'scanned':>8}")
+        for run in results["runs"]:
+            self.stdout.write(
+                f"{run['nprobe']:>7} {run['recall_at_k']:>9.4f} {run['ms_per_query']:>9.3f} "
+                f"{run['speedup'] or 0:>7.2f}x {run['fraction_scanned']:>7.1%}"
+            )
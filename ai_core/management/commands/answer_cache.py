@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ai_core.answer_cache import answer_cache
+
+
+class Command(BaseCommand):
+    help = "Show the semantic answer cache's hit rate and latency saved, or purge it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--purge", action="store_true", help="Delete cached answers.")
+        parser.add_argument("--scope", type=str, default=None,
+                            help="Only purge answers of this scope, e.g. 'class_level=SSS;subject=History' "
+                                 "('' for unscoped answers).")
+        parser.add_argument("--reset-stats", action="store_true", help="Reset the hit/miss counters.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable stats.")
+
+    def handle(self, *args, **options):
+        if options["purge"]:
+            deleted = answer_cache.purge(options["scope"])
+            self.stdout.write(self.style.SUCCESS(f"Purged {deleted} cached answers."))
+
+        stats = answer_cache.stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.stdout.write(
+                f"{stats['entries']} cached answers; hit rate {stats['hit_rate']:.1%} "
+                f"({stats['hits']} hits, {stats['misses']} misses); "
+                f"{stats['latency_saved_seconds']}s of latency saved"
+            )
+
+        if options["reset_stats"]:
+            answer_cache.counters.reset()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,123 @@
+import json
+import os
+import platform
+from datetime import datetime, timezone
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ai_core.benchmarks import ENGINES, benchmark_stored, benchmark_synthetic, compare_to_baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark retrieval on synthetic corpora (and optionally the stored one): ingestion and index "
+        "build time, single- and batch-query latency percentiles, memory, and recall@k of every engine "
+        "against brute-force search."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                            help="Synthetic corpus sizes in chunks (up to 1000000).")
+        parser.add_argument("--dim", type=int, default=768, help="Embedding dimension of synthetic corpora.")
+        parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+        parser.add_argument("--k", type=int, default=5, help="Number of results per query.")
+        parser.add_argument("--queries", type=int, default=200, help="Queries per corpus.")
+        parser.add_argument("--batch-size", type=int, default=16, help="Queries per batch in batch timings.")
+        parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: scaled to corpus size).")
+        parser.add_argument("--subspaces", type=int, default=None,
+                            help="PQ sub-vectors per embedding (default: the largest divisor of the "
+                                 "dimension up to settings.VECTOR_PQ_SUBSPACES).")
+        parser.add_argument("--stored", action="store_true", help="Also benchmark the stored corpus's vector index.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--workdir", type=str, default=None,
+                            help="Directory for temporary index files (default: system temp dir).")
+        parser.add_argument("--output", type=str, default=None, help="Write the JSON results to this file.")
+        parser.add_argument("--baseline", type=str, default=None,
+                            help="Previous JSON results; latency and recall regressions are reported.")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Relative p95 slowdown against the baseline reported as a regression.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        engine_options = {
+            "engines": options["engines"],
+            "k": options["k"],
+            "batch_size": options["batch_size"],
+            "nlist": options["nlist"],
+            "subspaces": options["subspaces"],
+        }
+        results = {
+            "taken_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+            },
+            "k": options["k"],
+            "queries": options["queries"],
+            "corpora": [],
+        }
+        for size in sorted(options["sizes"]):
+            if not options["json"]:
+                self.stdout.write(f"Benchmarking synthetic corpus of {size} chunks...")
+            results["corpora"].append(benchmark_synthetic(
+                size, dim=options["dim"], queries=options["queries"], seed=options["seed"],
+                workdir=options["workdir"], **engine_options,
+            ))
+        if options["stored"]:
+            try:
+                results["corpora"].append(benchmark_stored(queries=options["queries"], seed=options["seed"],
+                                                           **engine_options))
+            except ValueError as e:
+                self.stderr.write(self.style.ERROR(f"Stored corpus: {e}"))
+
+        regressions = []
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = compare_to_baseline(results, json.load(f), tolerance=options["tolerance"])
+            results["regressions"] = regressions
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for corpus in results["corpora"]:
+            line = f"\n{corpus['corpus']} corpus: {corpus['size']} chunks x {corpus['dim']} dims"
+            if "ingest_seconds" in corpus:
+                line += (f", ingest {corpus['ingest_seconds']:.2f}s ({corpus['ingest_chunks_per_second']:.0f}/s), "
+                         f"load {corpus['load_seconds'] * 1000:.1f}ms")
+            self.stdout.write(line)
+            self.stdout.write(
+                f"{'engine':>6} {'search':>8} {'build s':>8} {'MiB':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                f"{'p99 ms':>8} {'batch/q':>8} {'recall':>7}"
+            )
+            for engine in corpus["engines"]:
+                if "error" in engine:
+                    self.stdout.write(f"{engine['engine']:>6} {engine['error']}")
+                    continue
+                size = (engine['structure_bytes'] or corpus['matrix_bytes']) / 2**20
+                for label, run in (("all", engine), ("filtered", engine.get("filtered"))):
+                    if run is None:
+                        continue
+                    self.stdout.write(
+                        f"{engine['engine']:>6} {label:>8} {engine['build_seconds']:>8.2f} {size:>8.1f} "
+                        f"{run['single_ms']['p50']:>8.3f} {run['single_ms']['p95']:>8.3f} "
+                        f"{run['single_ms']['p99']:>8.3f} {run['batch_ms_per_query']:>8.3f} "
+                        f"{run['recall_at_k']:>7.3f}"
+                    )
+        peak = max((e["peak_rss_bytes"] for c in results["corpora"] for e in c["engines"] if "error" not in e),
+                   default=0)
+        self.stdout.write(f"\nPeak RSS: {peak / 2**20:.0f} MiB")
+
+        for regression in regressions:
+            self.stdout.write(self.style.WARNING(
+                f"Regression {' / '.join(map(str, regression['key']))} {regression['metric']}: "
+                f"{regression['before']} -> {regression['after']}"
+            ))
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,36 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ai_core.ann import build_ivf_index
+
+
+class Command(BaseCommand):
+    help = "Build the IVF approximate nearest-neighbour index over the current vector index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--nlist", type=int, default=None,
+                            help="Number of inverted lists (default: about 4 * sqrt(N)).")
+        parser.add_argument("--iterations", type=int, default=20, help="k-means iterations.")
+        parser.add_argument("--sample", type=int, default=20000,
+                            help="Maximum number of rows used to train the centroids.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            ivf = build_ivf_index(
+                nlist=options["nlist"],
+                n_iter=options["iterations"],
+                sample_size=options["sample"],
+            )
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        sizes = np.diff(ivf.offsets)
+        self.stdout.write(self.style.SUCCESS(
+            f"Built IVF index for generation {ivf.index_generation}: {ivf.nlist} lists "
+            f"(min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()} rows) "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_core.quantization import QUANTIZERS, build_quantized_index
+
+
+class Command(BaseCommand):
+    help = "Build the int8 or product-quantized index over the current vector index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--method", choices=sorted(QUANTIZERS), default=None,
+                            help="Quantization method (default: settings.VECTOR_SEARCH_ENGINE).")
+        parser.add_argument("--subspaces", type=int, default=None,
+                            help="PQ sub-vectors per embedding (default: the largest divisor of the "
+                                 "dimension up to settings.VECTOR_PQ_SUBSPACES).")
+        parser.add_argument("--iterations", type=int, default=15, help="PQ k-means iterations.")
+        parser.add_argument("--sample", type=int, default=10000,
+                            help="Maximum number of rows used to train the PQ codebooks.")
+
+    def handle(self, *args, **options):
+        method = options["method"] or settings.VECTOR_SEARCH_ENGINE
+        start = time.perf_counter()
+        try:
+            quantized = build_quantized_index(
+                method,
+                subspaces=options["subspaces"],
+                n_iter=options["iterations"],
+                sample_size=options["sample"],
+            )
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {quantized.method} index for generation {quantized.index_generation}: "
+            f"{len(quantized)} rows, {quantized.nbytes / 2**20:.1f} MiB in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_core.vector_index import build_engine_index, engine_path, export_vector_index
+
+
+class Command(BaseCommand):
+    help = "Export DocumentChunk embeddings to the memory-mapped vector index file shared by all workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=settings.VECTOR_INDEX_PATH,
+            help="Path of the index file (defaults to settings.VECTOR_INDEX_PATH).",
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        self.stdout.write(f"Exporting vector index to {output}...")
+        header = export_vector_index(output, build_engine=False)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote generation {header['generation']}: {header['count']} chunks, "
+            f"{header['dim']} dimensions, {len(header['partitions'])} partitions."
+        ))
+
+        structure_path = engine_path(output)
+        if structure_path and header["count"]:
+            structure = build_engine_index(output)
+            if structure is None:
+                self.stdout.write(self.style.WARNING(
+                    f"Could not rebuild the {settings.VECTOR_SEARCH_ENGINE} index; searches use the exact scan."
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Rebuilt the {settings.VECTOR_SEARCH_ENGINE} index for generation "
+                    f"{structure.index_generation} at {structure_path}."
+                ))
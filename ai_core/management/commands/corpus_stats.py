@@ -0,0 +1,95 @@
+import json
+import os
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count
+from django.db.models.functions import Length
+
+from ai_core.models import DocumentChunk
+from ai_core.vector_index import PARTITION_FIELDS, get_vector_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-partition corpus statistics (document type, class level, subject): chunks and sources "
+        "in the database, chunks in the loaded vector index, and growth since the last recorded snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--history",
+            type=str,
+            default=os.path.join(os.path.dirname(settings.VECTOR_INDEX_PATH), "corpus_stats.jsonl"),
+            help="JSON-lines file of past snapshots used for growth deltas.",
+        )
+        parser.add_argument("--record", action="store_true", help="Append this snapshot to the history file.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        rows = (
+            DocumentChunk.objects.values(*PARTITION_FIELDS)
+            .annotate(chunks=Count('id'), sources=Count('source', distinct=True), mean_chars=Avg(Length('chunk_text')))
+            .order_by(*PARTITION_FIELDS)
+        )
+        indexed = {
+            tuple(stat[field] for field in PARTITION_FIELDS): stat['chunks']
+            for stat in get_vector_index().partition_stats()
+        }
+        previous = self.load_previous(options["history"])
+
+        partitions = []
+        for row in rows:
+            key = tuple(row[field] for field in PARTITION_FIELDS)
+            name = " / ".join(part or "-" for part in key)
+            partitions.append({
+                **{field: row[field] for field in PARTITION_FIELDS},
+                "chunks": row["chunks"],
+                "sources": row["sources"],
+                "mean_chars": round(row["mean_chars"] or 0, 1),
+                "indexed": indexed.get(key, 0),
+                "growth": row["chunks"] - previous["partitions"].get(name, 0) if previous else None,
+                "name": name,
+            })
+        snapshot = {
+            "taken_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "total_chunks": sum(p["chunks"] for p in partitions),
+            "partitions": partitions,
+        }
+
+        if options["record"]:
+            self.record(options["history"], snapshot)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(snapshot, indent=2))
+            return
+
+        since = f" (growth since {previous['taken_at']})" if previous else ""
+        self.stdout.write(f"{snapshot['total_chunks']} chunks in {len(partitions)} partitions{since}")
+        self.stdout.write(f"{'partition':<48} {'chunks':>8} {'sources':>8} {'chars':>7} {'indexed':>8} {'growth':>7}")
+        for p in partitions:
+            growth = f"{p['growth']:+d}" if p["growth"] is not None else "-"
+            self.stdout.write(
+                f"{p['name'][:48]:<48} {p['chunks']:>8} {p['sources']:>8} {p['mean_chars']:>7.0f} "
+                f"{p['indexed']:>8} {growth:>7}"
+            )
+        if options["record"]:
+            self.stdout.write(self.style.SUCCESS(f"Recorded snapshot in {options['history']}"))
+
+    def load_previous(self, path):
+        """Last recorded snapshot as {taken_at, partitions: {name: chunks}}, or None."""
+        try:
+            with open(path) as f:
+                lines = [line for line in f if line.strip()]
+        except FileNotFoundError:
+            return None
+        if not lines:
+            return None
+        last = json.loads(lines[-1])
+        return {"taken_at": last["taken_at"], "partitions": {p["name"]: p["chunks"] for p in last["partitions"]}}
+
+    def record(self, path, snapshot):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps(snapshot) + "\n")
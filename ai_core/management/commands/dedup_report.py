@@ -0,0 +1,85 @@
+import json
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from ai_core.dedup import find_corpus_duplicates
+from ai_core.models import DocumentChunk
+from ai_core.vector_index import export_vector_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Report near-duplicate chunks in the stored corpus (MinHash over word shingles): how many chunks "
+        "and characters they account for per document type, with examples. --delete removes them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=float, default=None,
+                            help="Estimated Jaccard similarity counted as a duplicate "
+                                 "(default: settings.INGESTION_DEDUP_THRESHOLD).")
+        parser.add_argument("--examples", type=int, default=5, help="Duplicate pairs to print.")
+        parser.add_argument("--delete", action="store_true",
+                            help="Delete the duplicates, keeping the earliest chunk of each group, "
+                                 "and re-export the vector index.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        duplicates = find_corpus_duplicates(threshold=options["threshold"])
+        chunks = DocumentChunk.objects.values_list('id', 'document_type', 'chunk_text')
+        total_chunks = total_chars = duplicate_chars = 0
+        per_type, per_type_duplicates, texts = Counter(), Counter(), {}
+        for chunk_id, document_type, text in chunks.iterator(chunk_size=2000):
+            total_chunks += 1
+            total_chars += len(text)
+            per_type[document_type] += 1
+            if chunk_id in duplicates:
+                duplicate_chars += len(text)
+                per_type_duplicates[document_type] += 1
+            if len(texts) < options["examples"] * 2 and (chunk_id in duplicates or chunk_id in duplicates.values()):
+                texts[chunk_id] = text
+
+        report = {
+            "chunks": total_chunks,
+            "duplicates": len(duplicates),
+            "duplicate_ratio": len(duplicates) / total_chunks if total_chunks else 0.0,
+            "chars": total_chars,
+            "duplicate_chars": duplicate_chars,
+            "duplicate_char_ratio": duplicate_chars / total_chars if total_chars else 0.0,
+            "document_types": [
+                {"document_type": document_type, "chunks": count, "duplicates": per_type_duplicates[document_type]}
+                for document_type, count in sorted(per_type.items())
+            ],
+            "examples": [
+                {"duplicate_id": duplicate_id, "original_id": original_id,
+                 "duplicate": texts[duplicate_id][:200], "original": texts[original_id][:200]}
+                for duplicate_id, original_id in duplicates.items()
+                if duplicate_id in texts and original_id in texts
+            ][:options["examples"]],
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(
+                f"{report['duplicates']} of {report['chunks']} chunks are near-duplicates "
+                f"({report['duplicate_ratio']:.1%} of chunks, {report['duplicate_char_ratio']:.1%} of text)"
+            )
+            self.stdout.write(f"{'document type':>28} {'chunks':>8} {'duplicates':>11} {'share':>7}")
+            for row in report["document_types"]:
+                share = row["duplicates"] / row["chunks"] if row["chunks"] else 0.0
+                self.stdout.write(
+                    f"{row['document_type'][:28]:>28} {row['chunks']:>8} {row['duplicates']:>11} {share:>7.1%}"
+                )
+            for example in report["examples"]:
+                self.stdout.write(f"\n#{example['duplicate_id']} duplicates #{example['original_id']}:")
+                self.stdout.write(f"  {example['duplicate']!r}")
+                self.stdout.write(f"  {example['original']!r}")
+
+        if options["delete"] and duplicates:
+            ids = list(duplicates)
+            for start in range(0, len(ids), 500):
+                DocumentChunk.objects.filter(id__in=ids[start:start + 500]).delete()
+            self.stdout.write("Exporting vector index...")
+            export_vector_index()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {len(ids)} near-duplicate chunks."))
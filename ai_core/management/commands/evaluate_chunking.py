@@ -0,0 +1,89 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+
+from ai_core.ingestion import SentenceChunker, count_tokens, get_chunker, iter_pdf_chunks, iter_pdf_pages
+from ai_core.utils import get_embeddings
+from ai_core.vector_index import VectorIndex
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare chunkers on retrieval hit-rate and context tokens per answer. "
+        "Queries come from a JSON file of {\"query\": ..., \"answer\": ...} objects; without one, "
+        "sentences sampled from the PDFs are used as queries and a hit means the whole sentence "
+        "was retrieved intact."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pdf", action="append", required=True, help="PDF to evaluate on; may be repeated.")
+        parser.add_argument("--queries", type=str, help="JSON file with a list of {query, answer} objects.")
+        parser.add_argument("--sample", type=int, default=50, help="Number of sampled queries when --queries is not given.")
+        parser.add_argument("--top-k", type=int, default=5)
+        parser.add_argument("--chunkers", nargs="+", default=["fixed", "sentence"])
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        queries = self.load_queries(options)
+        if not queries:
+            self.stdout.write(self.style.ERROR("No queries to evaluate."))
+            return
+        query_embeddings = get_embeddings([q["query"] for q in queries])
+        top_k = options["top_k"]
+
+        results = []
+        for name in options["chunkers"]:
+            chunker = get_chunker(name)
+            texts = [chunk for pdf in options["pdf"] for chunk, _ in iter_pdf_chunks(pdf, chunker)]
+            index = VectorIndex.from_embeddings(range(len(texts)), get_embeddings(texts))
+
+            hits, context_tokens = 0, 0
+            for query, embedding in zip(queries, query_embeddings):
+                ids, _ = index.search(embedding, top_k=top_k)
+                context = " ".join(texts[i] for i in ids)
+                context_tokens += count_tokens(context)
+                if _normalize(query["answer"]) in _normalize(context):
+                    hits += 1
+
+            results.append({
+                "chunker": name,
+                "chunks": len(texts),
+                "mean_chunk_tokens": round(sum(map(count_tokens, texts)) / max(len(texts), 1), 1),
+                "hit_rate": round(hits / len(queries), 4),
+                "mean_context_tokens": round(context_tokens / len(queries), 1),
+                "context_tokens_per_hit": round(context_tokens / hits, 1) if hits else None,
+            })
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"queries": len(queries), "top_k": top_k, "results": results}, indent=2))
+            return
+
+        self.stdout.write(f"{len(queries)} queries, top_k={top_k}")
+        self.stdout.write(f"{'chunker':>10} {'chunks':>7} {'tok/chunk':>10} {'hit-rate':>9} {'ctx tok':>8} {'tok/hit':>8}")
+        for r in results:
+            per_hit = f"{r['context_tokens_per_hit']:.1f}" if r["context_tokens_per_hit"] else "-"
+            self.stdout.write(
+                f"{r['chunker']:>10} {r['chunks']:>7} {r['mean_chunk_tokens']:>10.1f} {r['hit_rate']:>9.1%} "
+                f"{r['mean_context_tokens']:>8.1f} {per_hit:>8}"
+            )
+
+    def load_queries(self, options):
+        if options["queries"]:
+            with open(options["queries"]) as f:
+                return json.load(f)
+
+        sentences = [
+            sentence["text"]
+            for pdf in options["pdf"]
+            for sentence in SentenceChunker().iter_sentences(iter_pdf_pages(pdf))
+            if 8 <= sentence["tokens"] <= 40
+        ]
+        rng = random.Random(options["seed"])
+        sample = rng.sample(sentences, min(options["sample"], len(sentences)))
+        return [{"query": sentence, "answer": sentence} for sentence in sample]
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from ai_core.corpus_packs import export_pack
+from ai_core.vector_index import model_chunks
+
+
+class Command(BaseCommand):
+    help = (
+        "Export stored chunks, their metadata and embeddings to a versioned corpus pack directory "
+        "that other deployments can load with import_corpus_pack."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", type=str, help="Directory to write the pack to.")
+        parser.add_argument("--name", type=str, required=True, help="Pack name, e.g. 'sl-waec-history'.")
+        parser.add_argument("--pack-version", type=str, required=True,
+                            help="Pack version, e.g. '2025.1'.")
+        parser.add_argument("--document-type", action="append", default=None,
+                            help="Only export this document type; may be repeated.")
+        parser.add_argument("--class-level", type=str, default=None, help="Only export this class level.")
+        parser.add_argument("--subject", type=str, default=None, help="Only export this subject.")
+
+    def handle(self, *args, **options):
+        chunks = model_chunks()
+        if options["document_type"]:
+            chunks = chunks.filter(document_type__in=options["document_type"])
+        if options["class_level"] is not None:
+            chunks = chunks.filter(class_level=options["class_level"])
+        if options["subject"] is not None:
+            chunks = chunks.filter(subject=options["subject"])
+
+        try:
+            manifest = export_pack(options["output"], options["name"], options["pack_version"], queryset=chunks)
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        self.stdout.write(
+            f"{manifest['chunks']} chunks in {len(manifest['partitions'])} partitions, "
+            f"model {manifest['embedding_model']} ({manifest['dim']} dims)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {manifest['name']} {manifest['version']} to {options['output']} "
+            f"(checksum {manifest['checksum'][:12]})"
+        ))
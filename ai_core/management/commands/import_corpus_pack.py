@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from ai_core.corpus_packs import import_pack, verify_pack
+from ai_core.vector_index import export_vector_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify a corpus pack and bulk-load its chunks and embeddings into the database and the "
+        "vector index, without extracting PDFs or calling the embedding API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str, help="Corpus pack directory.")
+        parser.add_argument("--verify-only", action="store_true", help="Check the pack's checksums and stop.")
+        parser.add_argument("--keep-existing", action="store_true",
+                            help="Do not delete stored chunks of the sources the pack provides.")
+        parser.add_argument("--force", action="store_true",
+                            help="Import even if this exact pack is already installed.")
+
+    def handle(self, *args, **options):
+        try:
+            if options["verify_only"]:
+                manifest = verify_pack(options["path"])
+                self.stdout.write(self.style.SUCCESS(
+                    f"{manifest['name']} {manifest['version']}: {manifest['chunks']} chunks, checksums OK"
+                ))
+                return
+            result = import_pack(options["path"], replace=not options["keep_existing"], force=options["force"])
+        except ValueError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        manifest = result["manifest"]
+        if result["skipped"]:
+            self.stdout.write(self.style.WARNING(
+                f"{manifest['name']} {manifest['version']} is already installed; use --force to re-import."
+            ))
+            return
+        self.stdout.write(f"  {result['added']} added, {result['removed']} replaced")
+        self.stdout.write("Exporting vector index...")
+        export_vector_index()
+        self.stdout.write(self.style.SUCCESS(f"Imported {manifest['name']} {manifest['version']}."))
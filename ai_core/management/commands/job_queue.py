@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ai_core.jobs import purge_finished, requeue, stats
+from ai_core.models import Job
+
+
+class Command(BaseCommand):
+    help = "Show the background job queue by status, requeue dead-lettered jobs, or purge finished ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requeue-dead", action="store_true", help="Run dead-lettered jobs again.")
+        parser.add_argument("--kind", type=str, default=None, help="Only requeue jobs of this kind.")
+        parser.add_argument("--purge", type=int, default=None, metavar="DAYS",
+                            help="Delete jobs that succeeded more than DAYS days ago.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable stats.")
+
+    def handle(self, *args, **options):
+        if options["requeue_dead"]:
+            jobs = Job.objects.all()
+            if options["kind"]:
+                jobs = jobs.filter(kind=options["kind"])
+            self.stdout.write(self.style.SUCCESS(f"Requeued {requeue(jobs)} dead jobs."))
+        if options["purge"] is not None:
+            self.stdout.write(self.style.SUCCESS(f"Purged {purge_finished(options['purge'])} finished jobs."))
+
+        queue = stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(queue, indent=2))
+            return
+
+        counts = queue["counts"]
+        self.stdout.write(
+            f"{counts['queued']} queued, {counts['running']} running, {counts['succeeded']} succeeded, "
+            f"{counts['dead']} dead; oldest due job waiting {queue['oldest_due_seconds']}s"
+        )
+        for kind, by_status in sorted(queue["kinds"].items()):
+            line = f"  {kind}: " + ", ".join(f"{count} {status}" for status, count in sorted(by_status.items()))
+            self.stdout.write(self.style.WARNING(line) if by_status.get("dead") else line)
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ai_core.llm import single_flight
+
+
+class Command(BaseCommand):
+    help = "Show how many LLM requests across all workers were coalesced into another identical in-flight call."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Reset the counters after printing them.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        stats = single_flight.stats()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.stdout.write(
+                f"{stats['requests']} requests, {stats['upstream_calls']} upstream calls; "
+                f"{stats['coalesced']} coalesced ({stats['coalesced_local']} in-process, "
+                f"{stats['coalesced_shared']} across workers); coalescing ratio {stats['coalescing_ratio']:.1%}"
+            )
+
+        if options["reset"]:
+            single_flight.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
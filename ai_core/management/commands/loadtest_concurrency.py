@@ -0,0 +1,94 @@
+import json
+import os
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from ai_core.loadtest import DEFAULT_LEVELS, ENDPOINTS, SERVERS, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare how many concurrent users one web worker serves while they wait on LLM calls: a gunicorn "
+        "sync worker (WSGI) against a uvicorn worker (ASGI), with a fake model endpoint of fixed latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+        parser.add_argument("--endpoint", choices=list(ENDPOINTS), default="quiz",
+                            help="View to post generations to.")
+        parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_LEVELS),
+                            help="Concurrent user levels to try, until a server misses the SLO.")
+        parser.add_argument("--requests-per-user", type=int, default=3,
+                            help="Generations each user requests one after another.")
+        parser.add_argument("--llm-latency", type=float, default=1.0,
+                            help="Seconds the fake model takes to answer each call.")
+        parser.add_argument("--slo-factor", type=float, default=2.0,
+                            help="A level is served if nothing fails and p95 latency is at most this many "
+                                 "times the model latency.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Client timeout per request in seconds.")
+        parser.add_argument("--coalesce", action="store_true",
+                            help="Let the servers coalesce identical concurrent completions (LLM_COALESCE). "
+                                 "Off by default: every user asks for the same generation, so a level would "
+                                 "cost one model call.")
+        parser.add_argument("--output", type=str, default=None, help="Write the JSON results to this file.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        progress = None if options["json"] else self.stdout.write
+        servers = run_load_test(
+            servers=options["servers"], levels=options["users"], latency=options["llm_latency"],
+            requests_per_user=options["requests_per_user"], timeout=options["timeout"],
+            slo_factor=options["slo_factor"], endpoint=options["endpoint"], coalesce=options["coalesce"],
+            progress=progress,
+        )
+        results = {
+            "taken_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+            },
+            "endpoint": options["endpoint"],
+            "llm_latency": options["llm_latency"],
+            "slo_factor": options["slo_factor"],
+            "coalesce": options["coalesce"],
+            "servers": servers,
+        }
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for server in servers:
+            self.stdout.write(f"\n{server['server']} (1 worker, coalescing {'on' if options['coalesce'] else 'off'})")
+            if "error" in server:
+                self.stdout.write(self.style.ERROR(server["error"]))
+                continue
+            self.stdout.write(
+                f"{'users':>6} {'requests':>9} {'llm calls':>10} {'errors':>7} {'req/s':>8} {'p50 ms':>9} "
+                f"{'p95 ms':>9} {'p99 ms':>9}"
+            )
+            for level in server["levels"]:
+                latency = level["latency_ms"] or {"p50": 0, "p95": 0, "p99": 0}
+                line = (
+                    f"{level['users']:>6} {level['requests']:>9} {level['llm_calls']:>10} {level['errors']:>7} "
+                    f"{level['throughput_rps']:>8.2f} {latency['p50']:>9.0f} {latency['p95']:>9.0f} "
+                    f"{latency['p99']:>9.0f}"
+                )
+                self.stdout.write(line if level["within_slo"] else self.style.WARNING(line))
+
+        self.stdout.write("")
+        measured = {s["server"]: s["max_users"] for s in servers if "error" not in s}
+        for name, max_users in measured.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {max_users} concurrent users per worker within the SLO"
+            ))
+        if measured.get("wsgi") and "asgi" in measured:
+            self.stdout.write(f"asgi serves {measured['asgi'] / measured['wsgi']:.0f}x the users of wsgi per worker")
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
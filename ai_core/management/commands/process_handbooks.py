@@ -1,11 +1,22 @@
+import json
 import os
-from PyPDF2 import PdfReader
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from ai_core.models import DocumentChunk
-from ai_core.utils import get_embedding, embedding_to_bytes
+from ai_core.dedup import ingestion_dedup_index
+from ai_core.ingestion import (EXTRACTION_QUEUE_BATCHES, extract_pdf_chunks, iter_extracted_chunks, sync_chunks,
+                               update_pdf_data)
+from ai_core.utils import ThroughputReporter
+from ai_core.vector_index import export_vector_index
 
-BATCH_SIZE = 100
+CHECKPOINT_FILENAME = ".process_handbooks.checkpoint.json"
+
+# Class level partition of each handbook type
+CLASS_LEVELS = {
+    "Primary School Handbook": "Primary",
+    "JSS Handbook": "JSS",
+    "SSS Handbook": "SSS",
+}
 
 
 class Command(BaseCommand):
@@ -18,6 +29,23 @@ class Command(BaseCommand):
             required=True,
             help="Path to the directory containing primary, JSS, and SSS handbook PDFs.",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes extracting and chunking PDFs in parallel.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            type=str,
+            default=None,
+            help=f"Checkpoint file recording finished PDFs (default: <dir>/{CHECKPOINT_FILENAME}).",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore the checkpoint and process every PDF again.",
+        )
 
     def handle(self, *args, **options):
         pdf_dir = options.get("dir")
@@ -26,39 +54,114 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"Directory not found: {pdf_dir}"))
             return
 
-        self.stdout.write(f"Processing PDFs in directory: {pdf_dir}")
-        for filename in os.listdir(pdf_dir):
+        self.checkpoint_path = options["checkpoint"] or os.path.join(pdf_dir, CHECKPOINT_FILENAME)
+        self.checkpoint = {} if options["restart"] else self.load_checkpoint()
+
+        pdf_paths = []
+        for filename in sorted(os.listdir(pdf_dir)):
             if filename.endswith(".pdf"):
                 pdf_path = os.path.join(pdf_dir, filename)
-                self.stdout.write(f"Processing {filename}...")
-                self.process_pdf(pdf_path)
+                if self.checkpoint.get(filename) == self.file_signature(pdf_path):
+                    self.stdout.write(f"Skipping {filename} (unchanged since last run)")
+                else:
+                    pdf_paths.append(pdf_path)
+
+        self.stdout.write(f"Processing {len(pdf_paths)} PDFs in directory: {pdf_dir}")
+        self.progress = ThroughputReporter(self.stdout.write)
+        self.dedup = ingestion_dedup_index()
+        self.changed = False
+        self.failed = []
+        self.added = self.duplicates = 0
 
-        self.stdout.write(self.style.SUCCESS("Processing complete."))
+        if options["workers"] > 1:
+            self.process_parallel(pdf_paths, options["workers"])
+        else:
+            for pdf_path in pdf_paths:
+                self.stdout.write(f"Processing {os.path.basename(pdf_path)}...")
+                self.run_isolated(pdf_path, lambda: self.process_pdf(pdf_path, self.progress))
+        self.stdout.write(self.progress.summary())
+        if self.duplicates:
+            self.stdout.write(
+                f"Near-duplicates skipped: {self.duplicates} of {self.added + self.duplicates} new chunks "
+                f"({self.duplicates / (self.added + self.duplicates):.1%})"
+            )
+
+        if self.changed:
+            self.stdout.write("Exporting vector index...")
+            export_vector_index()
 
-    def process_pdf(self, pdf_path):
+        if self.failed:
+            self.stdout.write(self.style.WARNING(
+                f"{len(self.failed)} PDFs failed: {', '.join(self.failed)}. Re-run to retry them."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("Processing complete."))
+
+    def process_parallel(self, pdf_paths, workers):
         """
-        Process a PDF file, extract text, split into chunks, generate embeddings, and store in the database.
+        Extract and chunk PDFs in a process pool. Each worker hands its chunks over in
+        batches through a bounded queue, and this process embeds and inserts every batch
+        as it arrives, so database writes stay on one connection and no PDF is held in
+        memory whole. Files are synced in the order they were submitted.
         """
-        reader = PdfReader(pdf_path)
-        text = "".join([page.extract_text() for page in reader.pages])
+        with Manager() as manager, ProcessPoolExecutor(max_workers=workers) as executor:
+            extractions = []
+            for pdf_path in pdf_paths:
+                queue = manager.Queue(maxsize=EXTRACTION_QUEUE_BATCHES)
+                extractions.append((pdf_path, queue, executor.submit(extract_pdf_chunks, pdf_path, queue)))
+            for pdf_path, queue, future in extractions:
+                self.stdout.write(f"Processing {os.path.basename(pdf_path)}...")
+                document_type = self.classify_document_type(os.path.basename(pdf_path))
+                chunks = iter_extracted_chunks(queue, future)
+                self.run_isolated(pdf_path, lambda: sync_chunks(
+                    chunks, document_type, pdf_path, progress=self.progress,
+                    class_level=CLASS_LEVELS.get(document_type, ''), dedup=self.dedup,
+                ))
+                chunks.close()
 
-        chunks = [text[i:i + 300] for i in range(0, len(text), 300)]
+    def run_isolated(self, pdf_path, work):
+        """Run one file's ingestion; a failure is reported and recorded without stopping the others."""
+        filename = os.path.basename(pdf_path)
+        try:
+            counts = work()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"  Failed to process {filename}: {e}"))
+            self.failed.append(filename)
+            return
+        self.stdout.write(
+            f"  {counts['added']} added, {counts['removed']} removed, {counts['unchanged']} unchanged, "
+            f"{counts['duplicates']} near-duplicates skipped"
+        )
+        self.changed = self.changed or counts['added'] or counts['removed'] or counts['relabelled']
+        self.added += counts['added']
+        self.duplicates += counts['duplicates']
+        self.checkpoint[filename] = self.file_signature(pdf_path)
+        self.save_checkpoint()
 
+    def process_pdf(self, pdf_path, progress=None):
+        """
+        Sync a PDF's chunks with the database; only chunks whose content hash is new are embedded.
+        """
         document_type = self.classify_document_type(os.path.basename(pdf_path))
+        return update_pdf_data(pdf_path, document_type, progress=progress,
+                               class_level=CLASS_LEVELS.get(document_type, ''), dedup=self.dedup)
+
+    def file_signature(self, pdf_path):
+        st = os.stat(pdf_path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
 
-        for i in range(0, len(chunks), BATCH_SIZE):
-            batch_chunks = chunks[i:i + BATCH_SIZE]
-            embeddings = [get_embedding(chunk) for chunk in batch_chunks]
-
-            DocumentChunk.objects.bulk_create([
-                DocumentChunk(
-                    document_type=document_type,
-                    chunk_text=chunk,
-                    embedding=embedding_to_bytes(embedding),
-                    metadata={"source": pdf_path, "chunk_id": f"chunk_{i + j}"}
-                )
-                for j, (chunk, embedding) in enumerate(zip(batch_chunks, embeddings))
-            ])
+    def save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
 
     def classify_document_type(self, filename):
         """
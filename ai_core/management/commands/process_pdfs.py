@@ -1,5 +1,8 @@
 from django.core.management.base import BaseCommand
-from ai_core.utils import process_pdf_in_batches, build_faiss_index
+from ai_core.dedup import ingestion_dedup_index
+from ai_core.ingestion import process_pdf_in_batches
+from ai_core.utils import ThroughputReporter
+from ai_core.vector_index import export_vector_index
 
 
 class Command(BaseCommand):
@@ -9,11 +12,20 @@ class Command(BaseCommand):
         syllabus_path = "data/waec_history_syllabus.pdf"
         textbook_path = "data/waec_history_textbook.pdf"
 
+        progress = ThroughputReporter(self.stdout.write)
+        dedup = ingestion_dedup_index()
         self.stdout.write("Processing WAEC History Syllabus...")
-        process_pdf_in_batches(syllabus_path, "WAEC Syllabus")
+        syllabus = process_pdf_in_batches(syllabus_path, "WAEC Syllabus", progress=progress,
+                                          class_level="SSS", subject="History", dedup=dedup)
         self.stdout.write("Processing WAEC History Textbook...")
-        process_pdf_in_batches(textbook_path, "History Textbook")
+        textbook = process_pdf_in_batches(textbook_path, "History Textbook", progress=progress,
+                                          class_level="SSS", subject="History", dedup=dedup)
+        self.stdout.write(progress.summary())
+        duplicates = syllabus['duplicates'] + textbook['duplicates']
+        total = duplicates + syllabus['added'] + textbook['added']
+        if duplicates:
+            self.stdout.write(f"Near-duplicates skipped: {duplicates} of {total} chunks ({duplicates / total:.1%})")
 
-        self.stdout.write("Building FAISS index...")
-        build_faiss_index()
+        self.stdout.write("Exporting vector index...")
+        export_vector_index()
         self.stdout.write("Processing complete.")
@@ -0,0 +1,94 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ai_core.ann import recall_at_k
+from ai_core.quantization import QUANTIZERS
+from ai_core.vector_index import get_vector_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Report memory saved and recall@k lost by int8 and product-quantized indexes against the "
+        "float32 index, with and without float32 re-ranking, using corpus vectors as queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--methods", nargs="+", choices=sorted(QUANTIZERS), default=["int8", "pq"])
+        parser.add_argument("--subspaces", type=int, default=None, help="PQ sub-vectors per embedding.")
+        parser.add_argument("--rerank", type=int, nargs="+", default=[0, 4, 10],
+                            help="Re-rank factors to evaluate (candidates = k * factor; 0 = no re-rank).")
+        parser.add_argument("--k", type=int, default=5, help="Number of results per query.")
+        parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        index = get_vector_index()
+        if len(index) == 0:
+            self.stdout.write(self.style.ERROR("The vector index is empty."))
+            return
+
+        rng = np.random.default_rng(options["seed"])
+        rows = rng.choice(len(index), min(options["queries"], len(index)), replace=False)
+        # Jitter the sampled rows so queries are near, but not identical to, corpus vectors.
+        queries = np.asarray(index.matrix[rows], dtype=np.float32)
+        queries += rng.normal(scale=0.05 / np.sqrt(index.dim), size=queries.shape).astype(np.float32)
+        k = options["k"]
+
+        start = time.perf_counter()
+        exact = [index.search(q, top_k=k, exact=True)[0] for q in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        float32_bytes = len(index) * index.dim * 4
+
+        results = {
+            "corpus_size": len(index),
+            "dim": index.dim,
+            "k": k,
+            "queries": len(queries),
+            "float32_bytes": float32_bytes,
+            "exact_ms_per_query": round(exact_ms, 3),
+            "methods": [],
+        }
+        for method in options["methods"]:
+            try:
+                quantized = QUANTIZERS[method].build(index, subspaces=options["subspaces"])
+            except ValueError as e:
+                self.stdout.write(self.style.ERROR(f"{method}: {e}"))
+                continue
+            entry = {
+                "method": method,
+                "bytes": quantized.nbytes,
+                "memory_saved": round(1 - quantized.nbytes / float32_bytes, 4),
+                "runs": [],
+            }
+            for rerank in options["rerank"]:
+                start = time.perf_counter()
+                approx = [quantized.search(index, q, top_k=k, rerank=rerank)[0] for q in queries]
+                elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+                recall = float(np.mean([recall_at_k(a, e) for a, e in zip(approx, exact)]))
+                entry["runs"].append({
+                    "rerank": rerank,
+                    "recall_at_k": round(recall, 4),
+                    "recall_lost": round(1 - recall, 4),
+                    "ms_per_query": round(elapsed_ms, 3),
+                })
+            results["methods"].append(entry)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"Corpus: {len(index)} chunks x {index.dim} dims, k={k}, {len(queries)} queries. "
+            f"float32: {float32_bytes / 2**20:.1f} MiB, exact search {exact_ms:.3f} ms/query"
+        )
+        self.stdout.write(f"{'method':>7} {'MiB':>8} {'saved':>7} {'rerank':>7} {'recall@k':>9} {'lost':>7} {'ms/query':>9}")
+        for entry in results["methods"]:
+            for run in entry["runs"]:
+                self.stdout.write(
+                    f"{entry['method']:>7} {entry['bytes'] / 2**20:>8.2f} {entry['memory_saved']:>7.1%} "
+                    f"{run['rerank']:>7} {run['recall_at_k']:>9.4f} {run['recall_lost']:>7.2%} {run['ms_per_query']:>9.3f}"
+                )
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from ai_core.embeddings import active_embedding_model, get_embedding_backend
+from ai_core.ingestion import INSERT_BATCH_SIZE
+from ai_core.models import DocumentChunk
+from ai_core.utils import ThroughputReporter, embedding_to_bytes, get_embeddings
+from ai_core.vector_index import bump_corpus_generation, export_vector_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed stored chunks with an embedding backend (default: settings.EMBEDDING_BACKEND), "
+        "e.g. to move the corpus to the local sentence-transformers model without re-reading the PDFs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", choices=["gemini", "local"], default=None,
+                            help="Backend to embed with (default: settings.EMBEDDING_BACKEND).")
+        parser.add_argument("--all", action="store_true",
+                            help="Also re-embed chunks already embedded by the backend's model.")
+        parser.add_argument("--batch-size", type=int, default=INSERT_BATCH_SIZE,
+                            help="Chunks loaded and updated per batch.")
+
+    def handle(self, *args, **options):
+        backend = get_embedding_backend(options["backend"])
+        chunks = DocumentChunk.objects.all()
+        if not options["all"]:
+            chunks = chunks.exclude(embedding_model=backend.model)
+        total = chunks.count()
+        previous_models = list(chunks.values_list('embedding_model', flat=True).distinct())
+        self.stdout.write(f"Re-embedding {total} chunks with {backend.model}...")
+
+        progress = ThroughputReporter(self.stdout.write)
+        last_id = 0
+        while True:
+            batch = list(chunks.filter(id__gt=last_id).order_by('id').only('id', 'chunk_text')[:options["batch_size"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            embeddings = get_embeddings([chunk.chunk_text for chunk in batch], progress=progress, backend=backend)
+            for chunk, embedding in zip(batch, embeddings):
+                chunk.embedding = embedding_to_bytes(embedding)
+                chunk.embedding_model = backend.model
+            DocumentChunk.objects.bulk_update(batch, ['embedding', 'embedding_model'])
+            bump_corpus_generation(backend.model, *previous_models)
+        self.stdout.write(progress.summary())
+
+        if backend.model == active_embedding_model():
+            self.stdout.write("Exporting vector index...")
+            export_vector_index()
+            self.stdout.write(self.style.SUCCESS("Re-embedding complete."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Chunks are now embedded with {backend.model}, but the active model is "
+                f"{active_embedding_model()}; set EMBEDDING_BACKEND accordingly and run build_vector_index."
+            ))
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from ai_core.caching import query_embedding_cache, retrieval_cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the query embedding and retrieval result caches across all workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Reset the counters after printing them.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        caches = [query_embedding_cache, retrieval_cache]
+        stats = [cache.stats() for cache in caches]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.stdout.write(f"{'cache':>16} {'local hits':>11} {'shared hits':>12} {'misses':>8} {'hit-rate':>9}")
+            for s in stats:
+                self.stdout.write(
+                    f"{s['namespace']:>16} {s['local_hits']:>11} {s['shared_hits']:>12} "
+                    f"{s['misses']:>8} {s['hit_rate']:>9.1%}"
+                )
+
+        if options["reset"]:
+            for cache in caches:
+                cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,71 @@
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ai_core.jobs import claim, purge_finished, release_expired, run_job, worker_id
+
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (exam papers, theory grading, summaries, report cards) queued by the views. "
+        "Run as many workers as needed; each runs up to --concurrency jobs at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY,
+                            help="Jobs this worker runs at once (defaults to settings.JOB_WORKER_CONCURRENCY).")
+        parser.add_argument("--kinds", nargs="+", default=None, help="Only run jobs of these kinds.")
+        parser.add_argument("--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL,
+                            help="Seconds to wait before checking an empty queue again.")
+        parser.add_argument("--burst", action="store_true", help="Exit once no job is due instead of waiting.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+        threads = [
+            threading.Thread(target=self.work, args=(stop, options), name=f"job-worker-{n}", daemon=True)
+            for n in range(options["concurrency"])
+        ]
+        self.stdout.write(f"Running jobs with {len(threads)} threads (Ctrl-C to stop)...")
+        for thread in threads:
+            thread.start()
+
+        last_purge = 0
+        while any(thread.is_alive() for thread in threads):
+            release_expired()
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purged = purge_finished()
+                if purged:
+                    self.stdout.write(f"Purged {purged} finished jobs.")
+                last_purge = time.monotonic()
+            close_old_connections()
+            stop.wait(options["poll_interval"])
+            if stop.is_set():
+                self.stdout.write("Stopping once the running jobs finish...")
+                for thread in threads:
+                    thread.join()
+        self.stdout.write(self.style.SUCCESS("Job worker stopped."))
+
+    def work(self, stop, options):
+        """Claim and run one job at a time until stopped (or, with --burst, until no job is due)."""
+        worker = worker_id()
+        try:
+            while not stop.is_set():
+                jobs = claim(worker, 1, options["kinds"])
+                if not jobs:
+                    if options["burst"]:
+                        return
+                    stop.wait(options["poll_interval"])
+                    continue
+                run_job(jobs[0], worker)
+                close_old_connections()
+        finally:
+            close_old_connections()
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from ai_core.dedup import ingestion_dedup_index
+from ai_core.ingestion import update_pdf_data
+from ai_core.utils import ThroughputReporter
+from ai_core.vector_index import export_vector_index
+
+DEFAULT_PDFS = [
+    ("data/waec_history_syllabus.pdf", "WAEC Syllabus"),
+    ("data/waec_history_textbook.pdf", "History Textbook"),
+]
+DEFAULT_CLASS_LEVEL = "SSS"
+DEFAULT_SUBJECT = "History"
+
+
+class Command(BaseCommand):
+    help = "Incrementally re-ingest PDFs: embed only new chunks and remove chunks whose text is gone."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pdf",
+            nargs=2,
+            action="append",
+            metavar=("PATH", "DOCUMENT_TYPE"),
+            help="PDF to sync and its document type; may be repeated. Defaults to the WAEC History PDFs.",
+        )
+        parser.add_argument("--class-level", type=str, default=None,
+                            help=f"Class level of the PDFs (default: {DEFAULT_CLASS_LEVEL!r} for the WAEC PDFs).")
+        parser.add_argument("--subject", type=str, default=None,
+                            help=f"Subject of the PDFs (default: {DEFAULT_SUBJECT!r} for the WAEC PDFs).")
+
+    def handle(self, *args, **options):
+        pdfs = options.get("pdf") or DEFAULT_PDFS
+        class_level, subject = options["class_level"], options["subject"]
+        if not options.get("pdf"):
+            class_level = DEFAULT_CLASS_LEVEL if class_level is None else class_level
+            subject = DEFAULT_SUBJECT if subject is None else subject
+        progress = ThroughputReporter(self.stdout.write)
+        dedup = ingestion_dedup_index()
+        changed = False
+        added = duplicates = 0
+
+        for pdf_path, document_type in pdfs:
+            self.stdout.write(f"Syncing {pdf_path} ({document_type})...")
+            counts = update_pdf_data(pdf_path, document_type, progress=progress,
+                                     class_level=class_level or "", subject=subject or "", dedup=dedup)
+            self.stdout.write(
+                f"  {counts['added']} added, {counts['removed']} removed, {counts['unchanged']} unchanged, "
+                f"{counts['duplicates']} near-duplicates skipped"
+            )
+            changed = changed or counts['added'] or counts['removed'] or counts['relabelled']
+            added += counts['added']
+            duplicates += counts['duplicates']
+        self.stdout.write(progress.summary())
+        if duplicates:
+            self.stdout.write(
+                f"Near-duplicates skipped: {duplicates} of {added + duplicates} new chunks "
+                f"({duplicates / (added + duplicates):.1%})"
+            )
+
+        if changed:
+            self.stdout.write("Exporting vector index...")
+            export_vector_index()
+        self.stdout.write(self.style.SUCCESS("Update complete."))
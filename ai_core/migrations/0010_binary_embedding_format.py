@@ -0,0 +1,64 @@
+import json
+import struct
+
+import numpy as np
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# Frozen copy of the version 1 binary layout from ai_core.utils so this
+# migration keeps working if the live format changes.
+HEADER = struct.Struct('<2sBBI')
+MAGIC = b'SE'
+
+
+def _iter_batches(DocumentChunk):
+    last_id = 0
+    while True:
+        batch = list(
+            DocumentChunk.objects.filter(id__gt=last_id).order_by('id').only('id', 'embedding')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield batch
+
+
+def json_to_binary(apps, schema_editor):
+    DocumentChunk = apps.get_model('ai_core', 'DocumentChunk')
+    for batch in _iter_batches(DocumentChunk):
+        changed = []
+        for chunk in batch:
+            data = bytes(chunk.embedding)
+            if not data.startswith(b'['):
+                continue
+            vector = np.asarray(json.loads(data.decode('utf-8')), dtype='<f4')
+            chunk.embedding = HEADER.pack(MAGIC, 1, 0, vector.shape[0]) + vector.tobytes()
+            changed.append(chunk)
+        DocumentChunk.objects.bulk_update(changed, ['embedding'])
+
+
+def binary_to_json(apps, schema_editor):
+    DocumentChunk = apps.get_model('ai_core', 'DocumentChunk')
+    for batch in _iter_batches(DocumentChunk):
+        changed = []
+        for chunk in batch:
+            data = bytes(chunk.embedding)
+            if data.startswith(b'['):
+                continue
+            _, _, code, dim = HEADER.unpack_from(data)
+            dtype = '<f4' if code == 0 else '<f2'
+            vector = np.frombuffer(data, dtype=dtype, count=dim, offset=HEADER.size)
+            chunk.embedding = json.dumps(vector.astype(float).tolist()).encode('utf-8')
+            changed.append(chunk)
+        DocumentChunk.objects.bulk_update(changed, ['embedding'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai_core", "0009_examconfig_examsession"),
+    ]
+
+    operations = [
+        migrations.RunPython(json_to_binary, binary_to_json, elidable=True),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:13
+
+import hashlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_source_and_hash(apps, schema_editor):
+    DocumentChunk = apps.get_model('ai_core', 'DocumentChunk')
+    last_id = 0
+    while True:
+        batch = list(
+            DocumentChunk.objects.filter(id__gt=last_id).order_by('id')
+            .only('id', 'chunk_text', 'metadata')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        last_id = batch[-1].id
+        for chunk in batch:
+            chunk.content_hash = hashlib.sha256(chunk.chunk_text.encode('utf-8')).hexdigest()
+            chunk.source = str((chunk.metadata or {}).get('source', ''))[:500]
+        DocumentChunk.objects.bulk_update(batch, ['content_hash', 'source'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0010_binary_embedding_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='source',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=models.Index(fields=['document_type', 'source'], name='ai_core_chunk_source_idx'),
+        ),
+        migrations.RunPython(backfill_source_and_hash, migrations.RunPython.noop, elidable=True),
+    ]
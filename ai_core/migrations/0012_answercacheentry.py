@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0011_documentchunk_source_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(blank=True, default='', max_length=100)),
+                ('embedding_model', models.CharField(max_length=100)),
+                ('query', models.TextField()),
+                ('query_embedding', models.BinaryField()),
+                ('answer', models.TextField()),
+                ('generation_seconds', models.FloatField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'embedding_model'], name='ai_core_answer_scope_idx')],
+            },
+        ),
+    ]
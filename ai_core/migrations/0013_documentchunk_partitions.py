@@ -0,0 +1,43 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+# Class level and subject of the document types ingested before these fields existed
+KNOWN_DOCUMENT_TYPES = {
+    'WAEC Syllabus': ('SSS', 'History'),
+    'History Textbook': ('SSS', 'History'),
+    'Primary School Handbook': ('Primary', ''),
+    'JSS Handbook': ('JSS', ''),
+    'SSS Handbook': ('SSS', ''),
+}
+
+
+def backfill_partitions(apps, schema_editor):
+    DocumentChunk = apps.get_model('ai_core', 'DocumentChunk')
+    for document_type, (class_level, subject) in KNOWN_DOCUMENT_TYPES.items():
+        DocumentChunk.objects.filter(document_type=document_type).update(class_level=class_level, subject=subject)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0012_answercacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='class_level',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='subject',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=models.Index(fields=['document_type', 'class_level', 'subject', 'id'], name='ai_core_chunk_partition_idx'),
+        ),
+        migrations.RunPython(backfill_partitions, migrations.RunPython.noop, elidable=True),
+    ]
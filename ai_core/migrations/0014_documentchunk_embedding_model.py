@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0013_documentchunk_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='embedding_model',
+            field=models.CharField(db_index=True, default='text-embedding-004', max_length=200),
+        ),
+    ]
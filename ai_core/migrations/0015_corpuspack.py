@@ -0,0 +1,26 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0014_documentchunk_embedding_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusPack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('version', models.CharField(max_length=50)),
+                ('checksum', models.CharField(max_length=64)),
+                ('embedding_model', models.CharField(max_length=200)),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('sources', models.JSONField(default=list)),
+                ('installed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0016_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('embedding_model', models.CharField(max_length=200, unique=True)),
+                ('generation', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def dead_letter_duplicates(apps, schema_editor):
+    """Keep the oldest unfinished job of each kind and key; jobs enqueued by the same race are dead-lettered."""
+    Job = apps.get_model('ai_core', 'Job')
+    unfinished = Job.objects.filter(status__in=['queued', 'running']).exclude(key='')
+    seen = set()
+    for job_id, kind, key in unfinished.order_by('id').values_list('id', 'kind', 'key'):
+        if (kind, key) in seen:
+            Job.objects.filter(id=job_id).update(
+                status='dead', locked_by='', locked_until=None, finished_at=timezone.now(),
+                last_error='Duplicate of an earlier unfinished job with the same key',
+            )
+        seen.add((kind, key))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0017_corpusgeneration'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dead_letter_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running']), models.Q(('key', ''), _negated=True)), fields=('kind', 'key'), name='ai_core_job_unfinished_key'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_core', '0018_job_unfinished_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answercacheentry',
+            name='corpus_generation',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='answercacheentry',
+            name='embedding_model',
+            field=models.CharField(max_length=200),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from core.models import ClassLevel
 from django.utils.translation import gettext_lazy as _
 
@@ -9,7 +10,106 @@ class DocumentChunk(models.Model):
     document_type = models.CharField(max_length=100)  # e.g., "WAEC Syllabus", "History Textbook"
     chunk_text = models.TextField()  # The extracted text chunk
     embedding = models.BinaryField()  # Serialized embedding vector
+    embedding_model = models.CharField(max_length=200, default='text-embedding-004', db_index=True)  # Model that produced it
     metadata = models.JSONField()  # Additional metadata like topic, page number
+    source = models.CharField(max_length=500, blank=True, default='')  # Path of the ingested file
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)  # sha256 of chunk_text
+    class_level = models.CharField(max_length=20, blank=True, default='')  # e.g., "Primary", "JSS", "SSS"
+    subject = models.CharField(max_length=100, blank=True, default='')  # e.g., "History"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['document_type', 'source'], name='ai_core_chunk_source_idx'),
+            models.Index(fields=['document_type', 'class_level', 'subject', 'id'], name='ai_core_chunk_partition_idx'),
+        ]
+
+
+class AnswerCacheEntry(models.Model):
+    """A past assistant answer, reused for later queries whose embedding is close enough to this one."""
+    scope = models.CharField(max_length=100, blank=True, default='')  # Partitions the answer drew on (answer_cache.filter_scope); '' = all
+    embedding_model = models.CharField(max_length=200)
+    corpus_generation = models.PositiveBigIntegerField(default=0)  # Corpus the answer was retrieved from (vector_index.corpus_state)
+    query = models.TextField()
+    query_embedding = models.BinaryField()
+    answer = models.TextField()
+    generation_seconds = models.FloatField(default=0)  # Time the original retrieve + LLM round-trip took
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['scope', 'embedding_model'], name='ai_core_answer_scope_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.scope or 'all'}] {self.query[:80]}"
+
+
+class CorpusGeneration(models.Model):
+    """Counter bumped whenever the DocumentChunk rows of an embedding model change; see vector_index.corpus_state."""
+    embedding_model = models.CharField(max_length=200, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.embedding_model}: {self.generation}"
+
+
+class CorpusPack(models.Model):
+    """An imported corpus pack; re-importing the same checksum is a no-op."""
+    name = models.CharField(max_length=200, unique=True)
+    version = models.CharField(max_length=50)
+    checksum = models.CharField(max_length=64)  # sha256 over the pack's file checksums
+    embedding_model = models.CharField(max_length=200)
+    chunks = models.PositiveIntegerField(default=0)
+    sources = models.JSONField(default=list)  # (document_type, source) pairs the pack provides
+    installed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} {self.version}"
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = 'queued', 'Queued'
+    RUNNING = 'running', 'Running'
+    SUCCEEDED = 'succeeded', 'Succeeded'
+    DEAD = 'dead', 'Dead'  # Dead-lettered: out of attempts, kept for inspection and requeueing
+
+
+class Job(models.Model):
+    """A background job run by `manage.py run_jobs`; see ai_core/jobs.py."""
+    kind = models.CharField(max_length=100)  # Registered handler, e.g. "exam.generate"
+    key = models.CharField(max_length=200, blank=True, default='')  # At most one unfinished job per kind and key; enqueue() reuses it
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='jobs',
+                             null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Not claimed before this (retry backoff)
+    locked_by = models.CharField(max_length=100, blank=True, default='')  # Worker running the current attempt
+    locked_until = models.DateTimeField(null=True, blank=True)  # Visibility timeout of the current attempt
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='ai_core_job_due_idx'),
+            models.Index(fields=['kind', 'key', 'status'], name='ai_core_job_key_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'key'],
+                condition=models.Q(status__in=[JobStatus.QUEUED, JobStatus.RUNNING]) & ~models.Q(key=''),
+                name='ai_core_job_unfinished_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
 
 
 class PaymentStatus(models.TextChoices):
@@ -0,0 +1,281 @@
+"""
+Compressed representations of the chunk index for a smaller retrieval footprint.
+
+Both quantizers score queries with asymmetric distance computation (the query
+stays float32, only the corpus is compressed) and re-rank the best candidates
+with exact float32 scores read from the memory-mapped index file, so only the
+re-ranked rows are ever paged in. The codes are saved as their own .npy file next
+to the structure file and memory-mapped too, so workers share one copy of them
+through the OS page cache. The quantized engines are only attached to an index
+read from the exported file (see vector_index._attach_ann).
+"""
+import glob
+import logging
+import os
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .vector_index import engine_path, load_index_file, top_k_positions
+
+logger = logging.getLogger(__name__)
+
+SCAN_BATCH_SIZE = 16384
+# int8 rows are widened to float32 in blocks small enough to stay in CPU cache
+INT8_SCAN_BLOCK = 512
+PQ_CENTROIDS = 256
+
+
+def kmeans(data, n_clusters, n_iter=20, seed=0):
+    """Euclidean k-means; empty clusters are re-seeded from random rows."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].astype(np.float32)
+    for _ in range(n_iter):
+        assignments = nearest_centroids(data, centroids)
+        sums = np.stack([
+            np.bincount(assignments, weights=data[:, d], minlength=n_clusters) for d in range(data.shape[1])
+        ], axis=1).astype(np.float32)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+            counts[empty] = 1
+        centroids = sums / counts[:, None]
+    return centroids
+
+
+def nearest_centroids(data, centroids, block_size=1024):
+    """Index of the closest centroid (Euclidean) for every row, in cache-sized blocks."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        assignments[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return assignments
+
+
+class QuantizedIndex:
+    """Shared search logic: approximate scan of the compressed rows, then exact re-rank."""
+
+    method = None
+
+    def __init__(self, index_generation=None, rerank=None):
+        self.index_generation = index_generation
+        self.rerank = settings.VECTOR_QUANTIZED_RERANK if rerank is None else rerank
+
+    def __len__(self):
+        return len(self.codes)
+
+    def approx_scores(self, query, start, end):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        raise NotImplementedError
+
+    def search(self, index, query_embedding, top_k=5, partitions=None, rerank=None):
+        """
+        Return (ids, scores) of the top_k rows of `index`, best first. The top
+        top_k * rerank rows by approximate score are re-scored exactly; with
+        rerank=0 the approximate scores are returned as they are.
+        """
+        rerank = self.rerank if rerank is None else rerank
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if len(index) == 0 or top_k <= 0 or norm == 0 or query.shape[0] != index.dim:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = query / norm
+
+        ranges = index.row_ranges(partitions)
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([self.approx_scores(query, start, end) for start, end in ranges])
+        if not rerank:
+            top = top_k_positions(scores, top_k)
+            return index.ids[rows[top]], scores[top]
+
+        candidates = np.sort(rows[top_k_positions(scores, top_k * rerank)])
+        exact = np.asarray(index.matrix[candidates], dtype=np.float32) @ query
+        top = top_k_positions(exact, top_k)
+        return index.ids[candidates[top]], exact[top]
+
+    def save(self, path):
+        """
+        Persist with an atomic rename, like the vector index file it belongs to. The codes
+        go to a new uniquely named .npy file first; once the structure file naming it has
+        been renamed into place, the previous codes files are removed (workers that still
+        map one keep reading it until they reload).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        codes_path = f"{codes_prefix(path)}{uuid.uuid4().hex[:12]}.npy"
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        try:
+            np.save(codes_path, self.codes)
+            np.savez(
+                tmp_path,
+                method=np.array(self.method),
+                index_generation=np.array(str(self.index_generation)),
+                codes_file=np.array(os.path.basename(codes_path)),
+                **self.arrays(),
+            )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(codes_path)
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        for stale in glob.glob(f"{glob.escape(codes_prefix(path))}*.npy"):
+            if stale != codes_path:
+                os.remove(stale)
+
+
+class ScalarQuantizedIndex(QuantizedIndex):
+    """Each row stored as int8 codes with one float32 scale: row ≈ codes * scale."""
+
+    method = 'int8'
+
+    def __init__(self, codes, scales, index_generation=None, rerank=None):
+        super().__init__(index_generation, rerank)
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def build(cls, index, **kwargs):
+        codes = np.empty((len(index), index.dim), dtype=np.int8)
+        scales = np.empty(len(index), dtype=np.float32)
+        for start in range(0, len(index), SCAN_BATCH_SIZE):
+            block = np.asarray(index.matrix[start:start + SCAN_BATCH_SIZE], dtype=np.float32)
+            block_scales = np.abs(block).max(axis=1) / 127
+            block_scales[block_scales == 0] = 1.0
+            codes[start:start + len(block)] = np.round(block / block_scales[:, None])
+            scales[start:start + len(block)] = block_scales
+        return cls(codes, scales, index_generation=index.generation)
+
+    def approx_scores(self, query, start, end):
+        scores = np.empty(end - start, dtype=np.float32)
+        for offset in range(start, end, INT8_SCAN_BLOCK):
+            stop = min(offset + INT8_SCAN_BLOCK, end)
+            block = self.codes[offset:stop].astype(np.float32)
+            scores[offset - start:stop - start] = (block @ query) * self.scales[offset:stop]
+        return scores
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def arrays(self):
+        return {'scales': self.scales}
+
+
+class ProductQuantizedIndex(QuantizedIndex):
+    """
+    Rows split into `m` sub-vectors, each replaced by the uint8 id of its nearest
+    centroid in that subspace's codebook, so a row costs `m` bytes. A query is scored
+    by summing per-subspace lookup tables of query/centroid dot products. Codes are
+    stored subspace-major, shape (m, rows), so each table lookup is a contiguous gather.
+    """
+
+    method = 'pq'
+
+    def __init__(self, codebooks, codes, index_generation=None, rerank=None):
+        super().__init__(index_generation, rerank)
+        self.codebooks = codebooks
+        self.codes = codes
+
+    def __len__(self):
+        return self.codes.shape[1]
+
+    @property
+    def m(self):
+        return len(self.codebooks)
+
+    @classmethod
+    def build(cls, index, subspaces=None, n_iter=15, sample_size=10000, seed=0, **kwargs):
+        """
+        Train the codebooks and encode every row. Without `subspaces`, the largest divisor
+        of the dimension up to settings.VECTOR_PQ_SUBSPACES is used.
+        """
+        m = subspaces or max(m for m in range(1, settings.VECTOR_PQ_SUBSPACES + 1) if index.dim % m == 0)
+        if index.dim % m:
+            raise ValueError(f"Embedding dimension {index.dim} is not divisible by {m} subspaces")
+        dsub = index.dim // m
+
+        rng = np.random.default_rng(seed)
+        if len(index) > sample_size:
+            sample = np.asarray(index.matrix[np.sort(rng.choice(len(index), sample_size, replace=False))],
+                                dtype=np.float32)
+        else:
+            sample = np.asarray(index.matrix, dtype=np.float32)
+
+        codebooks = np.zeros((m, PQ_CENTROIDS, dsub), dtype=np.float32)
+        for j in range(m):
+            centroids = kmeans(sample[:, j * dsub:(j + 1) * dsub], PQ_CENTROIDS, n_iter=n_iter, seed=seed + j)
+            codebooks[j, :len(centroids)] = centroids
+            # Unused codebook slots (tiny corpora) duplicate a real centroid so they are never closer
+            codebooks[j, len(centroids):] = centroids[0]
+
+        codes = np.empty((m, len(index)), dtype=np.uint8)
+        for start in range(0, len(index), SCAN_BATCH_SIZE):
+            block = np.asarray(index.matrix[start:start + SCAN_BATCH_SIZE], dtype=np.float32)
+            for j in range(m):
+                codes[j, start:start + len(block)] = nearest_centroids(block[:, j * dsub:(j + 1) * dsub], codebooks[j])
+        return cls(codebooks, codes, index_generation=index.generation)
+
+    def approx_scores(self, query, start, end):
+        lut = np.einsum('mkd,md->mk', self.codebooks, query.reshape(self.m, -1))
+        scores = np.zeros(end - start, dtype=np.float32)
+        for j in range(self.m):
+            scores += lut[j].take(self.codes[j, start:end])
+        return scores
+
+    @property
+    def nbytes(self):
+        return self.codebooks.nbytes + self.codes.nbytes
+
+    def arrays(self):
+        return {'codebooks': self.codebooks}
+
+
+QUANTIZERS = {
+    'int8': ScalarQuantizedIndex,
+    'pq': ProductQuantizedIndex,
+}
+
+
+def codes_prefix(path):
+    """Start of the names of the codes files belonging to the structure file at `path`."""
+    return f"{os.path.splitext(path)[0]}.codes-"
+
+
+def load_quantized_index(path):
+    """Load a saved quantized index; its codes are a read-only memory map."""
+    with np.load(path) as data:
+        method = str(data['method'])
+        arrays = {name: data[name] for name in data.files
+                  if name not in ('method', 'index_generation', 'codes_file')}
+        index_generation = str(data['index_generation'])
+        codes_file = str(data['codes_file'])
+    if method not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization method in {path}: {method}")
+    codes = np.load(os.path.join(os.path.dirname(os.path.abspath(path)), codes_file), mmap_mode='r')
+    return QUANTIZERS[method](codes=codes, **arrays, index_generation=index_generation)
+
+
+def build_quantized_index(method=None, path=None, index_path=None, **options):
+    """
+    Quantize the index file at `index_path` (default: the current vector index) and
+    persist the result next to that file.
+    """
+    from .vector_index import get_vector_index
+
+    method = method or settings.VECTOR_SEARCH_ENGINE
+    if method not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization method: {method}")
+    index = load_index_file(index_path) if index_path else get_vector_index()
+    if len(index) == 0:
+        raise ValueError("Cannot quantize an empty vector index")
+    quantized = QUANTIZERS[method].build(index, **options)
+    quantized.save(path or engine_path(index_path, method))
+    return quantized
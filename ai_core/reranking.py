@@ -0,0 +1,77 @@
+"""
+Diversity re-ranking of retrieved chunks with maximal marginal relevance (MMR).
+
+Overlapping chunks often fill the top results with near-copies of one passage.
+MMR picks chunks greedily by relevance to the query minus similarity to the chunks
+already picked, so the context covers more of the corpus for the same token cost.
+"""
+import numpy as np
+from django.conf import settings
+
+from .ingestion import count_tokens
+
+
+def mmr(query_embedding, vectors, top_k, lambda_mult=None, costs=None, budget=None):
+    """
+    Positions of up to top_k rows of `vectors` (normalized embeddings) in MMR order.
+
+    Each step scores every remaining row at once as
+    lambda * relevance - (1 - lambda) * max similarity to the selected rows, using one
+    precomputed similarity matrix. Relevance is the cosine similarity to the query, or
+    without a query embedding, the row's rank: rows are taken to be ordered best first
+    and relevance falls linearly from 1. With `costs` and `budget`, rows whose cost no
+    longer fits in the remaining budget are skipped.
+    """
+    lambda_mult = settings.MMR_LAMBDA if lambda_mult is None else lambda_mult
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) == 0 or top_k <= 0:
+        return []
+    if query_embedding is None:
+        relevance = 1 - np.arange(len(vectors), dtype=np.float32) / len(vectors)
+    else:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        relevance = vectors @ (query / norm) if norm else np.zeros(len(vectors), dtype=np.float32)
+    similarity = vectors @ vectors.T
+
+    available = np.ones(len(vectors), dtype=bool)
+    remaining = budget
+    if budget is not None:
+        costs = np.asarray(costs)
+        available &= costs <= remaining
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    selected = []
+    while len(selected) < top_k and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy if selected else relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        if budget is not None:
+            remaining -= costs[best]
+            available &= costs <= remaining
+    return selected
+
+
+def fit_token_budget(chunks, budget):
+    """Chunks in their given order, skipping any that would push the context over `budget` tokens."""
+    if not budget:
+        return list(chunks)
+    kept, used = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk.chunk_text)
+        if used + tokens <= budget:
+            kept.append(chunk)
+            used += tokens
+    return kept
+
+
+def diversify_chunks(query_embedding, chunks, vectors, top_k, token_budget=None, lambda_mult=None):
+    """
+    Re-rank candidate chunks (with their embedding rows) by MMR within an optional token
+    budget. With no query embedding the chunks' given order is their relevance.
+    """
+    costs = [count_tokens(chunk.chunk_text) for chunk in chunks] if token_budget else None
+    order = mmr(query_embedding, vectors, top_k, lambda_mult=lambda_mult, costs=costs, budget=token_budget or None)
+    return [chunks[position] for position in order]
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .lexical import invalidate_lexical_index
+from .models import DocumentChunk
+from .vector_index import bump_corpus_generation
+
+
+@receiver(post_save, sender=DocumentChunk)
+@receiver(post_delete, sender=DocumentChunk)
+def refresh_chunk_indexes(sender, instance, **kwargs):
+    bump_corpus_generation(instance.embedding_model)
+    invalidate_lexical_index()
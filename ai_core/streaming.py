@@ -0,0 +1,104 @@
+"""
+Server-sent event responses for the long-form generators.
+
+static/core/js/stream-generate.js posts a generator form with stream=1 and reads
+  event: token   {"text": ...}      each piece of the completion as it arrives
+  event: html    {"html": ...}      the markdown so far rendered to HTML, at most
+                                    every settings.STREAM_RENDER_INTERVAL seconds
+  event: done    {"redirect": ...}  once the content is saved; the page to show it
+  event: error   {"message": ...}
+
+The events are an async iterator, so under ASGI the stream is sent as it is produced
+without holding a thread (Django buffers async streams when served over WSGI).
+"""
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ERROR_MESSAGE = "Generation failed. Please try again."
+
+# Generations still running; holds a reference so the event loop does not drop them
+_generations = set()
+
+
+def wants_stream(request):
+    return request.POST.get('stream') == '1'
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _iterate(pieces):
+    """Iterate `pieces` asynchronously; a sync iterator (llm.stream) is advanced in a worker thread."""
+    if hasattr(pieces, '__aiter__'):
+        async for piece in pieces:
+            yield piece
+        return
+    next_piece = sync_to_async(next, thread_sensitive=False)
+    while (piece := await next_piece(pieces, None)) is not None:
+        yield piece
+
+
+def stream_generation(pieces, render, on_complete, error_message=DEFAULT_ERROR_MESSAGE):
+    """
+    Relay `pieces` (text from llm.stream or llm.astream) to the browser as server-sent events.
+
+    `render(text)` turns the markdown received so far into HTML; `on_complete(text)`
+    saves the finished text and returns the URL that shows it. The completion is read
+    and saved by its own task, so if the browser disconnects mid-stream the content is
+    still saved, and a user who reloads finds it in their saved list instead of paying
+    for it twice.
+    """
+    async def generate(queue):
+        parts = []
+        try:
+            async for piece in _iterate(pieces):
+                parts.append(piece)
+                queue.put_nowait(('token', piece))
+            text = "".join(parts)
+            if not text.strip():
+                raise ValueError("The model returned no content")
+            queue.put_nowait(('done', await sync_to_async(on_complete)(text)))
+        except Exception as e:
+            logger.error(f"Streaming generation failed: {e}")
+            queue.put_nowait(('error', error_message))
+
+    async def events():
+        queue = asyncio.Queue()
+        task = asyncio.create_task(generate(queue))
+        _generations.add(task)
+        task.add_done_callback(_generations.discard)
+        parts = []
+        rendered_at = time.monotonic()
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == 'done':
+                    yield sse_event('done', {'redirect': value})
+                    return
+                if kind == 'error':
+                    yield sse_event('error', {'message': value})
+                    return
+                parts.append(value)
+                yield sse_event('token', {'text': value})
+                if time.monotonic() - rendered_at >= settings.STREAM_RENDER_INTERVAL:
+                    rendered_at = time.monotonic()
+                    yield sse_event('html', {'html': render("".join(parts))})
+        except (asyncio.CancelledError, GeneratorExit):
+            if not task.done():
+                logger.info("Client disconnected during streaming; the content will still be saved")
+            raise
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx, Railway's edge) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,51 @@
+"""
+Handlers of the background jobs (see ai_core/jobs.py).
+
+Each handler takes the claimed Job, does the slow model work its view used to do in the
+request, and returns what the waiting page needs: a `url` to load the saved result, or
+the result itself.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.urls import reverse
+
+from .jobs import PermanentJobError, handler
+from .models import ReportCardImage
+from .views import content_summerization, exam_simulator, image_card
+
+
+@handler('exam.generate')
+async def generate_exam(job):
+    try:
+        session = await exam_simulator.generate_exam_session(job.user_id, job.payload['config_id'])
+    except ObjectDoesNotExist as e:
+        raise PermanentJobError(f"Exam config {job.payload['config_id']} no longer exists") from e
+    return {
+        'session_id': session.id,
+        'url': f"{reverse('ai_core:exam_simulator')}?session_id={session.id}",
+    }
+
+
+@handler('exam.grade_theory')
+async def grade_theory(job):
+    try:
+        return await exam_simulator.grade_theory_session(job.payload['session_id'], job.payload['answers'])
+    except ObjectDoesNotExist as e:
+        raise PermanentJobError(f"Exam session {job.payload['session_id']} no longer exists") from e
+
+
+@handler('summary.generate')
+def generate_summary(job):
+    summarized_content = content_summerization.generate_summary(job.user, job.payload['content'])
+    return {
+        'summarized_content_id': summarized_content.id,
+        'url': content_summerization.SummarizationView().result_url(summarized_content),
+    }
+
+
+@handler('report_card.analyze')
+def analyze_report_card(job):
+    try:
+        report_card = ReportCardImage.objects.get(id=job.payload['report_card_id'])
+    except ReportCardImage.DoesNotExist as e:
+        raise PermanentJobError(f"Report card {job.payload['report_card_id']} no longer exists") from e
+    return {'html': image_card.analyze_report_card(report_card)}
@@ -1,3 +1,1015 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import groq
+import httpx
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import corpus_packs, jobs, llm
+from .ann import IVFIndex
+from .answer_cache import SemanticAnswerCache, filter_scope
+from .caching import LRUCache, TwoLevelCache
+from .coalescing import SingleFlight
+from .dedup import NearDuplicateIndex, find_corpus_duplicates
+from .embeddings import active_embedding_model
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .ingestion import count_tokens
+from .models import AnswerCacheEntry, CorpusPack, DocumentChunk, Job, JobStatus
+from .quantization import build_quantized_index, codes_prefix
+from .reranking import diversify_chunks, fit_token_budget, mmr
+from .utils import embedding_to_bytes
+from .vector_index import (
+    INDEX_ALIGNMENT, VectorIndex, corpus_state, export_vector_index, get_vector_index, load_index_file,
+    read_index_header, write_index_file,
+)
+
+
+def embedding(*values):
+    return embedding_to_bytes(np.array(values, dtype=np.float32))
+
+
+def create_chunk(text, vector, document_type='History Textbook', class_level='', subject=''):
+    return DocumentChunk.objects.create(
+        document_type=document_type, class_level=class_level, subject=subject, chunk_text=text,
+        embedding=embedding(*vector), embedding_model=active_embedding_model(), metadata={},
+    )
+
+
+class TemporaryDirectoryMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+
+class IndexFileTests(TemporaryDirectoryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.directory, 'chunks.idx')
+        self.rows = [
+            (1, embedding(3, 4, 0), 'WAEC Syllabus'),
+            (2, embedding(0, 0, 2), 'WAEC Syllabus'),
+            (5, embedding(1, 0, 0), ('History Textbook', 'SSS', 'History')),
+        ]
+
+    def test_round_trip(self):
+        header = write_index_file(self.path, self.rows, model='test-model', corpus_generation=7)
+
+        self.assertEqual(read_index_header(self.path), header)
+        self.assertEqual((header['count'], header['dim'], header['model'], header['corpus_generation']),
+                         (3, 3, 'test-model', 7))
+        self.assertEqual(header['partitions'], [['WAEC Syllabus', '', ''], ['History Textbook', 'SSS', 'History']])
+        for offset in header['offsets'].values():
+            self.assertEqual(offset % INDEX_ALIGNMENT, 0)
+
+        index = load_index_file(self.path, model='test-model', corpus_generation=7)
+        self.assertIsInstance(index.matrix, np.memmap)
+        self.assertEqual(index.ids.tolist(), [1, 2, 5])
+        np.testing.assert_allclose(index.matrix, [[0.6, 0.8, 0], [0, 0, 1], [1, 0, 0]], rtol=1e-6)
+        self.assertEqual(index.bounds.tolist(), [0, 2, 3])
+        ids, scores = index.search([1, 0, 0], top_k=2)
+        self.assertEqual(ids.tolist(), [5, 1])
+        np.testing.assert_allclose(scores, [1.0, 0.6], rtol=1e-6)
+
+    def test_rewrite_moves_to_the_next_generation(self):
+        first = write_index_file(self.path, self.rows)
+        second = write_index_file(self.path, self.rows[:1])
+
+        self.assertEqual(second['generation'], first['generation'] + 1)
+        self.assertEqual(len(load_index_file(self.path)), 1)
+        self.assertEqual(os.listdir(self.directory), ['chunks.idx'])
+
+    def test_rejects_another_model_or_corpus_generation(self):
+        write_index_file(self.path, self.rows, model='test-model', corpus_generation=7)
+
+        with self.assertRaisesMessage(ValueError, 'embedding model'):
+            load_index_file(self.path, model='other-model')
+        with self.assertRaisesMessage(ValueError, 'corpus generation'):
+            load_index_file(self.path, model='test-model', corpus_generation=8)
+
+    def test_rejects_a_file_that_is_not_an_index(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not an index')
+
+        with self.assertRaises(ValueError):
+            read_index_header(self.path)
+
+    def test_skips_rows_of_another_dimension(self):
+        with self.assertLogs('ai_core.vector_index', 'WARNING'):
+            header = write_index_file(self.path, self.rows + [(6, embedding(1, 0), 'WAEC Syllabus')])
+
+        self.assertEqual(header['count'], 3)
+
+    def test_partitions_must_be_contiguous(self):
+        rows = [self.rows[0], self.rows[2], self.rows[1]]
+
+        with self.assertRaisesMessage(ValueError, 'not contiguous'):
+            write_index_file(self.path, rows)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+@override_settings(VECTOR_INDEX_RECHECK_INTERVAL=0, VECTOR_SEARCH_ENGINE='brute')
+class CorpusGenerationTests(TemporaryDirectoryMixin, TestCase):
+    def test_chunk_changes_move_the_generation(self):
+        generations = [corpus_state()[1]]
+        chunk = create_chunk('The Aro Confederacy', (1, 0, 0))
+        generations.append(corpus_state()[1])
+        chunk.chunk_text = 'The Aro Confederacy and its oracle'
+        chunk.save()
+        generations.append(corpus_state()[1])
+        chunk.delete()
+        generations.append(corpus_state()[1])
+
+        self.assertEqual(generations, sorted(set(generations)))
+
+    def test_index_file_exported_before_a_change_is_not_served(self):
+        path = os.path.join(self.directory, 'chunks.idx')
+        create_chunk('The Aro Confederacy', (1, 0, 0))
+        with override_settings(VECTOR_INDEX_PATH=path):
+            export_vector_index()
+            self.assertEqual(len(get_vector_index()), 1)
+            self.assertIsInstance(get_vector_index().matrix, np.memmap)
+
+            new = create_chunk('The Sokoto Caliphate', (0, 1, 0))
+            with self.assertLogs('ai_core.vector_index', 'WARNING') as logs:
+                index = get_vector_index()
+            self.assertIn('corpus generation', logs.output[0])
+            self.assertEqual(sorted(index.ids.tolist()), sorted(DocumentChunk.objects.values_list('id', flat=True)))
+            self.assertEqual(index.search([0, 1, 0], top_k=1)[0].tolist(), [new.id])
+
+
+class FilteredSearchTests(TestCase):
+    partitions = [
+        ('History Textbook', 'SSS', 'History'),
+        ('WAEC Syllabus', 'SSS', 'History'),
+        ('History Textbook', 'JSS', 'History'),
+        ('History Textbook', 'SSS', 'History'),
+        ('WAEC Syllabus', 'SSS', 'Government'),
+    ]
+    texts = [
+        'The Berlin Conference partitioned Africa in 1884',
+        'Candidates should explain the Berlin Conference and the scramble for Africa',
+        'Africa before the Berlin Conference',
+        'Lord Lugard amalgamated Nigeria in 1914',
+        'The Berlin Conference and the 1999 constitution',
+    ]
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(len(self.partitions), 8)).astype(np.float32)
+        self.ids = [10, 20, 30, 40, 50]
+        self.index = VectorIndex.from_embeddings(self.ids, self.vectors, self.partitions)
+        order = sorted(range(len(self.ids)), key=lambda position: self.partitions[position])
+        self.bm25 = BM25Index.from_rows([(self.ids[p], self.texts[p], self.partitions[p]) for p in order])
+
+    def test_vector_search_only_returns_matching_partitions(self):
+        ids, _ = self.index.search(self.vectors[4], top_k=5, filters={'class_level': 'SSS', 'subject': 'History'})
+
+        self.assertEqual(sorted(ids.tolist()), [10, 20, 40])
+
+    def test_filtered_scores_match_the_unfiltered_search(self):
+        all_ids, all_scores = self.index.search(self.vectors[0], top_k=5, exact=True)
+        ids, scores = self.index.search(self.vectors[0], top_k=5, filters={'document_type': ['WAEC Syllabus']})
+
+        expected = {i: s for i, s in zip(all_ids.tolist(), all_scores.tolist()) if i in (20, 50)}
+        self.assertEqual(ids.tolist(), sorted(expected, key=expected.get, reverse=True))
+        np.testing.assert_allclose(scores, [expected[i] for i in ids.tolist()], rtol=1e-6)
+
+    def test_search_many_applies_the_filter_to_every_query(self):
+        results = self.index.search_many(self.vectors, top_k=5, filters={'class_level': 'JSS'})
+
+        self.assertEqual([ids.tolist() for ids, _ in results], [[30]] * len(self.vectors))
+
+    def test_no_matching_partition_returns_nothing(self):
+        ids, scores = self.index.search(self.vectors[0], filters={'subject': 'Biology'})
+
+        self.assertEqual((len(ids), len(scores)), (0, 0))
+
+    def test_unknown_filter_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'topic'):
+            self.index.search(self.vectors[0], filters={'topic': 'History'})
+
+    def test_bm25_filtered_scores_match_the_unfiltered_search(self):
+        all_ids, all_scores, _ = self.bm25.search('Berlin Conference Africa', top_k=5)
+        ids, scores, coverage = self.bm25.search('Berlin Conference Africa', top_k=5,
+                                                 filters={'class_level': 'SSS', 'subject': 'History'})
+
+        expected = {i: s for i, s in zip(all_ids.tolist(), all_scores.tolist()) if i in (10, 20, 40)}
+        self.assertEqual(ids.tolist(), sorted(expected, key=expected.get, reverse=True))
+        np.testing.assert_allclose(scores, [expected[i] for i in ids.tolist()], rtol=1e-6)
+        self.assertEqual(coverage.tolist(), [1.0, 1.0])
+
+    def test_bm25_rows_must_be_grouped_by_partition(self):
+        rows = [(self.ids[p], self.texts[p], self.partitions[p]) for p in range(len(self.ids))]
+
+        with self.assertRaisesMessage(ValueError, 'not contiguous'):
+            BM25Index.from_rows(rows)
+
+    def test_filter_scope_is_independent_of_order(self):
+        self.assertEqual(filter_scope({'subject': 'History', 'class_level': 'SSS'}), 'class_level=SSS;subject=History')
+        self.assertEqual(filter_scope({'document_type': ['b', 'a']}), 'document_type=a,b')
+        self.assertEqual(filter_scope(None), '')
+
+
+class LexicalSearchTests(TestCase):
+    def setUp(self):
+        self.bm25 = BM25Index.from_rows([
+            (1, 'The Treaty of Versailles was signed in 1919'),
+            (2, 'The treaty ended the First World War'),
+            (3, 'Lagos became a British colony in 1861'),
+        ])
+
+    def test_exact_terms_rank_first_with_their_coverage(self):
+        ids, scores, coverage = self.bm25.search('Treaty of Versailles', top_k=5)
+
+        self.assertEqual(ids.tolist(), [1, 2])
+        self.assertGreater(scores[0], scores[1])
+        self.assertEqual(coverage.tolist(), [1.0, 0.5])
+        self.assertEqual(len(self.bm25.search('Oyo Empire')[0]), 0)
+
+    def test_is_confident_thresholds(self):
+        self.assertTrue(self.bm25.is_confident(np.array([3.0, 2.0]), np.array([1.0, 0.5]), ratio=1.5))
+        self.assertFalse(self.bm25.is_confident(np.array([3.0, 2.0]), np.array([1.0, 0.5]), ratio=1.6))
+        # The best chunk must contain every query term, however far ahead it is
+        self.assertFalse(self.bm25.is_confident(np.array([9.0, 1.0]), np.array([0.5, 0.5]), ratio=1.5))
+        self.assertTrue(self.bm25.is_confident(np.array([0.1]), np.array([1.0]), ratio=1.5))
+        self.assertFalse(self.bm25.is_confident(np.array([]), np.array([]), ratio=1.5))
+
+        ids, scores, coverage = self.bm25.search('Treaty of Versailles')
+        self.assertTrue(self.bm25.is_confident(scores, coverage, ratio=1.5))
+
+    def test_reciprocal_rank_fusion_ordering(self):
+        # 1: 1/61 + 1/62, 3: 1/61 + 1/63, 2: 1/62, 4: 1/63
+        self.assertEqual(reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]]), [1, 3, 2, 4])
+        # Ranked second by both lists beats ranked first by one
+        self.assertEqual(reciprocal_rank_fusion([[5, 6], [7, 6]])[0], 6)
+        self.assertEqual(reciprocal_rank_fusion([[5, 6], [], [6]]), [6, 5])
+        self.assertEqual(reciprocal_rank_fusion([]), [])
+
+
+class RerankingTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(40, 16)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.queries = rng.normal(size=(10, 16)).astype(np.float32)
+        words = 'the aro confederacy traded through the arochukwu oracle across igboland'.split()
+        self.chunks = [SimpleNamespace(chunk_text=f"{' '.join(words[:int(rng.integers(1, len(words)))])} ({i}).")
+                       for i in range(40)]
+
+    def test_mmr_with_lambda_one_is_relevance_order(self):
+        for query in self.queries:
+            relevance = self.vectors @ (query / np.linalg.norm(query))
+            expected = np.argsort(-relevance, kind='stable')[:10].tolist()
+
+            self.assertEqual(mmr(query, self.vectors, 10, lambda_mult=1.0), expected)
+        self.assertEqual(mmr(None, self.vectors, 10, lambda_mult=1.0), list(range(10)))
+
+    def test_mmr_skips_near_copies(self):
+        passage, other = np.eye(3, dtype=np.float32)[:2]
+        vectors = np.array([passage, passage, (passage + other) / np.sqrt(2)])
+        query = passage + 0.1 * other
+
+        self.assertEqual(mmr(query, vectors, 2, lambda_mult=1.0), [0, 1])
+        self.assertEqual(mmr(query, vectors, 2, lambda_mult=0.5), [0, 2])
+
+    def test_token_budget_is_never_exceeded(self):
+        costs = [count_tokens(chunk.chunk_text) for chunk in self.chunks]
+        for budget in (1, 5, 12, 40, 100):
+            kept = fit_token_budget(self.chunks, budget)
+            self.assertLessEqual(sum(count_tokens(chunk.chunk_text) for chunk in kept), budget)
+            # Chunks keep their order; one that does not fit is skipped, not the ones after it
+            self.assertEqual(kept, [chunk for chunk in self.chunks if chunk in kept])
+
+            for query in (self.queries[0], None):
+                order = mmr(query, self.vectors, 40, lambda_mult=0.7, costs=costs, budget=budget)
+                self.assertLessEqual(sum(costs[position] for position in order), budget)
+                diversified = diversify_chunks(query, self.chunks, self.vectors, 40, token_budget=budget)
+                self.assertLessEqual(sum(count_tokens(chunk.chunk_text) for chunk in diversified), budget)
+
+        by_cost = sorted(self.chunks, key=lambda chunk: count_tokens(chunk.chunk_text))
+        small, large = by_cost[0], by_cost[-1]
+        self.assertEqual(fit_token_budget([large, small], count_tokens(small.chunk_text)), [small])
+        self.assertEqual(fit_token_budget(self.chunks, None), self.chunks)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'two-level-cache-tests'}})
+class TwoLevelCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.cache = TwoLevelCache('test-two-level', max_local=2, timeout=60)
+
+    def test_lru_evicts_the_least_recently_used_entry(self):
+        lru = LRUCache(2)
+        lru.set('aro', 1)
+        lru.set('benin', 2)
+        self.assertEqual(lru.get('aro'), 1)
+        lru.set('oyo', 3)
+
+        self.assertEqual((lru.get('aro'), lru.get('benin'), lru.get('oyo')), (1, None, 3))
+        self.assertEqual(len(lru), 2)
+        disabled = LRUCache(0)
+        disabled.set('aro', 1)
+        self.assertEqual(len(disabled), 0)
+
+    def test_evicted_entries_fall_through_to_the_shared_cache(self):
+        for key, value in (('aro', 1), ('benin', 2), ('oyo', 3)):
+            self.cache.set(key, value)
+        self.assertIsNone(self.cache.local.get('aro'))
+
+        self.assertEqual(self.cache.get('aro'), 1)
+        # The shared hit was promoted into the LRU, evicting the least recently used entry
+        self.assertEqual(self.cache.local.get('aro'), 1)
+        self.assertIsNone(self.cache.local.get('benin'))
+        self.assertEqual(self.cache.get('aro'), 1)
+        self.assertEqual(self.cache.get('kano', 'missing'), 'missing')
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (1, 1, 1))
+        self.assertEqual(stats['local_entries'], 2)
+
+    def test_another_worker_reads_entries_from_the_shared_cache(self):
+        self.cache.set('aro', 1)
+        other_worker = TwoLevelCache('test-two-level', max_local=2, timeout=60)
+
+        self.assertEqual(len(other_worker.local), 0)
+        self.assertEqual(other_worker.get('aro'), 1)
+        self.assertIsNone(TwoLevelCache('test-other-namespace').get('aro'))
+
+    def test_shared_cache_failure_is_a_miss(self):
+        self.cache.set('aro', 1)
+        self.cache.local.clear()
+
+        with mock.patch.object(caches['default'], 'get', side_effect=ConnectionError('cache down')), \
+                self.assertLogs('ai_core.caching', 'WARNING'):
+            self.assertIsNone(self.cache.get('aro'))
+
+
+class FilteredIVFSearchTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(3000, 16)).astype(np.float32)
+        partitions = np.array(['History Textbook'] * 3000, dtype=object)
+        partitions[rng.choice(3000, 300, replace=False)] = 'WAEC Syllabus'
+        partitions[rng.choice(np.flatnonzero(partitions == 'History Textbook'), 8, replace=False)] = 'Past Questions'
+        self.waec_ids = set(np.flatnonzero(partitions == 'WAEC Syllabus').tolist())
+        self.index = VectorIndex.from_embeddings(range(3000), self.vectors, list(partitions))
+        self.index.ann = IVFIndex.build(self.index, nprobe=1)
+        self.queries = rng.normal(size=(20, 16)).astype(np.float32)
+
+    def test_filtered_search_returns_top_k_rows_of_the_partition(self):
+        for query in self.queries:
+            ids, scores = self.index.search(query, top_k=10, filters={'document_type': 'WAEC Syllabus'})
+
+            self.assertEqual(len(ids), 10)
+            self.assertLessEqual(set(ids.tolist()), self.waec_ids)
+            self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_small_partition_is_searched_exactly(self):
+        filters = {'document_type': 'Past Questions'}
+        for query in self.queries:
+            ids, _ = self.index.search(query, top_k=5, filters=filters)
+            exact_ids, _ = self.index.search(query, top_k=5, filters=filters, exact=True)
+
+            self.assertEqual(ids.tolist(), exact_ids.tolist())
+
+
+@override_settings(VECTOR_QUANTIZED_RERANK=10, VECTOR_PQ_SUBSPACES=8)
+class QuantizedSearchTests(TemporaryDirectoryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 32))
+        vectors = centers[rng.integers(20, size=1000)] + 0.3 * rng.normal(size=(1000, 32))
+        DocumentChunk.objects.bulk_create([
+            DocumentChunk(document_type='History Textbook', chunk_text=f'chunk {i}', embedding=embedding(*vector),
+                          embedding_model=active_embedding_model(), metadata={})
+            for i, vector in enumerate(vectors)
+        ])
+        self.queries = centers[rng.integers(20, size=20)] + 0.3 * rng.normal(size=(20, 32))
+        self.paths = {
+            'VECTOR_INDEX_PATH': os.path.join(self.directory, 'chunks.idx'),
+            'VECTOR_QUANTIZED_PATH': os.path.join(self.directory, 'chunks.quant.npz'),
+        }
+
+    def recall(self, index, top_k=10):
+        found = 0
+        for query in self.queries:
+            ids, _ = index.search(query, top_k=top_k)
+            exact_ids, _ = index.search(query, top_k=top_k, exact=True)
+            found += len(set(ids.tolist()) & set(exact_ids.tolist()))
+        return found / (top_k * len(self.queries))
+
+    def test_recall_against_exact_search(self):
+        for engine, minimum in (('int8', 0.95), ('pq', 0.9)):
+            with self.subTest(engine=engine), override_settings(VECTOR_SEARCH_ENGINE=engine, **self.paths):
+                export_vector_index()
+                index = get_vector_index()
+
+                self.assertEqual(index.ann.method, engine)
+                self.assertIsInstance(index.ann.codes, np.memmap)
+                self.assertGreaterEqual(self.recall(index), minimum)
+                # The previous engine's codes file was removed when the structure file was replaced
+                prefix = codes_prefix(self.paths['VECTOR_QUANTIZED_PATH'])
+                self.assertEqual(len([name for name in os.listdir(self.directory)
+                                      if os.path.join(self.directory, name).startswith(prefix)]), 1)
+
+    def test_not_used_without_the_index_file(self):
+        with override_settings(VECTOR_SEARCH_ENGINE='int8', **self.paths):
+            build_quantized_index()
+            with self.assertLogs('ai_core.vector_index', 'WARNING') as logs:
+                index = get_vector_index()
+
+        self.assertIsNone(index.ann)
+        self.assertIn('needs the exported index file', logs.output[0])
+
+
+@jobs.handler('test.echo')
+def echo(job):
+    return {'echo': job.payload['value']}
+
+
+@jobs.handler('test.aecho')
+async def aecho(job):
+    return {'echo': job.payload['value']}
+
+
+@jobs.handler('test.fail')
+def fail(job):
+    raise RuntimeError('model timed out')
+
+
+@jobs.handler('test.permanent')
+def fail_permanently(job):
+    raise jobs.PermanentJobError('exam config deleted')
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2, JOB_VISIBILITY_TIMEOUT=600, JOB_RETRY_BACKOFF_BASE=10.0,
+                   JOB_RETRY_BACKOFF_MAX=300.0)
+class JobQueueTests(TestCase):
+    def claim_one(self, worker='worker-1'):
+        claimed = jobs.claim(worker)
+        self.assertEqual(len(claimed), 1)
+        return claimed[0]
+
+    def test_keyed_enqueue_reuses_the_unfinished_job(self):
+        job = jobs.enqueue('test.echo', {'value': 1}, key='exam:1')
+
+        self.assertEqual(jobs.enqueue('test.echo', {'value': 2}, key='exam:1').id, job.id)
+        self.assertNotEqual(jobs.enqueue('test.echo', {'value': 2}, key='exam:2').id, job.id)
+        self.assertNotEqual(jobs.enqueue('test.echo', {'value': 1}).id, jobs.enqueue('test.echo', {'value': 1}).id)
+
+        jobs.run_job(self.claim_one(), 'worker-1')
+        self.assertNotEqual(jobs.enqueue('test.echo', {'value': 1}, key='exam:1').id, job.id)
+
+    def test_database_allows_one_unfinished_job_per_key(self):
+        jobs.enqueue('test.echo', {'value': 1}, key='exam:1')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(kind='test.echo', key='exam:1')
+        Job.objects.create(kind='test.echo', key='exam:1', status=JobStatus.DEAD)
+
+    def test_claim_takes_a_due_job_once(self):
+        job = jobs.enqueue('test.echo', {'value': 1})
+        later = jobs.enqueue('test.echo', {'value': 2})
+        Job.objects.filter(id=later.id).update(run_after=timezone.now() + timedelta(minutes=5))
+
+        claimed = self.claim_one()
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual((claimed.status, claimed.attempts, claimed.locked_by), (JobStatus.RUNNING, 1, 'worker-1'))
+        self.assertGreater(claimed.locked_until, timezone.now() + timedelta(seconds=590))
+        self.assertEqual(jobs.claim('worker-2', limit=5), [])
+
+    def test_claim_filters_by_kind(self):
+        jobs.enqueue('test.fail')
+        job = jobs.enqueue('test.echo', {'value': 1})
+
+        self.assertEqual([claimed.id for claimed in jobs.claim('worker-1', limit=5, kinds=['test.echo'])], [job.id])
+
+    def test_successful_attempt_stores_the_result(self):
+        for kind in ('test.echo', 'test.aecho'):
+            job = jobs.enqueue(kind, {'value': kind})
+            self.assertTrue(jobs.run_job(self.claim_one(), 'worker-1'))
+
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.result, job.locked_by), (JobStatus.SUCCEEDED, {'echo': kind}, ''))
+            self.assertEqual(jobs.describe(job)['result'], {'echo': kind})
+
+    def test_failed_attempt_is_retried_after_a_backoff(self):
+        job = jobs.enqueue('test.fail')
+        before = timezone.now()
+        with self.assertLogs('ai_core.jobs', 'WARNING'):
+            self.assertFalse(jobs.run_job(self.claim_one(), 'worker-1'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JobStatus.QUEUED, 1))
+        self.assertIn('model timed out', job.last_error)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=jobs.retry_delay(1)))
+        self.assertEqual(jobs.claim('worker-1'), [])
+        self.assertEqual([jobs.retry_delay(n) for n in (1, 2, 3, 10)], [10.0, 20.0, 40.0, 300.0])
+
+    def test_job_out_of_attempts_is_dead_lettered_and_can_be_requeued(self):
+        job = jobs.enqueue('test.fail')
+        for attempt in range(2):
+            Job.objects.filter(id=job.id).update(run_after=timezone.now())
+            with self.assertLogs('ai_core.jobs', 'WARNING'):
+                jobs.run_job(self.claim_one(), 'worker-1')
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JobStatus.DEAD, 2))
+        self.assertEqual(jobs.describe(job)['error'], jobs.FAILED_MESSAGE)
+        self.assertNotIn('model timed out', str(jobs.describe(job)))
+
+        self.assertEqual(jobs.requeue(Job.objects.all()), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JobStatus.QUEUED, 0))
+
+    def test_requeue_skips_dead_jobs_whose_key_is_unfinished(self):
+        dead = Job.objects.create(kind='test.echo', key='exam:1', status=JobStatus.DEAD)
+        resubmitted = jobs.enqueue('test.echo', {'value': 1}, key='exam:1')
+        older, newer = (Job.objects.create(kind='test.echo', key='exam:2', status=JobStatus.DEAD) for _ in range(2))
+        Job.objects.filter(id=older.id).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(jobs.requeue(Job.objects.all()), 1)
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[job.id] for job in (dead, resubmitted, older, newer)],
+                         [JobStatus.DEAD, JobStatus.QUEUED, JobStatus.DEAD, JobStatus.QUEUED])
+
+    def test_permanent_error_is_dead_lettered_at_once(self):
+        job = jobs.enqueue('test.permanent')
+        with self.assertLogs('ai_core.jobs', 'ERROR'):
+            jobs.run_job(self.claim_one(), 'worker-1')
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JobStatus.DEAD, 1))
+
+    def test_unregistered_kind_is_dead_lettered(self):
+        job = jobs.enqueue('test.missing')
+        with self.assertLogs('ai_core.jobs', 'ERROR'):
+            jobs.run_job(self.claim_one(), 'worker-1')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DEAD)
+        self.assertIn('No handler registered', job.last_error)
+
+    def test_expired_claim_is_taken_back(self):
+        job = jobs.enqueue('test.echo', {'value': 1})
+        stale = self.claim_one('worker-1')
+        Job.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        with self.assertLogs('ai_core.jobs', 'WARNING'):
+            self.assertEqual(jobs.release_expired(), (1, 0))
+        retry = self.claim_one('worker-2')
+        self.assertEqual(retry.attempts, 2)
+
+        # The first worker finishing late does not overwrite the second worker's attempt
+        with self.assertLogs('ai_core.jobs', 'WARNING') as logs:
+            self.assertFalse(jobs.run_job(stale, 'worker-1'))
+        self.assertIn('result was discarded', logs.output[-1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (JobStatus.RUNNING, 'worker-2'))
+
+        Job.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs('ai_core.jobs', 'WARNING'):
+            self.assertEqual(jobs.release_expired(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.DEAD)
+
+
+class CorpusPackTests(TemporaryDirectoryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        create_chunk('The Aro Confederacy', (1, 0, 0), class_level='SSS', subject='History')
+        create_chunk('The Sokoto Caliphate', (0, 1, 0), class_level='SSS', subject='History')
+        create_chunk('The 1999 constitution', (0, 0, 1), document_type='WAEC Syllabus', subject='Government')
+        self.path = os.path.join(self.directory, 'history-pack')
+        self.manifest = corpus_packs.export_pack(self.path, 'history', '1.0')
+
+    def test_exported_pack_verifies(self):
+        self.assertEqual(corpus_packs.verify_pack(self.path), self.manifest)
+        self.assertEqual((self.manifest['chunks'], self.manifest['dim']), (3, 3))
+        self.assertEqual(self.manifest['checksum'], corpus_packs.pack_checksum(self.manifest['files']))
+
+    def test_modified_file_fails_verification(self):
+        with gzip.open(os.path.join(self.path, corpus_packs.CHUNKS_FILENAME), 'at', encoding='utf-8') as f:
+            f.write(json.dumps({'chunk_text': 'Injected'}) + '\n')
+
+        with self.assertRaisesMessage(ValueError, f'Checksum mismatch for {corpus_packs.CHUNKS_FILENAME}'):
+            corpus_packs.verify_pack(self.path)
+
+    def test_missing_file_fails_verification(self):
+        os.remove(os.path.join(self.path, corpus_packs.EMBEDDINGS_FILENAME))
+
+        with self.assertRaisesMessage(ValueError, 'file missing'):
+            corpus_packs.verify_pack(self.path)
+
+    def test_manifest_checksum_must_match_its_files(self):
+        self.manifest['checksum'] = '0' * 64
+        with open(os.path.join(self.path, corpus_packs.MANIFEST_FILENAME), 'w') as f:
+            json.dump(self.manifest, f)
+
+        with self.assertRaisesMessage(ValueError, 'Pack checksum'):
+            corpus_packs.verify_pack(self.path)
+
+    def test_corrupt_pack_is_not_imported(self):
+        with open(os.path.join(self.path, corpus_packs.EMBEDDINGS_FILENAME), 'r+b') as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b'\xff\xff\xff\xff')
+        DocumentChunk.objects.all().delete()
+
+        with self.assertRaises(ValueError):
+            corpus_packs.import_pack(self.path)
+        self.assertFalse(DocumentChunk.objects.exists())
+        self.assertFalse(CorpusPack.objects.exists())
+
+    def stored_chunks(self):
+        return sorted(
+            (text, class_level, subject, bytes(data)) for text, class_level, subject, data
+            in DocumentChunk.objects.values_list('chunk_text', 'class_level', 'subject', 'embedding')
+        )
+
+    def test_import_restores_the_chunks_and_skips_an_installed_pack(self):
+        expected = self.stored_chunks()
+        DocumentChunk.objects.all().delete()
+
+        result = corpus_packs.import_pack(self.path)
+        self.assertEqual((result['added'], result['skipped']), (3, False))
+        self.assertEqual(self.stored_chunks(), expected)
+        self.assertTrue(corpus_packs.import_pack(self.path)['skipped'])
+        self.assertEqual(DocumentChunk.objects.count(), 3)
+
+
+class NearDuplicateTests(TestCase):
+    passage = (
+        'The Berlin Conference of 1884 to 1885 regulated European colonization and trade in Africa '
+        'and is often seen as the formalization of the Scramble for Africa by the colonial powers'
+    )
+    revised = passage + ' in Africa'
+    history = ('History Textbook', 'SSS', 'History')
+
+    def test_duplicates_are_found_within_a_partition_only(self):
+        index = NearDuplicateIndex()
+
+        self.assertFalse(index.check(self.passage, 'a.pdf', partition=self.history))
+        self.assertTrue(index.check(self.revised, 'b.pdf', partition=self.history))
+        self.assertFalse(index.check(self.revised, 'syllabus.pdf', partition=('WAEC Syllabus', 'SSS', 'History')))
+        self.assertEqual(len(index), 2)
+
+    def test_discarded_source_is_no_longer_matched(self):
+        index = NearDuplicateIndex()
+        index.check(self.passage, 'a.pdf', partition=self.history)
+        index.discard_source('a.pdf')
+
+        self.assertFalse(index.check(self.revised, 'a.pdf', partition=self.history))
+
+    def test_corpus_report_keeps_the_first_chunk_of_each_partition(self):
+        original = create_chunk(self.passage, (1, 0, 0), class_level='SSS', subject='History')
+        duplicate = create_chunk(self.revised, (1, 0, 0), class_level='SSS', subject='History')
+        create_chunk(self.revised, (1, 0, 0), document_type='WAEC Syllabus', class_level='SSS', subject='History')
+
+        self.assertEqual(find_corpus_duplicates(), {duplicate.id: original.id})
+
+
+@override_settings(ANSWER_CACHE_THRESHOLD=0.9, ANSWER_CACHE_TTL=3600, ANSWER_CACHE_MAX_ENTRIES=3,
+                   VECTOR_INDEX_RECHECK_INTERVAL=0)
+class AnswerCacheTests(TestCase):
+    scope = filter_scope({'class_level': 'SSS', 'subject': 'History'})
+
+    def setUp(self):
+        self.cache = SemanticAnswerCache()
+
+    def lookup(self, vector, scope=None):
+        entry = self.cache.lookup(np.array(vector, dtype=np.float32), self.scope if scope is None else scope)
+        return entry.answer if entry is not None else None
+
+    def store(self, answer, vector, scope=None):
+        self.cache.store(answer, np.array(vector, dtype=np.float32), answer, 2.0,
+                         self.scope if scope is None else scope)
+
+    def test_similar_query_above_the_threshold_is_answered(self):
+        self.store('Aro', (1, 0, 0))
+
+        self.assertEqual(self.lookup((1, 0.2, 0)), 'Aro')  # cosine 0.98
+        self.assertIsNone(self.lookup((1, 0.6, 0)))  # cosine 0.86
+        self.assertEqual(AnswerCacheEntry.objects.get().hits, 1)
+
+    def test_answers_are_scoped_by_filter_and_embedding_model(self):
+        self.store('Aro', (1, 0, 0))
+
+        self.assertIsNone(self.lookup((1, 0, 0), scope=''))
+        self.assertIsNone(self.lookup((1, 0, 0), scope=filter_scope({'subject': 'Government'})))
+        AnswerCacheEntry.objects.update(embedding_model='another-model')
+        self.assertIsNone(self.lookup((1, 0, 0)))
+
+    def test_expired_answer_is_not_served_and_is_dropped(self):
+        self.store('Aro', (1, 0, 0))
+        AnswerCacheEntry.objects.update(created_at=timezone.now() - timedelta(hours=2))
+
+        self.assertIsNone(self.lookup((1, 0, 0)))
+        self.store('Sokoto', (0, 1, 0))
+        self.assertEqual(list(AnswerCacheEntry.objects.values_list('answer', flat=True)), ['Sokoto'])
+
+    def test_least_recently_used_answers_are_evicted(self):
+        self.store('Aro', (1, 0, 0))
+        self.store('Sokoto', (0, 1, 0))
+        self.store('Benin', (0, 0, 1))
+        for minutes, answer in ((5, 'Aro'), (4, 'Sokoto'), (3, 'Benin')):
+            AnswerCacheEntry.objects.filter(answer=answer).update(created_at=timezone.now() - timedelta(minutes=minutes))
+        self.assertEqual(self.lookup((1, 0, 0)), 'Aro')
+
+        self.store('Oyo', (1, 1, 0))
+        self.assertEqual(sorted(AnswerCacheEntry.objects.values_list('answer', flat=True)), ['Aro', 'Benin', 'Oyo'])
+
+    def test_corpus_change_retires_cached_answers(self):
+        self.store('Aro', (1, 0, 0))
+        self.assertEqual(self.lookup((1, 0, 0)), 'Aro')
+
+        create_chunk('The Aro Confederacy', (1, 0, 0))
+        self.assertIsNone(self.lookup((1, 0, 0)))
+        self.store('Aro, revised', (1, 0, 0))
+        self.assertEqual(self.lookup((1, 0, 0)), 'Aro, revised')
+        self.assertEqual(AnswerCacheEntry.objects.count(), 1)
+
+    def test_purge_empties_the_cache(self):
+        self.store('Aro', (1, 0, 0))
+        self.assertEqual(self.lookup((1, 0, 0)), 'Aro')
+
+        self.assertEqual(self.cache.purge(), 1)
+        self.assertIsNone(self.lookup((1, 0, 0)))
+
+
+def completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def api_error(error_class, status, headers=None):
+    request = httpx.Request('POST', 'https://api.groq.com/openai/v1/chat/completions')
+    return error_class('upstream error', response=httpx.Response(status, headers=headers, request=request), body=None)
+
+
+@override_settings(LLM_COALESCE=False, LLM_MAX_RETRIES=2, LLM_BACKOFF_BASE=0.5, LLM_BACKOFF_MAX=5.0, LLM_TIMEOUT=30,
+                   LLM_CONNECT_TIMEOUT=5, LLM_FEATURE_TIMEOUTS={'exam_generation': 90})
+class LLMGatewayTests(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.async_client = mock.AsyncMock()
+        patchers = [
+            mock.patch.object(llm, 'get_client', return_value=self.client),
+            mock.patch.object(llm, 'get_async_client', return_value=self.async_client),
+            mock.patch.object(llm.time, 'sleep'),
+            mock.patch.object(llm.asyncio, 'sleep', new_callable=mock.AsyncMock),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sleep, self.async_sleep = llm.time.sleep, llm.asyncio.sleep
+
+    def test_rate_limits_and_server_errors_are_retried(self):
+        replies = lambda: [api_error(groq.RateLimitError, 429, {'retry-after': '60'}),
+                           api_error(groq.InternalServerError, 503), completion('Kano')]
+        self.client.chat.completions.create.side_effect = replies()
+        self.async_client.chat.completions.create.side_effect = replies()
+
+        with self.assertLogs('ai_core.llm', 'WARNING'):
+            self.assertEqual(llm.complete('Where is Gidan Makama?'), 'Kano')
+            self.assertEqual(asyncio.run(llm.acomplete('Where is Gidan Makama?')), 'Kano')
+
+        for create, sleep in ((self.client.chat.completions.create, self.sleep),
+                              (self.async_client.chat.completions.create, self.async_sleep)):
+            self.assertEqual(create.call_count, 3)
+            # Retry-After is honoured up to LLM_BACKOFF_MAX; otherwise a jittered backoff
+            first, second = (call.args[0] for call in sleep.call_args_list)
+            self.assertEqual(first, 5.0)
+            self.assertLessEqual(second, 1.0)
+
+    def test_last_error_is_raised_when_every_attempt_fails(self):
+        self.client.chat.completions.create.side_effect = api_error(groq.InternalServerError, 500)
+
+        with self.assertRaises(groq.InternalServerError), self.assertLogs('ai_core.llm', 'WARNING'):
+            llm.complete('Where is Gidan Makama?')
+        self.assertEqual(self.client.chat.completions.create.call_count, 3)
+
+    def test_other_client_errors_are_not_retried(self):
+        for error_class, status in ((groq.BadRequestError, 400), (groq.AuthenticationError, 401)):
+            self.client.chat.completions.create.side_effect = api_error(error_class, status)
+            self.async_client.chat.completions.create.side_effect = api_error(error_class, status)
+
+            with self.assertRaises(error_class):
+                llm.complete('Where is Gidan Makama?')
+            with self.assertRaises(error_class):
+                asyncio.run(llm.acomplete('Where is Gidan Makama?'))
+        self.assertEqual(self.client.chat.completions.create.call_count, 2)
+        self.assertEqual(self.async_client.chat.completions.create.call_count, 2)
+        self.sleep.assert_not_called()
+        self.async_sleep.assert_not_awaited()
+
+    def test_is_retryable(self):
+        request = httpx.Request('POST', 'https://api.groq.com/openai/v1/chat/completions')
+        self.assertTrue(llm.is_retryable(groq.APIConnectionError(request=request)))
+        self.assertTrue(llm.is_retryable(groq.APITimeoutError(request=request)))
+        self.assertTrue(llm.is_retryable(api_error(groq.RateLimitError, 429)))
+        self.assertTrue(llm.is_retryable(api_error(groq.InternalServerError, 502)))
+        self.assertFalse(llm.is_retryable(api_error(groq.NotFoundError, 404)))
+
+    def test_backoff_delay(self):
+        self.assertEqual(llm.backoff_delay(0, api_error(groq.RateLimitError, 429, {'retry-after': '2'})), 2.0)
+        self.assertEqual(llm.backoff_delay(0, api_error(groq.RateLimitError, 429, {'retry-after': '600'})), 5.0)
+        for attempt, ceiling in ((0, 0.5), (2, 2.0), (10, 5.0)):
+            delays = [llm.backoff_delay(attempt, api_error(groq.RateLimitError, 429, {'retry-after': 'soon'}))
+                      for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+
+    def test_feature_timeout_is_applied(self):
+        self.client.chat.completions.create.return_value = completion('Kano')
+        self.async_client.chat.completions.create.return_value = completion('Kano')
+
+        llm.complete('Where is Gidan Makama?', feature='exam_generation')
+        llm.complete('Where is Gidan Makama?', feature='chat')
+        asyncio.run(llm.acomplete('Where is Gidan Makama?', feature='exam_generation'))
+
+        timeouts = [call.kwargs['timeout'] for call in (*self.client.chat.completions.create.call_args_list,
+                                                         *self.async_client.chat.completions.create.call_args_list)]
+        self.assertEqual(timeouts, [httpx.Timeout(90, connect=5), httpx.Timeout(30, connect=5),
+                                    httpx.Timeout(90, connect=5)])
+
+    def test_strip_code_fences(self):
+        self.assertEqual(llm.strip_code_fences('```json\n[{"question": 1}]\n```'), '[{"question": 1}]')
+        self.assertEqual(llm.strip_code_fences('```\n{"score": 7}```'), '{"score": 7}')
+        self.assertEqual(llm.strip_code_fences('  [1, 2]  '), '[1, 2]')
+        self.assertEqual(llm.strip_code_fences('```'), '')
+
+    def test_complete_json_strips_fences_and_asks_again_for_invalid_json(self):
+        self.client.chat.completions.create.side_effect = [
+            completion('Here are your questions'), completion('```json\n[{"question": "Who led the Aro?"}]\n```'),
+        ]
+        self.async_client.chat.completions.create.return_value = completion('```json\n{"score": 7}\n```')
+
+        with self.assertLogs('ai_core.llm', 'WARNING'):
+            self.assertEqual(llm.complete_json('Write a question'), [{'question': 'Who led the Aro?'}])
+        self.assertEqual(asyncio.run(llm.acomplete_json('Grade this', expect=dict)), {'score': 7})
+
+
+@override_settings(LLM_COALESCE=False)
+class AsyncClientTests(TestCase):
+    def setUp(self):
+        self.clients = []
+        patcher = mock.patch.object(llm, 'new_async_client', self.new_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_client(self):
+        client = mock.AsyncMock()
+        client.chat.completions.create.return_value = completion('Kano')
+        self.clients.append(client)
+        return client
+
+    def test_short_lived_loop_closes_its_client(self):
+        # async_to_sync runs each call on a new event loop, as it does for async job handlers
+        for _ in range(2):
+            self.assertEqual(async_to_sync(llm.acomplete)('Where is Gidan Makama?'), 'Kano')
+
+        self.assertEqual(len(self.clients), 2)
+        for client in self.clients:
+            client.close.assert_awaited_once()
+
+    def test_main_thread_loop_keeps_its_client(self):
+        async def ask_twice():
+            return [await llm.acomplete('Where is Gidan Makama?') for _ in range(2)]
+
+        self.assertEqual(asyncio.run(ask_twice()), ['Kano', 'Kano'])
+        self.assertEqual(len(self.clients), 1)
+        self.clients[0].close.assert_not_awaited()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting for the condition')
+        time.sleep(0.005)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'single-flight-tests'}})
+class SingleFlightTests(TestCase):
+    callers = 8
+
+    def setUp(self):
+        caches['default'].clear()
+        self.flight = SingleFlight('test-flight', poll_interval=0.01)
+        self.calls = 0
+
+    def joined(self, flight=None):
+        """True once every caller has joined the flight, so the leader's call may return."""
+        return (flight or self.flight).counters.totals()['requests'] >= self.callers
+
+    def call(self):
+        self.calls += 1
+        wait_until(self.joined)
+        return 'Kano'
+
+    async def acall(self):
+        self.calls += 1
+        while not self.joined():
+            await asyncio.sleep(0.005)
+        return 'Kano'
+
+    def run_concurrently(self, function):
+        with ThreadPoolExecutor(self.callers) as pool:
+            futures = [pool.submit(function) for _ in range(self.callers)]
+            return [future.exception(timeout=10) or future.result() for future in futures]
+
+    def test_concurrent_identical_calls_make_one_upstream_call(self):
+        self.assertEqual(self.run_concurrently(lambda: self.flight.do('quiz', self.call, 30)), ['Kano'] * self.callers)
+        self.assertEqual(self.calls, 1)
+
+        self.calls = 0
+        results = self.run_concurrently(lambda: asyncio.run(self.flight.ado('quiz', self.acall, 30)))
+        self.assertEqual(results, ['Kano'] * self.callers)
+        self.assertEqual(self.calls, 1)
+
+        stats = self.flight.stats()
+        self.assertEqual((stats['requests'], stats['upstream_calls'], stats['coalesced_local']), (16, 2, 14))
+
+    def test_failed_leader_releases_its_waiters(self):
+        def call():
+            wait_until(self.joined)
+            raise RuntimeError('model timed out')
+
+        async def acall():
+            while not self.joined():
+                await asyncio.sleep(0.005)
+            raise RuntimeError('model timed out')
+
+        for function in (lambda: self.flight.do('quiz', call, 30),
+                         lambda: asyncio.run(self.flight.ado('quiz', acall, 30))):
+            self.flight.reset_stats()
+            errors = self.run_concurrently(function)
+
+            self.assertEqual([str(error) for error in errors], ['model timed out'] * self.callers)
+            self.assertIsNone(caches['default'].get(self.flight._lock_key('quiz')))
+            self.assertEqual(self.flight.stats()['in_flight'], 0)
+        self.assertEqual(self.flight.do('quiz', lambda: 'Kano', 30), 'Kano')
+
+    def test_waiter_takes_over_when_the_other_workers_lock_expires(self):
+        self.callers = 1
+        for function in (lambda: self.flight.do('quiz', self.call, 30),
+                         lambda: asyncio.run(self.flight.ado('quiz', self.acall, 30))):
+            # A worker that died mid-call leaves its lock behind until it expires
+            caches['default'].add(self.flight._lock_key('quiz'), 'dead-worker', 1)
+            self.flight.reset_stats()
+            start = time.monotonic()
+
+            with self.assertLogs('ai_core.coalescing', 'INFO'):
+                self.assertEqual(function(), 'Kano')
+            self.assertGreaterEqual(time.monotonic() - start, 0.9)
+            self.assertEqual(self.flight.stats()['upstream_calls'], 1)
+
+    def test_waiter_uses_the_result_published_by_the_other_worker(self):
+        caches['default'].add(self.flight._lock_key('quiz'), 'other-worker', 30)
+        threading.Timer(0.05, caches['default'].set, (self.flight._result_key('quiz', 'other-worker'), 'Kano')).start()
+
+        self.assertEqual(self.flight.do('quiz', self.call, 30), 'Kano')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.flight.stats()['coalesced_shared'], 1)
+
+    @override_settings(LLM_COALESCE=True)
+    def test_identical_completions_make_one_model_call(self):
+        client, async_client = mock.Mock(), mock.AsyncMock()
+
+        def create(**options):
+            wait_until(lambda: self.joined(llm.single_flight))
+            return completion('Kano')
+
+        async def acreate(**options):
+            while not self.joined(llm.single_flight):
+                await asyncio.sleep(0.005)
+            return completion('Kano')
+
+        client.chat.completions.create.side_effect = create
+        async_client.chat.completions.create.side_effect = acreate
+        prompt = 'Where is  Gidan Makama?'
+        with mock.patch.object(llm, 'get_client', return_value=client), \
+                mock.patch.object(llm, 'new_async_client', return_value=async_client):
+            for function in (lambda: llm.complete(prompt), lambda: asyncio.run(llm.acomplete(' '.join(prompt.split())))):
+                llm.single_flight.reset_stats()
+                self.assertEqual(self.run_concurrently(function), ['Kano'] * self.callers)
+
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+        self.assertEqual(async_client.chat.completions.create.call_count, 1)
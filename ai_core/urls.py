@@ -9,6 +9,8 @@ from ai_core.views.creative_writings import CreativeWritingAssistantView, downlo
     CreativeWritingPromptListView
 from ai_core.views.exam_simulator import ExamSimulatorView, submit_exam, exam_results, exam_history
 from ai_core.views.flashcards import FlashcardGeneratorView
+from ai_core.views.jobs import job_status, job_result
+from ai_core.views.maths_assistant import MathLessonNoteGeneratorView, download_math_lesson
 from ai_core.views.quiz_mode import QuizModeView, save_quiz_score
 
 app_name = 'ai_core'
@@ -23,6 +25,9 @@ urlpatterns = [
          name='download_summarized_content_pdf'),
     path('summarized-content/', SummarizedContentListView.as_view(), name='summarized_content_list'),
 
+    path('math-lesson-note/', MathLessonNoteGeneratorView.as_view(), name='math_lesson_note_generator'),
+    path('download-math-lesson/<int:id>/', download_math_lesson, name='download_math_lesson'),
+
     path('creative_writing/', CreativeWritingAssistantView.as_view(), name='creative_writing'),
     path('download-writing/<int:id>/', download_writing_prompt_pdf, name='download_writing_prompt_pdf'),
     path('creative-writing-prompts/', CreativeWritingPromptListView.as_view(), name='creative_writing_prompt_list'),
@@ -37,4 +42,7 @@ urlpatterns = [
     path('exam/submit/', submit_exam, name='exam_submit'),
     path('exam/results/<int:session_id>/', exam_results, name='exam_results'),
     path('exam/history/', exam_history, name='exam_history'),
+
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('jobs/<int:job_id>/result/', job_result, name='job_result'),
 ]
@@ -7,35 +7,140 @@ import os
 import json
 import math
 import logging
-from PyPDF2 import PdfReader
+import random
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
 from django.conf import settings
 
-from google import genai
+from .embeddings import GEMINI_EMBEDDING_MODEL, active_embedding_model, get_embedding_backend
 
 logger = logging.getLogger(__name__)
 
-# Configure Google GenAI client
-genai_client = genai.Client(api_key=settings.GEMINI_API_KEY)
+# Model of the default (Gemini) backend; use active_embedding_model() for the model in use
+EMBEDDING_MODEL = GEMINI_EMBEDDING_MODEL
 
-EMBEDDING_MODEL = "text-embedding-004"
+# Texts per embed_content request and number of requests in flight during ingestion
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_MAX_WORKERS = 4
+EMBEDDING_MAX_RETRIES = 5
 
 
 def get_embedding(text):
-    """Get embedding vector from Google GenAI."""
-    result = genai_client.models.embed_content(
-        model=EMBEDDING_MODEL,
-        contents=text,
-    )
-    return result.embeddings[0].values
+    """Get embedding vector from the active embedding backend."""
+    return get_embedding_backend().embed([text])[0]
 
 
 def get_query_embedding(text):
-    """Get embedding vector for a query from Google GenAI."""
-    result = genai_client.models.embed_content(
-        model=EMBEDDING_MODEL,
-        contents=text,
-    )
-    return result.embeddings[0].values
+    """
+    Get embedding vector for a query from the active embedding backend.
+    Repeated queries (after case and whitespace normalization) are served from the query embedding cache.
+    """
+    from .caching import make_key, normalize_query, query_embedding_cache
+
+    backend = get_embedding_backend()
+    key = make_key(backend.model, normalize_query(text))
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = np.asarray(backend.embed_query(text), dtype=np.float32)
+        embedding.flags.writeable = False
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+def get_query_embeddings(texts):
+    """
+    Embeddings for several queries, in input order. Cached queries are served from the
+    query embedding cache and all the others are embedded in a single backend call.
+    """
+    from .caching import make_key, normalize_query, query_embedding_cache
+
+    backend = get_embedding_backend()
+    keys = [make_key(backend.model, normalize_query(text)) for text in texts]
+    embeddings = [query_embedding_cache.get(key) for key in keys]
+    missing = {}
+    for key, text, embedding in zip(keys, texts, embeddings):
+        if embedding is None:
+            missing.setdefault(key, text)
+    if missing:
+        for key, vector in zip(missing, _embed_batch(list(missing.values()), backend)):
+            embedding = np.asarray(vector, dtype=np.float32)
+            embedding.flags.writeable = False
+            query_embedding_cache.set(key, embedding)
+            missing[key] = embedding
+        embeddings = [missing[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+    return embeddings
+
+
+def _embed_batch(texts, backend=None):
+    """Embed a list of texts in one backend call, retrying with jittered exponential backoff."""
+    backend = backend or get_embedding_backend()
+    for attempt in range(EMBEDDING_MAX_RETRIES):
+        try:
+            return backend.embed(texts)
+        except Exception as e:
+            if attempt == EMBEDDING_MAX_RETRIES - 1:
+                raise
+            delay = min(30, 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Embedding batch of {len(texts)} failed (attempt {attempt + 1}): {e}; "
+                           f"retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def get_embeddings(texts, batch_size=None, max_workers=None, progress=None, backend=None):
+    """
+    Embed many texts, sending batch_size texts per backend call with up to max_workers
+    calls in flight (defaults come from the backend). Embeddings are returned in input
+    order; progress, if given, is called with the number of texts in each completed batch.
+    """
+    backend = backend or get_embedding_backend()
+    batch_size = batch_size or backend.batch_size
+    max_workers = max_workers or backend.max_workers
+    texts = list(texts)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = [None] * len(batches)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = {executor.submit(_embed_batch, batch, backend): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if progress:
+                progress(len(batches[i]))
+
+    return [embedding for batch in results for embedding in batch]
+
+
+class ThroughputReporter:
+    """
+    Progress callback for get_embeddings that reports chunks done and chunks/s
+    through `write` (e.g. a management command's stdout.write), at most every `interval` seconds.
+    """
+
+    def __init__(self, write, interval=2.0):
+        self.write = write
+        self.interval = interval
+        self.done = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def __call__(self, count):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.write(f"  {self.done} chunks embedded ({self.rate:.1f} chunks/s)")
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return f"{self.done} chunks embedded in {elapsed:.1f}s ({self.rate:.1f} chunks/s)"
 
 
 def cosine_similarity(vec_a, vec_b):
@@ -48,76 +153,165 @@ def cosine_similarity(vec_a, vec_b):
     return dot / (norm_a * norm_b)
 
 
-def embedding_to_bytes(embedding):
-    """Serialize embedding list to bytes for database storage."""
-    return json.dumps(embedding).encode('utf-8')
-
+# Binary embedding format: an 8-byte header (magic, format version, dtype code,
+# dimension) followed by the little-endian vector. Rows written before this
+# format existed hold UTF-8 JSON and are still readable.
+EMBEDDING_MAGIC = b'SE'
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_HEADER = struct.Struct('<2sBBI')
+EMBEDDING_DTYPES = {
+    'float32': (0, np.dtype('<f4')),
+    'float16': (1, np.dtype('<f2')),
+}
+EMBEDDING_DTYPE_CODES = {code: dtype for code, dtype in EMBEDDING_DTYPES.values()}
 
-def embedding_from_bytes(data):
-    """Deserialize embedding from bytes."""
-    return json.loads(data.decode('utf-8'))
 
+def embedding_to_bytes(embedding, dtype=None):
+    """Serialize an embedding vector to the compact binary format for database storage."""
+    dtype = dtype or getattr(settings, 'EMBEDDING_STORAGE_DTYPE', 'float32')
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    code, np_dtype = EMBEDDING_DTYPES[dtype]
+    vector = np.asarray(embedding, dtype=np_dtype).ravel()
+    header = EMBEDDING_HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_FORMAT_VERSION, code, vector.shape[0])
+    return header + vector.tobytes()
 
-def process_pdf_in_batches(pdf_path, document_type, batch_size=100):
-    from .models import DocumentChunk
 
-    reader = PdfReader(pdf_path)
-    text = "".join([page.extract_text() for page in reader.pages])
-    chunks = [text[i:i + 300] for i in range(0, len(text), 300)]
+def embedding_from_bytes(data):
+    """
+    Deserialize an embedding into a read-only numpy array.
+    Binary rows are decoded without copying; legacy JSON rows are parsed.
+    """
+    if bytes(data[:1]) == b'[':
+        return np.asarray(json.loads(bytes(data).decode('utf-8')), dtype=np.float32)
 
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i + batch_size]
-        embeddings = [get_embedding(chunk) for chunk in batch_chunks]
+    magic, version, code, dim = EMBEDDING_HEADER.unpack_from(data)
+    if magic != EMBEDDING_MAGIC or version != EMBEDDING_FORMAT_VERSION:
+        raise ValueError(f"Unknown embedding format (magic={magic!r}, version={version})")
+    if code not in EMBEDDING_DTYPE_CODES:
+        raise ValueError(f"Unknown embedding dtype code: {code}")
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE_CODES[code], count=dim, offset=EMBEDDING_HEADER.size)
 
-        DocumentChunk.objects.bulk_create([
-            DocumentChunk(
-                document_type=document_type,
-                chunk_text=chunk,
-                embedding=embedding_to_bytes(embedding),
-                metadata={"source": pdf_path}
-            )
-            for chunk, embedding in zip(batch_chunks, embeddings)
-        ])
 
+def search_similar_chunks(query, chunks=None, top_k=5, filters=None, diversify=False, token_budget=None):
+    """
+    Search for the chunks most similar to the query.
 
-def update_pdf_data(pdf_path, document_type):
-    from .models import DocumentChunk
+    With no explicit chunks the process-wide indexes are used. In 'hybrid' mode
+    (settings.RETRIEVAL_MODE) BM25 and vector rankings are fused with reciprocal rank
+    fusion, and a confident lexical match is returned without any embedding call.
+    With explicit chunks a temporary vector index is built over them.
 
-    reader = PdfReader(pdf_path)
-    text = "".join([page.extract_text() for page in reader.pages])
-    chunks = [text[i:i + 300] for i in range(0, len(text), 300)]
+    `filters` restricts retrieval to partitions by document_type, class_level and/or
+    subject, e.g. {'document_type': ['WAEC Syllabus', 'History Textbook']}; only the
+    matching partitions of the indexes are scored.
 
-    for chunk in chunks:
-        if not DocumentChunk.objects.filter(chunk_text=chunk, document_type=document_type).exists():
-            embedding = get_embedding(chunk)
-            DocumentChunk.objects.create(
-                document_type=document_type,
-                chunk_text=chunk,
-                embedding=embedding_to_bytes(embedding),
-                metadata={"source": pdf_path}
-            )
+    Ranked chunk ids are cached per normalized query, keyed by the vector index
+    generation and the lexical corpus state, so a rebuilt index never serves stale ids.
 
+    With diversify=True, top_k * settings.MMR_CANDIDATES candidates are retrieved and
+    re-ranked by maximal marginal relevance over their in-memory embeddings (see
+    ai_core.reranking), so near-copies of one passage do not fill the results. Lexical
+    and hybrid rankings are diversified by rank, so they still need no query embedding.
+    `token_budget` caps the total tokens of the returned chunks.
+    """
+    from .reranking import diversify_chunks, fit_token_budget
+    from .vector_index import VectorIndex
+
+    if chunks is not None:
+        chunk_map = {chunk.id: chunk for chunk in chunks}
+        index = VectorIndex.from_rows(
+            (chunk.id, chunk.embedding, (chunk.document_type, chunk.class_level, chunk.subject))
+            for chunk in chunk_map.values()
+        )
+        query_embedding = get_query_embedding(query)
+        fetch_k = top_k * settings.MMR_CANDIDATES if diversify else top_k
+        ids, _ = index.search(query_embedding, top_k=fetch_k, filters=filters)
+        found = [chunk_map[chunk_id] for chunk_id in ids.tolist() if chunk_id in chunk_map]
+        if diversify:
+            return diversify_chunks(query_embedding, found, index.vectors([chunk.id for chunk in found]), top_k,
+                                    token_budget)
+        return fit_token_budget(found, token_budget)
+
+    return search_similar_chunks_many([query], top_k=top_k, filters=filters, diversify=diversify,
+                                      token_budget=token_budget)[0]
+
+
+def search_similar_chunks_many(queries, top_k=5, filters=None, diversify=False, token_budget=None):
+    """
+    Retrieve chunks for several queries at once; returns one list of chunks per query, in order.
 
-def search_similar_chunks(query, chunks=None, top_k=5):
-    """Search for similar chunks using cosine similarity (replaces FAISS)."""
+    Uses the same indexes and result cache as search_similar_chunks, but the queries
+    that need vector search are embedded in one backend call and scored with one
+    matrix-matrix product, and all result chunks are loaded with a single query.
+    `diversify` and `token_budget` behave as in search_similar_chunks.
+    """
+    from .caching import make_key, normalize_query, retrieval_cache
     from .models import DocumentChunk
-
-    if chunks is None:
-        chunks = DocumentChunk.objects.all()
-
-    query_embedding = get_query_embedding(query)
-
-    scored_chunks = []
-    for chunk in chunks:
-        try:
-            chunk_embedding = embedding_from_bytes(chunk.embedding)
-            score = cosine_similarity(query_embedding, chunk_embedding)
-            scored_chunks.append((score, chunk))
-        except Exception:
-            continue
-
-    scored_chunks.sort(key=lambda x: x[0], reverse=True)
-    return [chunk for _, chunk in scored_chunks[:top_k]]
+    from .lexical import get_lexical_index
+    from .reranking import diversify_chunks, fit_token_budget
+    from .vector_index import get_vector_index
+
+    results_k = top_k
+    if diversify:
+        top_k = top_k * settings.MMR_CANDIDATES
+    mode = settings.RETRIEVAL_MODE
+    vector_index = get_vector_index() if mode != 'lexical' else None
+    lexical = get_lexical_index() if mode != 'vector' else None
+    filter_key = sorted(
+        (field, values if isinstance(values, str) else sorted(values)) for field, values in (filters or {}).items()
+    )
+    keys = [
+        make_key(
+            active_embedding_model(), mode, settings.VECTOR_SEARCH_ENGINE, top_k, normalize_query(query), filter_key,
+            vector_index.generation if vector_index else None, lexical.state if lexical else None,
+        )
+        for query in queries
+    ]
+    ranked = [retrieval_cache.get(key) for key in keys]
+    misses = [position for position, ids in enumerate(ranked) if ids is None]
+    if misses:
+        fresh = _rank_chunk_ids_many([queries[position] for position in misses], top_k, mode,
+                                     vector_index, lexical, filters)
+        for position, ids in zip(misses, fresh):
+            ranked[position] = ids
+            retrieval_cache.set(keys[position], ids)
+
+    chunk_map = DocumentChunk.objects.defer('embedding').in_bulk({chunk_id for ids in ranked for chunk_id in ids})
+    results = [[chunk_map[chunk_id] for chunk_id in ids if chunk_id in chunk_map] for ids in ranked]
+    if not diversify:
+        return [fit_token_budget(found, token_budget) for found in results]
+
+    vector_index = vector_index or get_vector_index()
+    query_embeddings = get_query_embeddings(queries) if mode == 'vector' else [None] * len(queries)
+    return [
+        diversify_chunks(query_embedding, found, vector_index.vectors([chunk.id for chunk in found]), results_k,
+                         token_budget)
+        for query_embedding, found in zip(query_embeddings, results)
+    ]
+
+
+def _rank_chunk_ids_many(queries, top_k, mode, vector_index, lexical, filters=None):
+    """Chunk ids ranked by the configured retrieval mode, best first, for each query."""
+    from .lexical import reciprocal_rank_fusion
+
+    if mode == 'vector':
+        results = vector_index.search_many(get_query_embeddings(queries), top_k=top_k, filters=filters)
+        return [ids.tolist() for ids, _ in results]
+
+    candidates = top_k * settings.HYBRID_CANDIDATE_MULTIPLIER
+    ranked, pending = [], []
+    for position, query in enumerate(queries):
+        lexical_ids, lexical_scores, coverage = lexical.search(query, top_k=candidates, filters=filters)
+        ranked.append(lexical_ids.tolist())
+        if mode != 'lexical' and not lexical.is_confident(lexical_scores, coverage, settings.LEXICAL_CONFIDENCE_RATIO):
+            pending.append(position)
+    if pending:
+        embeddings = get_query_embeddings([queries[position] for position in pending])
+        for position, (vector_ids, _) in zip(pending, vector_index.search_many(embeddings, top_k=candidates,
+                                                                                 filters=filters)):
+            ranked[position] = reciprocal_rank_fusion([vector_ids.tolist(), ranked[position]])
+    return [ids[:top_k] for ids in ranked]
 
 
 def generate_pdf(html_content, output_filename='document.pdf', options=None):
@@ -0,0 +1,597 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_lock = threading.Lock()
+_stale = True
+_generations = {}
+
+# On-disk index layout: a fixed header region (magic, header length, JSON header)
+# followed by the float32 matrix, int64 ids and int32 partition codes, each starting
+# on a 64-byte boundary so they can be memory-mapped directly. Rows are grouped by
+# partition, so each partition is one contiguous slice of the matrix.
+INDEX_MAGIC = b'SPIDX001'
+INDEX_FORMAT_VERSION = 2
+INDEX_HEADER_SIZE = 65536
+INDEX_ALIGNMENT = 64
+
+# Chunk attributes the index is partitioned by; search filters may name any of them
+PARTITION_FIELDS = ('document_type', 'class_level', 'subject')
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row in place; all-zero rows are left as zeros."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def partition_key(value):
+    """
+    Partition of a chunk as a (document_type, class_level, subject) tuple;
+    a plain string is taken as a document type with no class level or subject.
+    """
+    if isinstance(value, str):
+        value = (value,)
+    value = tuple(part or '' for part in value)
+    return value + ('',) * (len(PARTITION_FIELDS) - len(value))
+
+
+def select_partitions(partitions, filters):
+    """
+    Codes of the partitions matching every filter, or None when there are no filters.
+    Filters map a PARTITION_FIELDS name to a value or a collection of accepted values.
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(PARTITION_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown retrieval filter(s): {', '.join(sorted(unknown))}")
+    wanted = [
+        (PARTITION_FIELDS.index(field), {values} if isinstance(values, str) else set(values))
+        for field, values in filters.items()
+    ]
+    return [
+        code for code, key in enumerate(partitions)
+        if all(key[position] in values for position, values in wanted)
+    ]
+
+
+def top_k_positions(scores, top_k):
+    """Positions of the top_k scores, best first."""
+    k = min(top_k, len(scores))
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class VectorIndex:
+    """
+    All chunk embeddings held as one pre-normalized float32 matrix.
+
+    Scoring a query is a single matrix-vector product and the top-k rows are
+    selected with argpartition, so the cost no longer involves per-row Python work.
+    The matrix may live in process memory or be a read-only memory map of an index file.
+
+    Rows are grouped by partition (document type, class level, subject): `partitions`
+    lists the partition keys and `bounds[code]:bounds[code + 1]` is the slice of rows in
+    partition `code`, so a filtered search only reads the matching slices.
+    """
+
+    def __init__(self, ids, matrix, partition_codes=None, partitions=None, state=None, generation=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+        self.partition_codes = (
+            np.asarray(partition_codes, dtype=np.int32) if partition_codes is not None
+            else np.zeros(len(self.ids), dtype=np.int32)
+        )
+        self.partitions = [tuple(key) for key in partitions] if partitions else [partition_key('')]
+        self.bounds = np.searchsorted(self.partition_codes, np.arange(len(self.partitions) + 1))
+        self.state = state
+        self.generation = generation
+        self.ann = None
+        self._id_order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    @classmethod
+    def from_embeddings(cls, ids, embeddings, partitions=None, state=None, generation=None):
+        """
+        Build an index from parallel sequences of ids, raw embedding vectors and partitions
+        (see partition_key); rows are regrouped by partition.
+        """
+        ids = list(ids)
+        if not ids:
+            return cls(ids, np.zeros((0, 0), dtype=np.float32), state=state, generation=generation)
+        keys = [partition_key(p) for p in partitions] if partitions is not None else [partition_key('')] * len(ids)
+        names = sorted(set(keys))
+        lookup = {key: code for code, key in enumerate(names)}
+        codes = np.array([lookup[key] for key in keys], dtype=np.int32)
+        order = np.argsort(codes, kind='stable')
+        matrix = normalize_rows(np.array(embeddings, dtype=np.float32)[order])
+        return cls(np.asarray(ids, dtype=np.int64)[order], matrix, codes[order], names,
+                   state=state, generation=generation)
+
+    @classmethod
+    def from_rows(cls, rows, state=None, generation=None):
+        """
+        Build an index from (id, serialized embedding, partition) rows.
+        Rows that cannot be decoded or whose dimension differs from the first row are skipped.
+        """
+        ids, embeddings, partitions = [], [], []
+        for chunk_id, embedding, partition in iter_decoded_rows(rows):
+            ids.append(chunk_id)
+            embeddings.append(embedding)
+            partitions.append(partition)
+        return cls.from_embeddings(ids, embeddings, partitions, state=state, generation=generation)
+
+    @classmethod
+    def from_queryset(cls, queryset, state=None, generation=None):
+        return cls.from_rows(chunk_rows(queryset), state=state, generation=generation)
+
+    def select_partitions(self, filters):
+        return select_partitions(self.partitions, filters)
+
+    def row_ranges(self, codes=None):
+        """(start, end) row slices of the given partition codes; the whole index when codes is None."""
+        if codes is None:
+            return [(0, len(self))]
+        return [(int(self.bounds[code]), int(self.bounds[code + 1])) for code in codes]
+
+    def partition_stats(self):
+        """Row count of every partition in the index."""
+        return [
+            {**dict(zip(PARTITION_FIELDS, key)), 'chunks': int(self.bounds[code + 1] - self.bounds[code])}
+            for code, key in enumerate(self.partitions)
+        ]
+
+    def vectors(self, ids):
+        """Normalized embedding rows of the given chunk ids, in order; zero rows for ids not in the index."""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.zeros((len(ids), self.dim), dtype=np.float32)
+        if len(self) == 0 or len(ids) == 0:
+            return rows
+        positions = np.searchsorted(self.ids, ids, sorter=self._id_order).clip(max=len(self) - 1)
+        found = self.ids[self._id_order[positions]] == ids
+        if found.any():
+            rows[found] = self.matrix[self._id_order[positions[found]]]
+        return rows
+
+    def search(self, query_embedding, top_k=5, exact=False, filters=None):
+        """
+        Return (ids, scores) of the top_k rows by cosine similarity, best first.
+        With filters only the matching partitions are scored.
+        Uses the attached approximate index when there is one, unless exact=True.
+        """
+        codes = self.select_partitions(filters)
+        if len(self) == 0 or top_k <= 0 or codes == []:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.ann is not None and not exact:
+            return self.ann.search(self, query_embedding, top_k=top_k, partitions=codes)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != self.dim:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = query / norm
+
+        if codes is None:
+            scores = self.matrix @ query
+            top = top_k_positions(scores, top_k)
+            return self.ids[top], scores[top]
+
+        ranges = self.row_ranges(codes)
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([self.matrix[start:end] @ query for start, end in ranges])
+        top = top_k_positions(scores, top_k)
+        return self.ids[rows[top]], scores[top]
+
+    def search_many(self, query_embeddings, top_k=5, exact=False, filters=None):
+        """
+        Search several queries at once; returns one (ids, scores) pair per query, in order.
+        The exact path scores every query with a single matrix-matrix product, so the
+        index rows are read once for the whole batch instead of once per query.
+        """
+        codes = self.select_partitions(filters)
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if len(self) == 0 or top_k <= 0 or codes == []:
+            return [empty for _ in query_embeddings]
+        if self.ann is not None and not exact:
+            return [self.ann.search(self, query, top_k=top_k, partitions=codes) for query in query_embeddings]
+
+        valid, queries = [], []
+        for position, query in enumerate(query_embeddings):
+            query = np.asarray(query, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm != 0 and query.shape == (self.dim,):
+                valid.append(position)
+                queries.append(query / norm)
+        results = [empty for _ in query_embeddings]
+        if not queries:
+            return results
+
+        queries = np.stack(queries, axis=1)
+        if codes is None:
+            rows = None
+            scores = self.matrix @ queries
+        else:
+            ranges = self.row_ranges(codes)
+            rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+            scores = np.concatenate([self.matrix[start:end] @ queries for start, end in ranges])
+        for column, position in enumerate(valid):
+            column_scores = scores[:, column]
+            top = top_k_positions(column_scores, top_k)
+            results[position] = (self.ids[top if rows is None else rows[top]], column_scores[top])
+        return results
+
+
+def chunk_rows(queryset):
+    """(id, serialized embedding, partition key) rows of a DocumentChunk queryset, grouped by partition."""
+    rows = (
+        queryset.order_by(*PARTITION_FIELDS, 'id')
+        .values_list('id', 'embedding', *PARTITION_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+    return ((chunk_id, embedding, tuple(key)) for chunk_id, embedding, *key in rows)
+
+
+def iter_decoded_rows(rows):
+    """
+    Decode (id, serialized embedding, partition) rows, skipping unreadable
+    embeddings and any whose dimension differs from the first good row.
+    """
+    from .utils import embedding_from_bytes
+
+    dim = None
+    for chunk_id, data, partition in rows:
+        try:
+            embedding = embedding_from_bytes(data)
+        except Exception as e:
+            logger.warning(f"Skipping chunk {chunk_id} with unreadable embedding: {e}")
+            continue
+        if dim is None:
+            dim = len(embedding)
+        elif len(embedding) != dim:
+            logger.warning(f"Skipping chunk {chunk_id}: dimension {len(embedding)} != {dim}")
+            continue
+        yield chunk_id, embedding, partition
+
+
+def _align(offset):
+    return (offset + INDEX_ALIGNMENT - 1) // INDEX_ALIGNMENT * INDEX_ALIGNMENT
+
+
+def read_index_header(path):
+    with open(path, 'rb') as f:
+        head = f.read(INDEX_HEADER_SIZE)
+    if head[:8] != INDEX_MAGIC:
+        raise ValueError(f"{path} is not a vector index file")
+    length = int.from_bytes(head[8:12], 'little')
+    return json.loads(head[12:12 + length].decode('utf-8'))
+
+
+def write_index_file(path, rows, model=None, corpus_generation=None):
+    """
+    Export (id, serialized embedding, partition) rows to an index file.
+
+    Rows must arrive grouped by partition (see chunk_rows). They are normalized and
+    streamed to a temporary file next to `path`, which is then atomically renamed
+    into place so running workers never see a partial file. `corpus_generation` records
+    the state of the chunks the rows were read at (see corpus_state). Returns the header of the new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    generation = 1
+    if os.path.exists(path):
+        try:
+            generation = read_index_header(path)['generation'] + 1
+        except (ValueError, KeyError, OSError):
+            pass
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    ids, partition_codes, partitions = [], [], {}
+    dim = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(b'\0' * INDEX_HEADER_SIZE)
+            for chunk_id, embedding, partition in iter_decoded_rows(rows):
+                key = partition_key(partition)
+                if key not in partitions:
+                    partitions[key] = len(partitions)
+                elif partitions[key] != len(partitions) - 1:
+                    raise ValueError(f"Rows for partition {key} are not contiguous")
+                vector = np.array(embedding, dtype='<f4')
+                norm = np.linalg.norm(vector)
+                if norm:
+                    vector /= norm
+                dim = vector.shape[0]
+                f.write(vector.tobytes())
+                ids.append(chunk_id)
+                partition_codes.append(partitions[key])
+
+            matrix_offset = INDEX_HEADER_SIZE
+            ids_offset = _align(matrix_offset + len(ids) * dim * 4)
+            partitions_offset = _align(ids_offset + len(ids) * 8)
+
+            f.write(b'\0' * (ids_offset - f.tell()))
+            f.write(np.asarray(ids, dtype='<i8').tobytes())
+            f.write(b'\0' * (partitions_offset - f.tell()))
+            f.write(np.asarray(partition_codes, dtype='<i4').tobytes())
+
+            header = {
+                'version': INDEX_FORMAT_VERSION,
+                'generation': generation,
+                'count': len(ids),
+                'dim': dim,
+                'model': model,
+                'corpus_generation': corpus_generation,
+                'partitions': [list(key) for key in partitions],
+                'offsets': {'matrix': matrix_offset, 'ids': ids_offset, 'partitions': partitions_offset},
+            }
+            encoded = json.dumps(header).encode('utf-8')
+            if 12 + len(encoded) > INDEX_HEADER_SIZE:
+                raise ValueError("Vector index header does not fit in the reserved header region")
+            f.seek(0)
+            f.write(INDEX_MAGIC + len(encoded).to_bytes(4, 'little') + encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return header
+
+
+def load_index_file(path, state=None, model=None, corpus_generation=None):
+    """
+    Open an index file as a VectorIndex whose arrays are read-only memory maps.
+    With `model`, a file built from another embedding model is rejected, and with
+    `corpus_generation` one exported before the chunks last changed.
+    """
+    header = read_index_header(path)
+    if header['version'] != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector index version: {header['version']}")
+    if model is not None and header['model'] != model:
+        raise ValueError(f"index was built with embedding model {header['model']}, not {model}")
+    if corpus_generation is not None and header.get('corpus_generation') != corpus_generation:
+        raise ValueError(
+            f"index was exported at corpus generation {header.get('corpus_generation')}, "
+            f"the chunks are now at {corpus_generation}"
+        )
+
+    count, dim, offsets = header['count'], header['dim'], header['offsets']
+    if count == 0:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+        ids = partition_codes = np.zeros(0, dtype=np.int64)
+    else:
+        matrix = np.memmap(path, dtype='<f4', mode='r', offset=offsets['matrix'], shape=(count, dim))
+        ids = np.memmap(path, dtype='<i8', mode='r', offset=offsets['ids'], shape=(count,))
+        partition_codes = np.memmap(path, dtype='<i4', mode='r', offset=offsets['partitions'], shape=(count,))
+    return VectorIndex(ids, matrix, partition_codes, header['partitions'], state=state,
+                       generation=header['generation'])
+
+
+def model_chunks():
+    """DocumentChunk rows embedded by the active embedding model; indexes never mix models."""
+    from .embeddings import active_embedding_model
+    from .models import DocumentChunk
+
+    return DocumentChunk.objects.filter(embedding_model=active_embedding_model())
+
+
+def export_vector_index(path=None, build_engine=True):
+    """
+    Write the active model's DocumentChunk embeddings to the shared index file and return its header.
+    Unless build_engine is False, the configured engine's IVF or quantized structure is
+    rebuilt for the new generation (see build_engine_index), since the previous one no longer matches it.
+    """
+    from .embeddings import active_embedding_model
+
+    path = path or settings.VECTOR_INDEX_PATH
+    model = active_embedding_model()
+    _generations.pop(model, None)
+    corpus_generation = corpus_state()[1]
+    rows = chunk_rows(model_chunks())
+    header = write_index_file(path, rows, model=model, corpus_generation=corpus_generation)
+    if build_engine and header['count']:
+        build_engine_index(path)
+    return header
+
+
+def build_engine_index(index_path=None):
+    """
+    Rebuild the persisted structure of the configured engine (IVF or quantized) from the
+    index file at `index_path` and return it; None for the brute engine or when the build
+    fails, in which case searches fall back to the exact scan.
+    """
+    from .ann import build_ivf_index
+    from .quantization import QUANTIZERS, build_quantized_index
+
+    engine = settings.VECTOR_SEARCH_ENGINE
+    try:
+        if engine == 'ivf':
+            return build_ivf_index(index_path=index_path)
+        if engine in QUANTIZERS:
+            return build_quantized_index(engine, index_path=index_path)
+    except ValueError as e:
+        logger.error(f"Could not rebuild the {engine} index ({e}); searches use the exact scan")
+    return None
+
+
+def bump_corpus_generation(*models):
+    """
+    Record that DocumentChunk rows embedded by `models` (default: the active model) were
+    saved, updated or deleted, so every process rebuilds its indexes of them. The
+    DocumentChunk signals call this; bulk writes, which send no signals, must call it themselves.
+    The counter is updated in the caller's transaction, so other processes see the new
+    generation together with the rows.
+    """
+    from .embeddings import active_embedding_model
+    from .models import CorpusGeneration
+
+    for model in set(models or (active_embedding_model(),)):
+        counter, created = CorpusGeneration.objects.get_or_create(embedding_model=model, defaults={'generation': 1})
+        if not created:
+            CorpusGeneration.objects.filter(id=counter.id).update(generation=F('generation') + 1)
+        _generations.pop(model, None)
+    invalidate_vector_index()
+
+
+def corpus_state():
+    """
+    Fingerprint of the chunks embedded by the active model: (model, generation). The
+    generation moves on every change (see bump_corpus_generation), including in-place
+    updates made by other processes. It is re-read from the database at most every
+    VECTOR_INDEX_RECHECK_INTERVAL seconds; changes made in this process are seen at once.
+    """
+    from .embeddings import active_embedding_model
+    from .models import CorpusGeneration
+
+    model = active_embedding_model()
+    cached = _generations.get(model)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < settings.VECTOR_INDEX_RECHECK_INTERVAL:
+        return model, cached[0]
+    generation = (CorpusGeneration.objects.filter(embedding_model=model)
+                  .values_list('generation', flat=True).first()) or 0
+    _generations[model] = (generation, now)
+    return model, generation
+
+
+def _file_state(path):
+    """Identity of a file; changes whenever a new generation is renamed into place."""
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def engine_path(index_path=None, engine=None):
+    """
+    File holding the persisted search structure of `engine` (default: the configured one),
+    if it has one. The structure of an index file other than settings.VECTOR_INDEX_PATH
+    is kept next to that file.
+    """
+    engine = engine or settings.VECTOR_SEARCH_ENGINE
+    if engine == 'ivf':
+        default, suffix = settings.VECTOR_IVF_PATH, '.ivf.npz'
+    elif engine in ('int8', 'pq'):
+        default, suffix = settings.VECTOR_QUANTIZED_PATH, '.quant.npz'
+    else:
+        return None
+    if index_path is None or os.path.abspath(index_path) == os.path.abspath(settings.VECTOR_INDEX_PATH):
+        return default
+    return os.path.splitext(index_path)[0] + suffix
+
+
+def _attach_ann(index):
+    """
+    Attach the persisted IVF or quantized index when that engine is enabled and
+    the structure was built from this index generation.
+    """
+    from .ann import IVFIndex
+    from .quantization import load_quantized_index
+
+    engine, path = settings.VECTOR_SEARCH_ENGINE, engine_path()
+    if path is None or not os.path.exists(path):
+        return
+    if engine != 'ivf' and not isinstance(index.matrix, np.memmap):
+        # The re-rank would keep the full float32 matrix in memory next to the codes
+        logger.warning(f"The {engine} engine needs the exported index file (run build_vector_index); "
+                       f"using exact search")
+        return
+    if engine == 'ivf':
+        ann = IVFIndex.load(path, nprobe=settings.VECTOR_IVF_NPROBE)
+    else:
+        ann = load_quantized_index(path)
+        if ann.method != engine:
+            logger.warning(f"{path} holds a {ann.method} index, not {engine}; falling back to exact search")
+            return
+    if ann.index_generation != str(index.generation):
+        logger.warning(
+            f"{engine} index was built for generation {ann.index_generation}, not {index.generation}; "
+            f"falling back to exact search"
+        )
+        return
+    index.ann = ann
+
+
+def invalidate_vector_index():
+    """Mark the in-process index as stale; it is rebuilt on the next search."""
+    global _stale
+    _stale = True
+
+
+def get_vector_index():
+    """
+    Return the process-wide index.
+
+    When an exported index file exists (see the build_vector_index command) it is
+    memory-mapped so every worker shares one copy through the OS page cache, and a
+    newer generation is picked up as soon as it is renamed into place. Otherwise, or
+    once chunks changed after the file was exported, the index is built from
+    DocumentChunk and rebuilt whenever the corpus generation moves. Either way it only
+    holds chunks embedded by the active embedding model.
+    """
+    global _index, _stale
+
+    path = settings.VECTOR_INDEX_PATH
+    model, corpus_generation = corpus_state()
+    file_state = _file_state(path)
+    if file_state is not None:
+        file_state = ('file', file_state, _file_state(engine_path()), model, corpus_generation)
+        if _index is not None and _index.state == file_state:
+            return _index
+        with _index_lock:
+            if _index is None or _index.state != file_state:
+                try:
+                    index = load_index_file(path, state=file_state, model=model,
+                                            corpus_generation=corpus_generation)
+                except ValueError as e:
+                    logger.warning(f"Ignoring {path} ({e}); run build_vector_index to rewrite it")
+                    index = VectorIndex.from_queryset(
+                        model_chunks(), state=file_state, generation=f"db-{corpus_generation}"
+                    )
+                _attach_ann(index)
+                _index = index
+                logger.info(f"Loaded vector index generation {_index.generation} with {len(_index)} chunks")
+            return _index
+
+    state = (model, corpus_generation, _file_state(engine_path()))
+    if _index is not None and not _stale and _index.state == state:
+        return _index
+
+    with _index_lock:
+        if _index is not None and not _stale and _index.state == state:
+            return _index
+        _stale = False
+        index = VectorIndex.from_queryset(
+            model_chunks(), state=state, generation=f"db-{corpus_generation}"
+        )
+        _attach_ann(index)
+        _index = index
+        logger.info(f"Built vector index with {len(_index)} chunks")
+        return _index
@@ -1,17 +1,18 @@
 
-import os
+import asyncio
+import logging
+import time
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views import View
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from ai_core.utils import search_similar_chunks
+from ai_core.answer_cache import answer_cache, filter_scope
+from ai_core.llm import acomplete
+from ai_core.utils import get_query_embedding, get_query_embeddings, search_similar_chunks, search_similar_chunks_many
 from ai_core.models import DocumentChunk
 
-# Set up LangChain Groq with Llama
-from django.conf import settings
-os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
-chat = ChatGroq(temperature=0, model_name="llama-3.3-70b-versatile")
+logger = logging.getLogger(__name__)
 
+from django.conf import settings
 
 system_prompt = (
     "You are a qualified teacher with a Qualification Teacher Certificate and 20 years of experience in teaching and designing WAEC History exam questions. "
@@ -31,69 +32,202 @@ system_prompt = (
     "Your goal is to foster a comprehensive understanding of Sierra Leone's history while helping students prepare for WAEC examination questions in History."
 )
 
-human_prompt = "{text}"
-prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", human_prompt)])
+# Partitions the history assistant answers from: the SSS History syllabus and textbook, not the Primary/JSS handbooks
+HISTORY_FILTERS = {'class_level': 'SSS', 'subject': 'History'}
 
 
-def retrieve_relevant_chunks(query, top_k=5):
+def retrieve_relevant_chunks(query, top_k=5, filters=None, diversify=None):
     """
-    Retrieve relevant chunks using cosine similarity search.
+    Retrieve relevant chunks using cosine similarity search, optionally restricted to partitions.
+    Results are diversified with MMR unless disabled (settings.HISTORY_ASSISTANT_DIVERSIFY),
+    and the context is kept within settings.RETRIEVAL_CONTEXT_TOKEN_BUDGET tokens.
     """
-    relevant_chunks = search_similar_chunks(query, top_k=top_k)
+    diversify = settings.HISTORY_ASSISTANT_DIVERSIFY if diversify is None else diversify
+    relevant_chunks = search_similar_chunks(query, top_k=top_k, filters=filters, diversify=diversify,
+                                            token_budget=settings.RETRIEVAL_CONTEXT_TOKEN_BUDGET)
     context = " ".join(chunk.chunk_text for chunk in relevant_chunks)
     return context
 
 
-def answer_query_with_assistant(query):
+def retrieve_relevant_chunks_many(queries, top_k=5, filters=None, diversify=None):
     """
-    Generate an answer using the assistant with relevant chunks as context.
+    Retrieve the context of several queries with one batched search, in query order.
     """
-    context = retrieve_relevant_chunks(query)
+    diversify = settings.HISTORY_ASSISTANT_DIVERSIFY if diversify is None else diversify
+    return [
+        " ".join(chunk.chunk_text for chunk in relevant_chunks)
+        for relevant_chunks in search_similar_chunks_many(
+            queries, top_k=top_k, filters=filters, diversify=diversify,
+            token_budget=settings.RETRIEVAL_CONTEXT_TOKEN_BUDGET,
+        )
+    ]
 
+
+def answer_messages(query, context):
     input_text = f"Document Context: {context}\n\nQuestion: {query}\n\nProvide a detailed answer using the syllabus, textbook, and your expertise."
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": input_text}]
+
+
+async def agenerate_answer(query, context):
+    """Ask the LLM to answer the query from the retrieved context."""
+    return await acomplete(answer_messages(query, context), feature='history', temperature=0)
+
+
+def _store_answer(query, query_embedding, answer, generation_seconds, scope):
+    try:
+        answer_cache.store(query, query_embedding, answer, generation_seconds, scope)
+    except Exception as e:
+        logger.warning(f"Could not cache answer: {e}")
+
 
-    response = prompt | chat
-    answer = response.invoke({"text": input_text})
+def _lookup_cached_answer(query, scope):
+    """(query embedding, cached answer or None); the embedding is None when the cache is off or embedding fails."""
+    query_embedding = None
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, None
+    try:
+        query_embedding = get_query_embedding(query)
+        cached = answer_cache.lookup(query_embedding, scope)
+        return query_embedding, cached.answer if cached is not None else None
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return query_embedding, None
+
+
+async def aanswer_query_with_assistant(query, filters=None):
+    """
+    Generate an answer using the assistant with relevant chunks as context.
+
+    With filters (e.g. HISTORY_FILTERS) only the matching partitions of the corpus are
+    searched. With settings.ANSWER_CACHE_ENABLED, a stored answer to a semantically
+    similar query with the same filters is returned without retrieval or an LLM call.
+    The cache and retrieval run in a worker thread, the LLM call waits on the event loop.
+    """
+    scope = filter_scope(filters)
+    query_embedding, cached = await sync_to_async(_lookup_cached_answer)(query, scope)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    context = await sync_to_async(retrieve_relevant_chunks)(query, filters=filters)
+    answer = await agenerate_answer(query, context)
+
+    if query_embedding is not None:
+        await sync_to_async(_store_answer)(query, query_embedding, answer, time.perf_counter() - started, scope)
 
     return answer
 
 
-from django.contrib.auth.mixins import LoginRequiredMixin
+def _prepare_queries(queries, filters):
+    """
+    Shared first half of answering a batch of queries: answer-cache lookups with one
+    embedding call, then one batched search for the rest. Returns (results, embeddings,
+    contexts, retrieval_seconds); contexts maps the position of every query that still
+    needs an LLM call to its retrieved context.
+    """
+    scope = filter_scope(filters)
+    results = [None] * len(queries)
+    embeddings = [None] * len(queries)
+    pending = list(range(len(queries)))
+
+    if settings.ANSWER_CACHE_ENABLED and queries:
+        try:
+            embeddings = get_query_embeddings(queries)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+        pending = []
+        for position, query_embedding in enumerate(embeddings):
+            cached = None
+            if query_embedding is not None:
+                try:
+                    cached = answer_cache.lookup(query_embedding, scope)
+                except Exception as e:
+                    logger.warning(f"Answer cache lookup failed: {e}")
+            if cached is not None:
+                results[position] = cached.answer
+            else:
+                pending.append(position)
+    if not pending:
+        return results, embeddings, {}, 0.0
+
+    started = time.perf_counter()
+    contexts = {}
+    try:
+        contexts = dict(zip(pending, retrieve_relevant_chunks_many([queries[p] for p in pending], filters=filters)))
+    except Exception as e:
+        logger.warning(f"Batch retrieval failed, retrieving queries one by one: {e}")
+        for position in pending:
+            try:
+                contexts[position] = retrieve_relevant_chunks(queries[position], filters=filters)
+            except Exception as query_error:
+                results[position] = query_error
+    return results, embeddings, contexts, time.perf_counter() - started
+
+
+async def aanswer_queries_with_assistant(queries, filters=None, max_concurrency=None):
+    """
+    Answer several queries at once; returns one result per query, in order.
+
+    Answer-cache lookups share one embedding call, the remaining queries are retrieved
+    with one batched search, and their LLM calls run as concurrent tasks, at most
+    max_concurrency (settings.HISTORY_QUERY_MAX_WORKERS) at a time. A query that fails
+    gets its exception as its result, so one error never fails the others.
+    """
+    scope = filter_scope(filters)
+    results, embeddings, contexts, retrieval_seconds = await sync_to_async(_prepare_queries)(queries, filters)
+    limit = asyncio.Semaphore(max(1, max_concurrency or settings.HISTORY_QUERY_MAX_WORKERS))
+
+    async def generate(position):
+        async with limit:
+            generation_started = time.perf_counter()
+            try:
+                results[position] = await agenerate_answer(queries[position], contexts[position])
+            except Exception as e:
+                logger.warning(f"Could not answer query {queries[position]!r}: {e}")
+                results[position] = e
+                return
+        if embeddings[position] is not None:
+            seconds = retrieval_seconds + time.perf_counter() - generation_started
+            await sync_to_async(_store_answer)(queries[position], embeddings[position], results[position], seconds, scope)
+
+    await asyncio.gather(*(generate(position) for position in contexts))
+    return results
+
+
 from django.views.generic import TemplateView
 from django.http import JsonResponse
 from markdown import markdown
+from ai_core.async_views import AsyncLoginRequiredMixin, arender
 
-class QueryView(LoginRequiredMixin, TemplateView):
+class QueryView(AsyncLoginRequiredMixin, TemplateView):
     """
     Django view for handling queries and generating responses via a template.
     """
     template_name = 'ai_core/history_query.html'
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         query = request.GET.get('query')
         if not query:
-            return self.render_to_response({'queries_and_answers': []})
+            return await arender(request, self.template_name, {'queries_and_answers': []})
 
         try:
-            answer = answer_query_with_assistant(query)
+            answer = await aanswer_query_with_assistant(query, filters=HISTORY_FILTERS)
             answer_content = answer.content if hasattr(answer, 'content') else answer
             answer_html = markdown(answer_content)
             context = {
                 'queries_and_answers': [{'query': query, 'answer': answer_html}]
             }
-            return self.render_to_response(context)
+            return await arender(request, self.template_name, context)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         queries = request.POST.getlist('query[]')
         answers = []
-        for query in queries:
-            try:
-                answer = answer_query_with_assistant(query)
-                answer_content = answer.content if hasattr(answer, 'content') else answer
-                answers.append({'query': query, 'answer': markdown(answer_content)})
-            except Exception as e:
-                answers.append({'query': query, 'answer': f"Error processing query: {str(e)}"})
+        for query, answer in zip(queries, await aanswer_queries_with_assistant(queries, filters=HISTORY_FILTERS)):
+            if isinstance(answer, Exception):
+                answers.append({'query': query, 'answer': f"Error processing query: {str(answer)}"})
+            else:
+                answers.append({'query': query, 'answer': markdown(answer)})
 
-        return self.render_to_response({'queries_and_answers': answers})
+        return await arender(request, self.template_name, {'queries_and_answers': answers})
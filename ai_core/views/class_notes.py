@@ -1,22 +1,16 @@
 
-import os
-from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 from django.contrib import messages
 import markdown
 import logging
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
 
+from ai_core.llm import complete
 from ai_core.models import ResourceModel, ResourceType, ClassLevel, DifficultyLevel
 from ai_core.utils import extract_text_from_pdf
 
 logger = logging.getLogger(__name__)
-os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
-
-chat = ChatGroq(temperature=0, model_name="llama-3.3-70b-versatile")
 
 system_prompt = (
     "You are a highly experienced educator specializing in creating study materials for Sierra Leonean students. "
@@ -42,8 +36,6 @@ human_prompt = (
     "Make the output clear, well-organized, and useful for exam revision."
 )
 
-prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", human_prompt)])
-
 
 class StudyFromNotesView(LoginRequiredMixin, View):
     template_name = "ai_core/study_from_notes.html"
@@ -102,14 +94,18 @@ class StudyFromNotesView(LoginRequiredMixin, View):
             student_notes = student_notes[:12000] + "\n\n[Notes truncated for processing...]"
 
         try:
-            formatted = prompt.format_messages(
+            user_prompt = human_prompt.format(
                 student_notes=student_notes,
                 output_type=output_type_labels.get(output_type, output_type),
                 difficulty_level=difficulty_level,
                 num_items=num_items,
             )
-            response = chat.invoke(formatted)
-            content_html = markdown.markdown(response.content)
+            content = complete(
+                [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+                feature='class_notes',
+                temperature=0,
+            )
+            content_html = markdown.markdown(content)
         except Exception as e:
             logger.error(f"Error generating study material: {e}")
             messages.error(request, "Something went wrong generating your study material. Please try again.")
@@ -3,57 +3,75 @@ import logging
 import os
 
 import markdown
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.http import HttpResponse
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect, get_object_or_404, aget_object_or_404
+from django.urls import reverse
 from django.template.loader import render_to_string
 from django.templatetags.static import static
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 from django.views.generic import ListView
-from groq import Groq
 
+from ai_core.async_views import AsyncLoginRequiredMixin, arender
+from ai_core.llm import acomplete, astream
+from ai_core.streaming import stream_generation, wants_stream
 from core.models import LessonPlan
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
 
+def render_lesson_markdown(content):
+    return markdown.markdown(content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
 
-class LessonPlanGeneratorView(LoginRequiredMixin, View):
+
+class LessonPlanGeneratorView(AsyncLoginRequiredMixin, View):
     template_name = 'ai_core/lesson_plan_generator.html'
 
-    def get(self, request):
-        return render(request, self.template_name, {
+    async def get(self, request):
+        # A streamed generation finishes by loading its saved lesson plan here
+        lesson_plan_id = request.GET.get('lesson_plan_id')
+        if lesson_plan_id:
+            lesson_plan = await aget_object_or_404(LessonPlan, id=lesson_plan_id, user=request.user)
+            return await arender(request, self.template_name, {
+                'topic': lesson_plan.topic,
+                'level': lesson_plan.level,
+                'area': lesson_plan.area,
+                'lesson_plan': lesson_plan.content,
+                'lesson_plan_id': lesson_plan.id,
+                'user_role': request.user.role,
+            })
+        return await arender(request, self.template_name, {
             'user_role': request.user.role,
         })
 
-    def post(self, request):
+    async def post(self, request):
         # Check for follow-up request
         follow_up_request = request.POST.get('follow_up_request')
         lesson_plan_id = request.POST.get('lesson_plan_id')
 
         if follow_up_request and lesson_plan_id:
             # Handle follow-up content generation
-            lesson_plan = get_object_or_404(LessonPlan, id=lesson_plan_id, user=request.user)
-            follow_up_content = self.generate_follow_up_content(
+            lesson_plan = await aget_object_or_404(LessonPlan, id=lesson_plan_id, user=request.user)
+            if wants_stream(request):
+                return stream_generation(
+                    await self.generate_follow_up_content(
+                        lesson_plan.topic, lesson_plan.level, lesson_plan.area, follow_up_request,
+                        role=request.user.role, streaming=True
+                    ),
+                    render=render_lesson_markdown,
+                    on_complete=lambda content: self.result_url(self.append_follow_up(lesson_plan, content)),
+                )
+            follow_up_content = await self.generate_follow_up_content(
                 lesson_plan.topic, lesson_plan.level, lesson_plan.area, follow_up_request,
                 role=request.user.role
             )
-            follow_up_content_html = markdown.markdown(follow_up_content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
+            combined_content = (await sync_to_async(self.append_follow_up)(lesson_plan, follow_up_content)).content
 
-            # Append follow-up content to the existing lesson plan with a visual separator
-            separator = '<div class="follow-up-separator"><h2>Follow-Up Content</h2></div>'
-            combined_content = lesson_plan.content + separator + follow_up_content_html
-            lesson_plan.content = combined_content
-            lesson_plan.follow_up_count += 1
-            lesson_plan.save()
-
-            return render(request, self.template_name, {
+            return await arender(request, self.template_name, {
                 'topic': lesson_plan.topic,
                 'level': lesson_plan.level,
                 'area': lesson_plan.area,
@@ -68,41 +86,66 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
             area = request.POST.get('area')
 
             if not topic:
+                if wants_stream(request):
+                    return JsonResponse({'error': "Please enter a topic."}, status=400)
                 messages.error(request, "Please enter a topic.")
-                return render(request, self.template_name, {
+                return await arender(request, self.template_name, {
                     'user_role': request.user.role,
                 })
 
+            if wants_stream(request):
+                generate = self.generate_study_notes if request.user.role == 'student' else self.generate_lesson_plan
+                return stream_generation(
+                    await generate(topic, level, area, streaming=True),
+                    render=render_lesson_markdown,
+                    on_complete=lambda content: self.result_url(
+                        self.save_lesson_plan(request.user, topic, level, area, content)
+                    ),
+                )
+
             if request.user.role == 'student':
-                content = self.generate_study_notes(topic, level, area)
+                content = await self.generate_study_notes(topic, level, area)
             else:
-                content = self.generate_lesson_plan(topic, level, area)
+                content = await self.generate_lesson_plan(topic, level, area)
 
             if content:
-                content_html = markdown.markdown(content, extensions=['markdown.extensions.tables', 'markdown.extensions.fenced_code'])
-                saved_plan = LessonPlan.objects.create(
-                    user=request.user,
-                    topic=topic,
-                    level=level,
-                    area=area,
-                    content=content_html
-                )
+                saved_plan = await sync_to_async(self.save_lesson_plan)(request.user, topic, level, area, content)
 
-                return render(request, self.template_name, {
+                return await arender(request, self.template_name, {
                     'topic': topic,
                     'level': level,
                     'area': area,
-                    'lesson_plan': content_html,
+                    'lesson_plan': saved_plan.content,
                     'lesson_plan_id': saved_plan.id,
                     'user_role': request.user.role,
                 })
             else:
                 messages.error(request, "Failed to generate content. Please try again.")
-                return render(request, self.template_name, {
+                return await arender(request, self.template_name, {
                     'user_role': request.user.role,
                 })
 
-    def generate_lesson_plan(self, topic, level, area):
+    def save_lesson_plan(self, user, topic, level, area, content):
+        return LessonPlan.objects.create(
+            user=user,
+            topic=topic,
+            level=level,
+            area=area,
+            content=render_lesson_markdown(content)
+        )
+
+    def append_follow_up(self, lesson_plan, follow_up_content):
+        """Append follow-up content to the existing lesson plan with a visual separator."""
+        separator = '<div class="follow-up-separator"><h2>Follow-Up Content</h2></div>'
+        lesson_plan.content = lesson_plan.content + separator + render_lesson_markdown(follow_up_content)
+        lesson_plan.follow_up_count += 1
+        lesson_plan.save()
+        return lesson_plan
+
+    def result_url(self, lesson_plan):
+        return f"{reverse('ai_core:lesson_plan_generator')}?lesson_plan_id={lesson_plan.id}"
+
+    async def generate_lesson_plan(self, topic, level, area, streaming=False):
         """Generate a lesson plan using the Groq API tailored for Sierra Leone's education system."""
         try:
             prompt = (
@@ -156,17 +199,14 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                 f"     ```\n"
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            if streaming:
+                return astream(prompt, feature='lesson_plan', temperature=0.7)
+            return await acomplete(prompt, feature='lesson_plan', temperature=0.7)
         except Exception as e:
             logger.error(f"Error generating lesson plan content: {e}")
             return None
 
-    def generate_study_notes(self, topic, level, area):
+    async def generate_study_notes(self, topic, level, area, streaming=False):
         """Generate study notes using the Groq API tailored for Sierra Leone's students."""
         try:
             prompt = (
@@ -211,17 +251,14 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                 f"     ```\n"
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            if streaming:
+                return astream(prompt, feature='study_notes', temperature=0.7)
+            return await acomplete(prompt, feature='study_notes', temperature=0.7)
         except Exception as e:
             logger.error(f"Error generating study notes content: {e}")
             return None
 
-    def generate_follow_up_content(self, topic, level, area, follow_up_request, role='teacher'):
+    async def generate_follow_up_content(self, topic, level, area, follow_up_request, role='teacher', streaming=False):
         """Generate additional content based on a follow-up request, tailored to the user's role."""
         try:
             if role == 'student':
@@ -243,12 +280,9 @@ class LessonPlanGeneratorView(LoginRequiredMixin, View):
                 f"Where helpful, include ONE simple diagram using a Mermaid flowchart (graph TD) in a fenced code block. "
                 f"Keep Mermaid node labels short and plain-text only -- no special characters, LaTeX, or parentheses in labels."
             )
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            if streaming:
+                return astream(prompt, feature='follow_up', temperature=0.7)
+            return await acomplete(prompt, feature='follow_up', temperature=0.7)
         except Exception as e:
             logger.error(f"Error generating follow-up content: {e}")
             return None
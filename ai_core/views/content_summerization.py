@@ -82,15 +82,18 @@
 import os
 import markdown
 import pdfkit
-from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView
-from groq import Groq
 
+from ai_core.jobs import enqueue
+from ai_core.llm import complete, stream
+from ai_core.models import Job, JobStatus
+from ai_core.streaming import stream_generation, wants_stream
 from core.models import SummarizedContent
 from django.views import View
 import logging
@@ -98,14 +101,47 @@ import logging
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
+
+def summary_prompt(content):
+    return (
+        f"Create a concise and informative summary of the following educational content, tailored to "
+        f"facilitate effective teaching and learning in a West African context, particularly in Sierra Leone: "
+        f"\n{content}. In your summary, identify the most critical concepts and key takeaways, highlight "
+        "relevant cultural, social, or environmental contexts, and use local references or cultural analogies "
+        "to explain technical concepts. Incorporate historical or cultural context that is relevant to the "
+        "educational content, and highlight regional challenges or successes that can inform teaching "
+        "strategies. Suggest practical, locally relevant examples or case studies to illustrate complex ideas "
+        "and promote deeper comprehension, and offer actionable teaching strategies and tips for lesson "
+        "planning, incorporating indigenous knowledge and regional perspective. Emphasize connections to "
+        "existing curriculum standards and learning objectives in Sierra Leone, where applicable, "
+        "and summarize the content in approximately 450-800 words, ensuring that the language is clear, "
+        "concise, and accessible to educators in West Africa."
+    )
 
 
 class SummarizationView(LoginRequiredMixin, View):
     template_name = 'ai_core/teacher_summarization_form.html'
 
     def get(self, request):
+        job_id = request.GET.get('job_id')
+        if job_id:
+            job = get_object_or_404(Job, id=job_id, user=request.user, kind='summary.generate')
+            if job.status == JobStatus.SUCCEEDED:
+                return redirect(job.result['url'])
+            if job.status == JobStatus.DEAD:
+                messages.error(request, "An error occurred while generating the summary. Please try again.")
+                return render(request, self.template_name)
+            return render(request, self.template_name, {'pending_job': job})
+
+        # A streamed or background summary finishes by loading its saved content here
+        summarized_content_id = request.GET.get('summarized_content_id')
+        if summarized_content_id:
+            summarized_content = get_object_or_404(SummarizedContent, id=summarized_content_id, user=request.user)
+            return render(request, self.template_name, {
+                'summary': summarized_content.summarized_content,
+                'summary_html': summarized_content.content_html,
+                'summarized_content_id': summarized_content.id,
+            })
         return render(request, self.template_name)
 
     def post(self, request):
@@ -122,57 +158,49 @@ class SummarizationView(LoginRequiredMixin, View):
                 # Read content from text file
                 text_content = file.read().decode('utf-8')
             else:
+                if wants_stream(request):
+                    return JsonResponse({'error': "Unsupported file type. Please upload a PDF or text file."},
+                                        status=400)
                 messages.error(request, "Unsupported file type. Please upload a PDF or text file.")
                 return render(request, self.template_name)
         elif content:
             text_content = content
         else:
+            if wants_stream(request):
+                return JsonResponse({'error': "Please provide content to summarize."}, status=400)
             messages.error(request, "Please provide content to summarize.")
             return render(request, self.template_name)
 
-        # Generate the summary using Gemini model
-        summary = self.summarize_content_with_gemini(text_content)
+        if wants_stream(request):
+            return stream_generation(
+                self.summarize_content_with_gemini(text_content, streaming=True),
+                render=markdown.markdown,
+                on_complete=lambda summary: self.result_url(self.save_summary(request.user, text_content, summary)),
+            )
 
-        # Convert summary to HTML using markdown
-        summary_html = markdown.markdown(summary)
+        # Without streaming, a worker generates the summary and the page polls until it is saved
+        job = enqueue('summary.generate', {'content': text_content}, user=request.user)
+        return redirect(f"{reverse('ai_core:teacher_summarization_form')}?job_id={job.id}")
 
-        # Save the summarized content to the database
-        summarized_content = SummarizedContent.objects.create(
-            user=request.user,
-            original_content=text_content,
+    def save_summary(self, user, original_content, summary):
+        """Convert the summary to HTML using markdown and save it to the database."""
+        return SummarizedContent.objects.create(
+            user=user,
+            original_content=original_content,
             summarized_content=summary,
-            content_html=summary_html
+            content_html=markdown.markdown(summary)
         )
 
-        return render(request, self.template_name, {
-            'summary': summary,
-            'summary_html': summary_html,
-            'summarized_content_id': summarized_content.id
-        })
+    def result_url(self, summarized_content):
+        return f"{reverse('ai_core:teacher_summarization_form')}?summarized_content_id={summarized_content.id}"
 
-    def summarize_content_with_gemini(self, content):
+    def summarize_content_with_gemini(self, content, streaming=False):
         """Summarize the educational content using Groq."""
         try:
-            prompt = (
-                f"Create a concise and informative summary of the following educational content, tailored to "
-                f"facilitate effective teaching and learning in a West African context, particularly in Sierra Leone: "
-                f"\n{content}. In your summary, identify the most critical concepts and key takeaways, highlight "
-                "relevant cultural, social, or environmental contexts, and use local references or cultural analogies "
-                "to explain technical concepts. Incorporate historical or cultural context that is relevant to the "
-                "educational content, and highlight regional challenges or successes that can inform teaching "
-                "strategies. Suggest practical, locally relevant examples or case studies to illustrate complex ideas "
-                "and promote deeper comprehension, and offer actionable teaching strategies and tips for lesson "
-                "planning, incorporating indigenous knowledge and regional perspective. Emphasize connections to "
-                "existing curriculum standards and learning objectives in Sierra Leone, where applicable, "
-                "and summarize the content in approximately 450-800 words, ensuring that the language is clear, "
-                "concise, and accessible to educators in West Africa."
-            )
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            prompt = summary_prompt(content)
+            if streaming:
+                return stream(prompt, feature='summary', temperature=0.7)
+            return complete(prompt, feature='summary', temperature=0.7)
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
             return "An error occurred while generating the summary."
@@ -189,6 +217,12 @@ class SummarizationView(LoginRequiredMixin, View):
             return ""
 
 
+def generate_summary(user, content):
+    """Summarize content and save it for the user (the summary.generate job)."""
+    summary = complete(summary_prompt(content), feature='summary', temperature=0.7)
+    return SummarizationView().save_summary(user, content, summary)
+
+
 @login_required
 def download_summarized_content_pdf(request, id):
     """Generate and download the summarized content as a PDF."""
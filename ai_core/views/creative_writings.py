@@ -1,24 +1,22 @@
 import os
 import markdown
-from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 import pdfkit
-from groq import Groq
 
+from ai_core.llm import complete, stream
+from ai_core.streaming import stream_generation, wants_stream
 from core.models import CreativeWritingPrompt
 import logging
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
-
 
 # class CreativeWritingAssistantView(View):
 #     template_name = 'ai_core/creative_writing_assistant.html'
@@ -132,8 +130,31 @@ groq_client = Groq(api_key=settings.GROQ_API_KEY)
 
 class CreativeWritingAssistantView(LoginRequiredMixin, View):
     template_name = 'ai_core/creative_writing_assistant.html'
+    improvement_tips = (
+        "Consider asking follow-up questions to clarify the direction of the story, such as:\n"
+        "1. How can character backgrounds be enhanced?\n"
+        "2. What additional cultural details could make the setting more vivid?\n"
+        "3. How can the story's theme be emphasized more effectively?"
+    )
 
     def get(self, request):
+        # A streamed generation finishes by loading its saved writing prompt here
+        writing_prompt_id = request.GET.get('writing_prompt_id')
+        if writing_prompt_id:
+            writing_prompt = get_object_or_404(CreativeWritingPrompt, id=writing_prompt_id, user=request.user)
+            return render(request, self.template_name, {
+                'genre': writing_prompt.genre,
+                'tone': writing_prompt.tone,
+                'level': writing_prompt.level,
+                'location': writing_prompt.location,
+                'theme': writing_prompt.theme,
+                'plot': writing_prompt.plot,
+                'idea': writing_prompt.idea,
+                'title': writing_prompt.title,
+                'writing_prompt': writing_prompt.prompt,
+                'writing_prompt_id': writing_prompt.id,
+                'prompt_improvement_tips': self.improvement_tips,
+            })
         return render(request, self.template_name)
 
     def post(self, request):
@@ -154,6 +175,16 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
         if follow_up_request and writing_prompt_id:
             # Handle follow-up content generation
             writing_prompt = get_object_or_404(CreativeWritingPrompt, id=writing_prompt_id, user=request.user)
+            if wants_stream(request):
+                return stream_generation(
+                    self.generate_follow_up_content(
+                        writing_prompt.genre, writing_prompt.tone, writing_prompt.level,
+                        writing_prompt.location, writing_prompt.theme, writing_prompt.plot,
+                        writing_prompt.idea, follow_up_request, streaming=True
+                    ),
+                    render=markdown.markdown,
+                    on_complete=lambda content: self.result_url(self.append_follow_up(writing_prompt, content)),
+                )
             follow_up_content = self.generate_follow_up_content(
                 writing_prompt.genre, writing_prompt.tone, writing_prompt.level,
                 writing_prompt.location, writing_prompt.theme, writing_prompt.plot,
@@ -161,9 +192,7 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
             )
 
             follow_up_content_html = markdown.markdown(follow_up_content)
-            combined_content = writing_prompt.prompt + follow_up_content_html
-            writing_prompt.prompt = combined_content
-            writing_prompt.save()
+            combined_content = self.append_follow_up(writing_prompt, follow_up_content).prompt
 
             return render(request, self.template_name, {
                 'genre': writing_prompt.genre,
@@ -181,9 +210,22 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
 
         # Original creative writing generation
         if not all([genre, tone, level, location, theme, plot, idea, title]):
+            if wants_stream(request):
+                return JsonResponse({'error': "Please fill out all fields."}, status=400)
             messages.error(request, "Please fill out all fields.")
             return render(request, self.template_name)
 
+        if wants_stream(request):
+            fields = dict(genre=genre, tone=tone, level=level, location=location, theme=theme, plot=plot,
+                          idea=idea, title=title)
+            return stream_generation(
+                self.generate_creative_writing_prompt(**fields, streaming=True),
+                render=markdown.markdown,
+                on_complete=lambda content: self.result_url(
+                    CreativeWritingPrompt.objects.create(user=request.user, prompt=markdown.markdown(content), **fields)
+                ),
+            )
+
         prompt_data = self.generate_creative_writing_prompt(genre, tone, level, location, theme, plot, idea, title)
 
         if prompt_data:
@@ -212,7 +254,16 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
             messages.error(request, "Failed to generate creative writing prompt. Please try again.")
             return render(request, self.template_name)
 
-    def generate_creative_writing_prompt(self, genre, tone, level, location, theme, plot, idea, title):
+    def append_follow_up(self, writing_prompt, follow_up_content):
+        writing_prompt.prompt = writing_prompt.prompt + markdown.markdown(follow_up_content)
+        writing_prompt.save()
+        return writing_prompt
+
+    def result_url(self, writing_prompt):
+        return f"{reverse('ai_core:creative_writing')}?writing_prompt_id={writing_prompt.id}"
+
+    def generate_creative_writing_prompt(self, genre, tone, level, location, theme, plot, idea, title,
+                                         streaming=False):
         """Generate a creative writing prompt using Groq API, with guidance tips."""
         try:
             prompt = (
@@ -231,26 +282,18 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
                 f"like focusing on plot progression and character development.\n\n"
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
+            if streaming:
+                return stream(prompt, feature='creative_writing', temperature=0.7)
+            content = complete(prompt, feature='creative_writing', temperature=0.7)
 
-            improvement_tips = (
-                "Consider asking follow-up questions to clarify the direction of the story, such as:\n"
-                "1. How can character backgrounds be enhanced?\n"
-                "2. What additional cultural details could make the setting more vivid?\n"
-                "3. How can the story's theme be emphasized more effectively?"
-            )
-
-            return {"prompt": response.choices[0].message.content, "improvement_tips": improvement_tips}
+            return {"prompt": content, "improvement_tips": self.improvement_tips}
 
         except Exception as e:
             logger.error(f"Error generating content: {e}")
             return None
 
-    def generate_follow_up_content(self, genre, tone, level, location, theme, plot, idea, follow_up_request):
+    def generate_follow_up_content(self, genre, tone, level, location, theme, plot, idea, follow_up_request,
+                                   streaming=False):
         """Generate follow-up content based on user feedback."""
         try:
             prompt = (
@@ -259,12 +302,9 @@ class CreativeWritingAssistantView(LoginRequiredMixin, View):
                 f"Keep the content culturally resonant and user-friendly."
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            if streaming:
+                return stream(prompt, feature='follow_up', temperature=0.7)
+            return complete(prompt, feature='follow_up', temperature=0.7)
 
         except Exception as e:
             logger.error(f"Error generating follow-up content: {e}")
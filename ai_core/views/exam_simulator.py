@@ -1,21 +1,22 @@
+import asyncio
 import json
 import logging
 
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.http import JsonResponse
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.urls import reverse
 from django.utils import timezone
 from django.views import View
 from django.views.decorators.http import require_POST
-from groq import Groq
 
-from ai_core.models import ExamConfig, ExamSession, ExamType
+from ai_core.async_views import AsyncLoginRequiredMixin, arender
+from ai_core.jobs import PermanentJobError, aenqueue, status_url
+from ai_core.llm import acomplete, acomplete_json, strip_code_fences
+from ai_core.models import ExamConfig, ExamSession, ExamType, Job, JobStatus
 
 logger = logging.getLogger(__name__)
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
 
 WAEC_GRADES = [
     (75, 'A1'), (70, 'B2'), (65, 'B3'), (60, 'C4'),
@@ -30,69 +31,76 @@ def get_waec_grade(percentage):
     return 'F9'
 
 
-class ExamSimulatorView(LoginRequiredMixin, View):
+async def _exam_configs():
+    return [
+        config async for config in ExamConfig.objects.all()
+        .values('id', 'exam_type', 'subject', 'paper_type', 'num_questions', 'time_minutes', 'instructions')
+        .order_by('exam_type', 'subject', 'paper_type')
+    ]
+
+
+def exam_meta(session):
+    config = session.exam_config
+    return {
+        'session_id': session.id,
+        'exam_type': config.exam_type,
+        'subject': config.subject,
+        'paper_type': config.paper_type,
+        'num_questions': config.num_questions,
+        'time_minutes': config.time_minutes,
+        'instructions': config.instructions,
+    }
+
+
+class ExamSimulatorView(AsyncLoginRequiredMixin, View):
     template_name = 'ai_core/exam_simulator.html'
 
-    def get(self, request):
-        configs = list(
-            ExamConfig.objects.all()
-            .values('id', 'exam_type', 'subject', 'paper_type', 'num_questions', 'time_minutes', 'instructions')
-            .order_by('exam_type', 'subject', 'paper_type')
-        )
-        return render(request, self.template_name, {
-            'exam_types': ExamType.choices,
-            'configs': configs,
-        })
+    async def get(self, request):
+        if request.GET.get('job_id'):
+            return await self.job_state(request, request.GET['job_id'])
+
+        session_id = request.GET.get('session_id')
+        if session_id:
+            session = await aget_object_or_404(
+                ExamSession.objects.select_related('exam_config'), id=session_id, user=request.user
+            )
+            if session.completed_at:
+                return redirect('ai_core:exam_results', session_id=session.id)
+            return await self.render_selector(request, exam_data=session.questions_data, exam_meta=exam_meta(session))
+
+        return await self.render_selector(request)
 
-    def post(self, request):
+    async def post(self, request):
         config_id = request.POST.get('config_id')
         if not config_id:
             messages.error(request, "Please select an exam and subject.")
-            return self.get(request)
+            return await self.render_selector(request)
 
-        config = get_object_or_404(ExamConfig, id=config_id)
+        config = await aget_object_or_404(ExamConfig, id=config_id)
 
-        if config.paper_type == 'theory':
-            exam_questions = self.generate_theory_questions(config)
-        else:
-            exam_questions = self.generate_exam_questions(config)
-
-        if exam_questions is None:
-            messages.error(request, "Failed to generate exam questions. Please try again.")
-            return self.get(request)
-
-        session = ExamSession.objects.create(
-            user=request.user,
-            exam_config=config,
-            questions_data=exam_questions,
-            answers_data=[''] * len(exam_questions) if config.paper_type == 'theory' else [-1] * len(exam_questions),
-            total_marks=len(exam_questions),
+        # Generating a paper takes up to a minute; a worker generates it and the page polls for it
+        job = await aenqueue(
+            'exam.generate', {'config_id': config.id}, user=request.user, key=f"user:{request.user.id}:config:{config.id}"
         )
+        return redirect(f"{reverse('ai_core:exam_simulator')}?job_id={job.id}")
 
-        exam_meta = {
-            'session_id': session.id,
-            'exam_type': config.exam_type,
-            'subject': config.subject,
-            'paper_type': config.paper_type,
-            'num_questions': config.num_questions,
-            'time_minutes': config.time_minutes,
-            'instructions': config.instructions,
-        }
-
-        configs = list(
-            ExamConfig.objects.all()
-            .values('id', 'exam_type', 'subject', 'paper_type', 'num_questions', 'time_minutes', 'instructions')
-            .order_by('exam_type', 'subject', 'paper_type')
-        )
+    async def job_state(self, request, job_id):
+        job = await aget_object_or_404(Job, id=job_id, user=request.user, kind='exam.generate')
+        if job.status == JobStatus.SUCCEEDED:
+            return redirect(job.result['url'])
+        if job.status == JobStatus.DEAD:
+            messages.error(request, "Failed to generate exam questions. Please try again.")
+            return await self.render_selector(request)
+        return await self.render_selector(request, pending_job=job)
 
-        return render(request, self.template_name, {
+    async def render_selector(self, request, **context):
+        return await arender(request, self.template_name, {
             'exam_types': ExamType.choices,
-            'configs': configs,
-            'exam_data': exam_questions,
-            'exam_meta': exam_meta,
+            'configs': await _exam_configs(),
+            **context,
         })
 
-    def generate_exam_questions(self, config):
+    async def generate_exam_questions(self, config):
         """Generate MCQ questions for objectives paper."""
         prompt = (
             f"You are generating {config.exam_type} {config.subject} exam questions for Sierra Leonean students.\n"
@@ -110,29 +118,13 @@ class ExamSimulatorView(LoginRequiredMixin, View):
             f"- Options must be plausible distractors"
         )
 
-        for attempt in range(2):
-            try:
-                response = groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=8000,
-                )
-                content = response.choices[0].message.content.strip()
-                if content.startswith("```"):
-                    content = content.split("\n", 1)[1]
-                    if content.endswith("```"):
-                        content = content[:-3]
-                    content = content.strip()
-                data = json.loads(content)
-                if isinstance(data, list) and len(data) > 0:
-                    return data
-            except (json.JSONDecodeError, Exception) as e:
-                logger.warning(f"Exam question generation attempt {attempt + 1} failed: {e}")
-                continue
-        return None
-
-    def generate_theory_questions(self, config):
+        try:
+            return await acomplete_json(prompt, feature='exam_questions', temperature=0.7, max_tokens=8000)
+        except Exception as e:
+            logger.warning(f"Exam question generation failed: {e}")
+            return None
+
+    async def generate_theory_questions(self, config):
         """Generate theory/essay questions."""
         prompt = (
             f"You are generating {config.exam_type} {config.subject} theory exam questions for Sierra Leonean students.\n"
@@ -151,38 +143,46 @@ class ExamSimulatorView(LoginRequiredMixin, View):
             f"- Cover diverse topics across the {config.subject} curriculum"
         )
 
-        for attempt in range(2):
-            try:
-                response = groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=4000,
-                )
-                content = response.choices[0].message.content.strip()
-                if content.startswith("```"):
-                    content = content.split("\n", 1)[1]
-                    if content.endswith("```"):
-                        content = content[:-3]
-                    content = content.strip()
-                data = json.loads(content)
-                if isinstance(data, list) and len(data) > 0:
-                    return data
-            except (json.JSONDecodeError, Exception) as e:
-                logger.warning(f"Theory question generation attempt {attempt + 1} failed: {e}")
-                continue
-        return None
+        try:
+            return await acomplete_json(prompt, feature='exam_theory', temperature=0.7, max_tokens=4000)
+        except Exception as e:
+            logger.warning(f"Theory question generation failed: {e}")
+            return None
+
+
+async def generate_exam_session(user_id, config_id):
+    """Generate a paper for an exam config and start the user's session on it (the exam.generate job)."""
+    config = await ExamConfig.objects.aget(id=config_id)
+    view = ExamSimulatorView()
+    if config.paper_type == 'theory':
+        exam_questions = await view.generate_theory_questions(config)
+    else:
+        exam_questions = await view.generate_exam_questions(config)
+
+    if exam_questions is None:
+        raise RuntimeError(f"Failed to generate exam questions for config {config.id}")
+
+    return await ExamSession.objects.acreate(
+        user_id=user_id,
+        exam_config=config,
+        questions_data=exam_questions,
+        answers_data=[''] * len(exam_questions) if config.paper_type == 'theory' else [-1] * len(exam_questions),
+        total_marks=len(exam_questions),
+    )
 
 
 @login_required
 @require_POST
-def submit_exam(request):
+async def submit_exam(request):
     try:
         data = json.loads(request.body)
         session_id = data.get('session_id')
         answers = data.get('answers', [])
+        user = await request.auser()
 
-        session = get_object_or_404(ExamSession, id=session_id, user=request.user)
+        session = await aget_object_or_404(
+            ExamSession.objects.select_related('exam_config'), id=session_id, user=user
+        )
 
         if session.completed_at:
             return JsonResponse({'status': 'error', 'message': 'Exam already submitted'}, status=400)
@@ -191,16 +191,21 @@ def submit_exam(request):
         questions = session.questions_data
 
         if config.paper_type == 'theory':
-            return _grade_theory(session, questions, answers, config)
+            # Theory answers are each graded by the model; a worker grades the paper and the page polls
+            job = await aenqueue(
+                'exam.grade_theory', {'session_id': session.id, 'answers': answers},
+                user=user, key=f"session:{session.id}",
+            )
+            return JsonResponse({'status': 'queued', 'job_id': job.id, 'status_url': status_url(job)}, status=202)
         else:
-            return _grade_objectives(session, questions, answers, config)
+            return JsonResponse(await _grade_objectives(session, questions, answers, config))
 
     except Exception as e:
         logger.error(f"Error submitting exam: {e}")
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
-def _grade_objectives(session, questions, answers, config):
+async def _grade_objectives(session, questions, answers, config):
     """Grade an objectives (MCQ) exam."""
     score = 0
     topic_breakdown = {}
@@ -219,7 +224,7 @@ def _grade_objectives(session, questions, answers, config):
     percentage = round((score / total) * 100, 1) if total > 0 else 0
     grade = get_waec_grade(percentage)
 
-    feedback = generate_feedback(config, score, total, percentage, topic_breakdown)
+    feedback = await generate_feedback(config, score, total, percentage, topic_breakdown)
 
     session.answers_data = answers
     session.score = score
@@ -229,7 +234,7 @@ def _grade_objectives(session, questions, answers, config):
     session.feedback = feedback
     session.topic_breakdown = topic_breakdown
     session.completed_at = timezone.now()
-    session.save()
+    await session.asave()
 
     review = []
     for i, q in enumerate(questions):
@@ -243,7 +248,7 @@ def _grade_objectives(session, questions, answers, config):
             'topic': q.get('topic', 'General'),
         })
 
-    return JsonResponse({
+    return {
         'status': 'ok',
         'paper_type': 'objectives',
         'score': score,
@@ -253,16 +258,21 @@ def _grade_objectives(session, questions, answers, config):
         'topic_breakdown': topic_breakdown,
         'feedback': feedback,
         'review': review,
-    })
+    }
 
 
-def _grade_theory(session, questions, answers, config):
-    """Grade a theory exam using AI."""
+async def _grade_theory(session, questions, answers, config):
+    """Grade a theory exam using AI; the answers are graded concurrently."""
     total_marks = sum(q.get('marks', 10) for q in questions)
     total_earned = 0
     topic_breakdown = {}
     graded_answers = []
 
+    answered = [i for i in range(min(len(questions), len(answers))) if answers[i] and answers[i].strip()]
+    grade_results = dict(zip(answered, await asyncio.gather(
+        *(_ai_grade_answer(config, questions[i], answers[i]) for i in answered)
+    )))
+
     for i, q in enumerate(questions):
         student_answer = answers[i] if i < len(answers) else ''
         topic = q.get('topic', 'General')
@@ -283,8 +293,7 @@ def _grade_theory(session, questions, answers, config):
             })
             continue
 
-        # AI grading
-        grade_result = _ai_grade_answer(config, q, student_answer)
+        grade_result = grade_results[i]
         earned = min(grade_result.get('marks', 0), marks)
         total_earned += earned
         topic_breakdown[topic]['earned'] += earned
@@ -310,7 +319,7 @@ def _grade_theory(session, questions, answers, config):
             'total': data['total'],
         }
 
-    feedback = generate_feedback(config, total_earned, total_marks, percentage, topic_summary)
+    feedback = await generate_feedback(config, total_earned, total_marks, percentage, topic_summary)
 
     session.answers_data = answers
     session.score = total_earned
@@ -320,9 +329,9 @@ def _grade_theory(session, questions, answers, config):
     session.feedback = feedback
     session.topic_breakdown = topic_summary
     session.completed_at = timezone.now()
-    session.save()
+    await session.asave()
 
-    return JsonResponse({
+    return {
         'status': 'ok',
         'paper_type': 'theory',
         'score': total_earned,
@@ -332,10 +341,18 @@ def _grade_theory(session, questions, answers, config):
         'topic_breakdown': topic_summary,
         'feedback': feedback,
         'review': graded_answers,
-    })
+    }
 
 
-def _ai_grade_answer(config, question, student_answer):
+async def grade_theory_session(session_id, answers):
+    """Grade a submitted theory paper and complete its session (the exam.grade_theory job)."""
+    session = await ExamSession.objects.select_related('exam_config').aget(id=session_id)
+    if session.completed_at:
+        raise PermanentJobError(f"Exam session {session.id} is already graded")
+    return await _grade_theory(session, session.questions_data, answers, session.exam_config)
+
+
+async def _ai_grade_answer(config, question, student_answer):
     """Use AI to grade a single theory answer."""
     prompt = (
         f"You are grading a {config.exam_type} {config.subject} theory exam answer.\n\n"
@@ -353,25 +370,14 @@ def _ai_grade_answer(config, question, student_answer):
     )
 
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=300,
-        )
-        content = response.choices[0].message.content.strip()
-        if content.startswith("```"):
-            content = content.split("\n", 1)[1]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
-        return json.loads(content)
+        content = await acomplete(prompt, feature='exam_grading', temperature=0.3, max_tokens=300)
+        return json.loads(strip_code_fences(content))
     except Exception as e:
         logger.error(f"Error grading theory answer: {e}")
         return {'marks': 0, 'feedback': 'Unable to grade this answer automatically. Please review manually.'}
 
 
-def generate_feedback(config, score, total, percentage, topic_breakdown):
+async def generate_feedback(config, score, total, percentage, topic_breakdown):
     weak = [t for t, d in topic_breakdown.items() if d['total'] > 0 and (d['correct'] / d['total']) < 0.5]
     strong = [t for t, d in topic_breakdown.items() if d['total'] > 0 and (d['correct'] / d['total']) >= 0.7]
 
@@ -395,13 +401,7 @@ def generate_feedback(config, score, total, percentage, topic_breakdown):
     )
 
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500,
-        )
-        return response.choices[0].message.content.strip()
+        return (await acomplete(prompt, feature='exam_feedback', temperature=0.7, max_tokens=500)).strip()
     except Exception as e:
         logger.error(f"Error generating feedback: {e}")
         return "Great effort on completing this exam! Review the questions you missed and focus on the topics where you scored lowest."
@@ -147,41 +147,18 @@
 #         })
 import base64
 import io
-import os
 import markdown
 from PIL import Image
-from django.shortcuts import render
-from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import CreateView
-from ai_core.models import ReportCardImage
+from ai_core.jobs import enqueue
+from ai_core.llm import VISION_MODEL, complete
+from ai_core.models import Job, JobStatus, ReportCardImage
 from account.forms import ReportCardForm
-from groq import Groq
 
-from django.conf import settings
-os.environ["GROQ_API_KEY"] = settings.GROQ_API_KEY
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
-
-
-class ReportCardUploadView(LoginRequiredMixin, CreateView):
-    model = ReportCardImage
-    form_class = ReportCardForm
-    template_name = 'ai_core/upload_image.html'
-    success_url = ''  # Redirect after successful upload
-
-    def form_valid(self, form):
-        # Save the uploaded form and image
-        report_card = form.save()
-
-        # Convert image to base64
-        image_path = report_card.image.path
-        image = Image.open(image_path).convert("RGB")
-        image_bytes = io.BytesIO()
-        image.save(image_bytes, format='PNG')
-        base64_image = base64.b64encode(image_bytes.getvalue()).decode('ascii')
-
-        # Prompt for extracting report card details
-        prompt = """ 
+# Prompt for extracting report card details
+REPORT_CARD_PROMPT = """ 
         Analyze the report card in this image and extract the following information:
 
 1. **Student Name**
@@ -271,23 +248,61 @@ Provide the extracted information and analysis in a structured format using Mark
 - [Teacher's Comments or Remarks]
         """
 
-        # Send request to Groq API
-        response = groq_client.chat.completions.create(
-            model="llama-3.2-11b-vision-preview",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
-                    ]
-                }
-            ]
-        )
 
-        # Extract Markdown response and convert to HTML
-        markdown_response = response.choices[0].message.content
-        formatted_html = markdown.markdown(markdown_response)  # Convert Markdown to HTML
+def analyze_report_card(report_card):
+    """Analyze a report card image with the vision model and return the analysis as HTML (the report_card.analyze job)."""
+    # Convert image to base64
+    image = Image.open(report_card.image.path).convert("RGB")
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format='PNG')
+    base64_image = base64.b64encode(image_bytes.getvalue()).decode('ascii')
+
+    # Send request to Groq API
+    markdown_response = complete(
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": REPORT_CARD_PROMPT},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}
+                ]
+            }
+        ],
+        feature='report_card',
+        model=VISION_MODEL,
+    )
+
+    # Convert the Markdown response to HTML
+    return markdown.markdown(markdown_response)
+
+
+class ReportCardUploadView(LoginRequiredMixin, CreateView):
+    model = ReportCardImage
+    form_class = ReportCardForm
+    template_name = 'ai_core/upload_image.html'
+    success_url = ''  # Redirect after successful upload
+
+    def get(self, request, *args, **kwargs):
+        job_id = request.GET.get('job_id')
+        if not job_id:
+            return super().get(request, *args, **kwargs)
+
+        job = get_object_or_404(Job, id=job_id, user=request.user, kind='report_card.analyze')
+        self.object = None
+        context = self.get_context_data()
+        if job.status == JobStatus.SUCCEEDED:
+            # Pass the formatted response to the template
+            context['image_description'] = job.result['html']
+        elif job.status == JobStatus.DEAD:
+            context['analysis_failed'] = True
+        else:
+            context['pending_job'] = job
+        return self.render_to_response(context)
+
+    def form_valid(self, form):
+        # Save the uploaded form and image
+        report_card = form.save()
 
-        # Pass the formatted response to the template
-        return render(self.request, self.template_name, {"image_description": formatted_html})
+        # The vision model takes a while; a worker analyzes the image and the page polls for the analysis
+        job = enqueue('report_card.analyze', {'report_card_id': report_card.id}, user=self.request.user)
+        return redirect(f"{self.request.path}?job_id={job.id}")
@@ -0,0 +1,24 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+
+from ai_core.jobs import FAILED_MESSAGE, describe
+from ai_core.models import Job, JobStatus
+
+
+@login_required
+async def job_status(request, job_id):
+    """The state of one of the user's background jobs, polled by pages waiting on it."""
+    job = await aget_object_or_404(Job, id=job_id, user=await request.auser())
+    return JsonResponse(describe(job))
+
+
+@login_required
+async def job_result(request, job_id):
+    """The result of a finished job: 202 while it is queued or running, 409 if it failed."""
+    job = await aget_object_or_404(Job, id=job_id, user=await request.auser())
+    if job.status == JobStatus.SUCCEEDED:
+        return JsonResponse({'status': job.status, 'result': job.result})
+    if job.status == JobStatus.DEAD:
+        return JsonResponse({'status': job.status, 'error': FAILED_MESSAGE}, status=409)
+    return JsonResponse({'status': job.status}, status=202)
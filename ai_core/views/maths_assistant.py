@@ -1,15 +1,17 @@
 import os
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import redirect, get_object_or_404, aget_object_or_404
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 from django.views.generic import ListView
+from ai_core.async_views import AsyncLoginRequiredMixin, arender
+from ai_core.llm import acomplete, astream
+from ai_core.streaming import stream_generation, wants_stream
 from core.models import LessonPlan
-from groq import Groq
 import markdown2
 import pdfkit
 import logging
@@ -17,37 +19,50 @@ import logging
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Configure Groq client
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
 
+def render_math_markdown(content):
+    return markdown2.markdown(content, extras=["tables"])
 
-class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
+
+class MathLessonNoteGeneratorView(AsyncLoginRequiredMixin, View):
     template_name = 'ai_core/math_lesson_note_generator.html'
 
-    def get(self, request):
-        return render(request, self.template_name)
+    async def get(self, request):
+        # A streamed generation finishes by loading its saved lesson note here
+        lesson_note_id = request.GET.get('lesson_note_id')
+        if lesson_note_id:
+            lesson_note = await aget_object_or_404(LessonPlan, id=lesson_note_id, user=request.user)
+            return await arender(request, self.template_name, {
+                'topic': lesson_note.topic,
+                'level': lesson_note.level,
+                'lesson_note': lesson_note.content,
+                'lesson_note_id': lesson_note.id,
+            })
+        return await arender(request, self.template_name)
 
-    def post(self, request):
+    async def post(self, request):
         # Check if this is a follow-up request
         follow_up_request = request.POST.get('follow_up_request')
         lesson_note_id = request.POST.get('lesson_note_id')
 
         if follow_up_request and lesson_note_id:
             # Generate follow-up content based on existing lesson note
-            lesson_note = get_object_or_404(LessonPlan, id=lesson_note_id, user=request.user)
-            follow_up_content = self.generate_follow_up_content(
+            lesson_note = await aget_object_or_404(LessonPlan, id=lesson_note_id, user=request.user)
+            if wants_stream(request):
+                return stream_generation(
+                    await self.generate_follow_up_content(
+                        lesson_note.topic, lesson_note.level, follow_up_request, streaming=True
+                    ),
+                    render=render_math_markdown,
+                    on_complete=lambda content: self.result_url(self.append_follow_up(lesson_note, content)),
+                )
+            follow_up_content = await self.generate_follow_up_content(
                 lesson_note.topic, lesson_note.level, follow_up_request
             )
-            follow_up_content_html = markdown2.markdown(follow_up_content, extras=["tables"])
+            follow_up_content_html = render_math_markdown(follow_up_content)
+            await sync_to_async(self.append_follow_up)(lesson_note, follow_up_content)
 
-            # Combine the original lesson note and the follow-up content
-            combined_content = lesson_note.content + follow_up_content_html
-
-            # Update the lesson note in the database with combined content
-            lesson_note.content = combined_content
-            lesson_note.save()
-
-            return render(request, self.template_name, {
+            return await arender(request, self.template_name, {
                 'topic': lesson_note.topic,
                 'level': lesson_note.level,
                 'lesson_note': lesson_note.content,
@@ -59,32 +74,52 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
             topic = request.POST.get('topic')
             level = request.POST.get('level')
             if not topic:
+                if wants_stream(request):
+                    return JsonResponse({'error': "Please enter a topic."}, status=400)
                 messages.error(request, "Please enter a topic.")
-                return render(request, self.template_name)
+                return await arender(request, self.template_name)
+
+            if wants_stream(request):
+                return stream_generation(
+                    await self.generate_math_lesson_note(topic, level, streaming=True),
+                    render=render_math_markdown,
+                    on_complete=lambda content: self.result_url(
+                        self.save_lesson_note(request.user, topic, level, content)
+                    ),
+                )
 
             # Generate the initial lesson note
-            lesson_note = self.generate_math_lesson_note(topic, level)
+            lesson_note = await self.generate_math_lesson_note(topic, level)
             if lesson_note:
-                lesson_note_html = markdown2.markdown(lesson_note, extras=["tables"])
-
-                # Save the lesson note to the database
-                saved_note = LessonPlan.objects.create(
-                    user=request.user,
-                    topic=topic,
-                    level=level,
-                    content=lesson_note_html
-                )
-                return render(request, self.template_name, {
+                saved_note = await sync_to_async(self.save_lesson_note)(request.user, topic, level, lesson_note)
+                return await arender(request, self.template_name, {
                     'topic': topic,
                     'level': level,
-                    'lesson_note': lesson_note_html,
+                    'lesson_note': saved_note.content,
                     'lesson_note_id': saved_note.id
                 })
             else:
                 messages.error(request, "Failed to generate lesson note. Please try again.")
-                return render(request, self.template_name)
-
-    def generate_math_lesson_note(self, topic, level):
+                return await arender(request, self.template_name)
+
+    def save_lesson_note(self, user, topic, level, content):
+        return LessonPlan.objects.create(
+            user=user,
+            topic=topic,
+            level=level,
+            content=render_math_markdown(content)
+        )
+
+    def append_follow_up(self, lesson_note, follow_up_content):
+        """Combine the original lesson note and the follow-up content and save it."""
+        lesson_note.content = lesson_note.content + render_math_markdown(follow_up_content)
+        lesson_note.save()
+        return lesson_note
+
+    def result_url(self, lesson_note):
+        return f"{reverse('ai_core:math_lesson_note_generator')}?lesson_note_id={lesson_note.id}"
+
+    async def generate_math_lesson_note(self, topic, level, streaming=False):
         """Generate a comprehensive mathematics lesson note using the Groq API."""
         try:
             prompt = (
@@ -116,17 +151,14 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
                 f"The content should encourage critical thinking and practical understanding, following the EduBridge mission to connect theory with real-life applications."
             )
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            if streaming:
+                return astream(prompt, feature='math_lesson', temperature=0.7)
+            return await acomplete(prompt, feature='math_lesson', temperature=0.7)
         except Exception as e:
             logger.error(f"Error generating content: {e}")
             return None
 
-    def generate_follow_up_content(self, topic, level, follow_up_request):
+    async def generate_follow_up_content(self, topic, level, follow_up_request, streaming=False):
         """Generate additional content based on a follow-up request."""
         try:
             prompt = (
@@ -134,12 +166,9 @@ class MathLessonNoteGeneratorView(LoginRequiredMixin, View):
                 f"{follow_up_request}\n\n"
                 f"Ensure the response is educational, relevant, and tailored for students in Sierra Leone."
             )
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-            )
-            return response.choices[0].message.content
+            if streaming:
+                return astream(prompt, feature='follow_up', temperature=0.7)
+            return await acomplete(prompt, feature='follow_up', temperature=0.7)
         except Exception as e:
             logger.error(f"Error generating follow-up content: {e}")
             return None
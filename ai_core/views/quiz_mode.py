@@ -1,32 +1,29 @@
 import json
 import logging
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse
-from django.shortcuts import render
 from django.views import View
 from django.views.decorators.http import require_POST
-from groq import Groq
 
+from ai_core.async_views import AsyncLoginRequiredMixin, arender
+from ai_core.llm import acomplete_json
 from ai_core.models import QuizSession
 from core.models import ClassLevel
 
 logger = logging.getLogger(__name__)
-groq_client = Groq(api_key=settings.GROQ_API_KEY)
 
 
-class QuizModeView(LoginRequiredMixin, View):
+class QuizModeView(AsyncLoginRequiredMixin, View):
     template_name = 'ai_core/quiz_mode.html'
 
-    def get(self, request):
-        return render(request, self.template_name, {
+    async def get(self, request):
+        return await arender(request, self.template_name, {
             'class_levels': ClassLevel.choices,
         })
 
-    def post(self, request):
+    async def post(self, request):
         topic = request.POST.get('topic', '').strip()
         subject = request.POST.get('subject', '').strip()
         level = request.POST.get('level', '')
@@ -34,19 +31,19 @@ class QuizModeView(LoginRequiredMixin, View):
 
         if not topic or not subject:
             messages.error(request, "Please fill in all fields.")
-            return render(request, self.template_name, {
+            return await arender(request, self.template_name, {
                 'class_levels': ClassLevel.choices,
             })
 
-        quiz_data = self.generate_quiz(topic, subject, level, num_questions)
+        quiz_data = await self.generate_quiz(topic, subject, level, num_questions)
 
         if quiz_data is None:
             messages.error(request, "Failed to generate quiz. Please try again.")
-            return render(request, self.template_name, {
+            return await arender(request, self.template_name, {
                 'class_levels': ClassLevel.choices,
             })
 
-        return render(request, self.template_name, {
+        return await arender(request, self.template_name, {
             'class_levels': ClassLevel.choices,
             'quiz_data': quiz_data,
             'topic': topic,
@@ -55,7 +52,7 @@ class QuizModeView(LoginRequiredMixin, View):
             'num_questions': num_questions,
         })
 
-    def generate_quiz(self, topic, subject, level, num_questions):
+    async def generate_quiz(self, topic, subject, level, num_questions):
         prompt = (
             f"Generate exactly {num_questions} multiple choice questions about {topic} "
             f"in {subject} for {level} students in Sierra Leone.\n"
@@ -65,28 +62,11 @@ class QuizModeView(LoginRequiredMixin, View):
             f"Make questions educational and appropriate for the level."
         )
 
-        for attempt in range(2):
-            try:
-                response = groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                )
-                content = response.choices[0].message.content.strip()
-                # Strip markdown code fences if present
-                if content.startswith("```"):
-                    content = content.split("\n", 1)[1]
-                    if content.endswith("```"):
-                        content = content[:-3]
-                    content = content.strip()
-                quiz_data = json.loads(content)
-                if isinstance(quiz_data, list) and len(quiz_data) > 0:
-                    return quiz_data
-            except (json.JSONDecodeError, Exception) as e:
-                logger.warning(f"Quiz generation attempt {attempt + 1} failed: {e}")
-                continue
-
-        return None
+        try:
+            return await acomplete_json(prompt, feature='quiz', temperature=0.7)
+        except Exception as e:
+            logger.warning(f"Quiz generation failed: {e}")
+            return None
 
 
 @login_required
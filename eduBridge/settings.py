@@ -57,7 +57,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, async-capable so that under ASGI requests reach the async views without a thread
+    'eduBridge.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -153,6 +154,144 @@ LOGIN_URL = '/account/login/'
 
 GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
 GROQ_API_KEY = env('GROQ_API_KEY', default='')
+
+# LLM gateway (ai_core/llm.py): one keep-alive connection pool per process for all Groq calls.
+# Read timeouts are per feature (LLM_FEATURE_TIMEOUTS, e.g. "quiz=30,report_card=120"; other
+# features use LLM_TIMEOUT). 429, 5xx, timeout and connection errors are retried up to
+# LLM_MAX_RETRIES times after a random delay of up to LLM_BACKOFF_BASE * 2**attempt seconds
+# (capped at LLM_BACKOFF_MAX).
+LLM_MODEL = env('LLM_MODEL', default='llama-3.3-70b-versatile')
+LLM_TIMEOUT = env.int('LLM_TIMEOUT', default=60)
+LLM_CONNECT_TIMEOUT = env.int('LLM_CONNECT_TIMEOUT', default=5)
+LLM_FEATURE_TIMEOUTS = env.dict('LLM_FEATURE_TIMEOUTS', cast={'value': int}, default={
+    'quiz': 45,
+    'flashcards': 45,
+    'exam_questions': 120,
+    'exam_theory': 90,
+    'exam_grading': 20,
+    'exam_feedback': 30,
+    'lesson_plan': 90,
+    'study_notes': 90,
+    'math_lesson': 90,
+    'report_card': 90,
+})
+LLM_MAX_RETRIES = env.int('LLM_MAX_RETRIES', default=3)
+LLM_BACKOFF_BASE = env.float('LLM_BACKOFF_BASE', default=0.5)
+LLM_BACKOFF_MAX = env.float('LLM_BACKOFF_MAX', default=8.0)
+LLM_MAX_CONNECTIONS = env.int('LLM_MAX_CONNECTIONS', default=20)
+LLM_KEEPALIVE_CONNECTIONS = env.int('LLM_KEEPALIVE_CONNECTIONS', default=10)
+LLM_KEEPALIVE_EXPIRY = env.int('LLM_KEEPALIVE_EXPIRY', default=30)
+# Async views share one pool per event loop; under ASGI that pool carries every in-flight
+# completion of the process, so it is sized for hundreds of concurrent waits
+LLM_ASYNC_MAX_CONNECTIONS = env.int('LLM_ASYNC_MAX_CONNECTIONS', default=200)
+LLM_ASYNC_KEEPALIVE_CONNECTIONS = env.int('LLM_ASYNC_KEEPALIVE_CONNECTIONS', default=50)
+# Identical concurrent completions share one upstream call (ai_core/coalescing.py). Waiters in
+# other workers poll the shared cache every LLM_COALESCE_POLL_INTERVAL seconds for the result,
+# which is kept LLM_COALESCE_RESULT_TTL seconds after the call finishes
+LLM_COALESCE = env.bool('LLM_COALESCE', default=True)
+LLM_COALESCE_POLL_INTERVAL = env.float('LLM_COALESCE_POLL_INTERVAL', default=0.1)
+LLM_COALESCE_RESULT_TTL = env.int('LLM_COALESCE_RESULT_TTL', default=10)
+
+# Streaming generators re-render the markdown received so far at most every STREAM_RENDER_INTERVAL seconds
+STREAM_RENDER_INTERVAL = env.float('STREAM_RENDER_INTERVAL', default=0.5)
+
+# Background jobs (`manage.py run_jobs`). A claimed job is hidden from other workers for
+# JOB_VISIBILITY_TIMEOUT seconds, then taken over as if its worker had died; a failed
+# attempt is retried after JOB_RETRY_BACKOFF_BASE * 2^(attempt - 1) seconds (at most
+# JOB_RETRY_BACKOFF_MAX) until JOB_MAX_ATTEMPTS, then dead-lettered
+JOB_MAX_ATTEMPTS = env.int('JOB_MAX_ATTEMPTS', default=3)
+JOB_VISIBILITY_TIMEOUT = env.int('JOB_VISIBILITY_TIMEOUT', default=600)
+JOB_RETRY_BACKOFF_BASE = env.float('JOB_RETRY_BACKOFF_BASE', default=10.0)
+JOB_RETRY_BACKOFF_MAX = env.float('JOB_RETRY_BACKOFF_MAX', default=300.0)
+# Jobs one worker runs at once; SQLite takes one writer at a time, so more only wait on its lock
+JOB_WORKER_CONCURRENCY = env.int(
+    'JOB_WORKER_CONCURRENCY', default=1 if DATABASES['default']['ENGINE'].endswith('sqlite3') else 4,
+)
+JOB_POLL_INTERVAL = env.float('JOB_POLL_INTERVAL', default=1.0)
+# Succeeded jobs (and their results) are deleted this many days after finishing
+JOB_RETENTION_DAYS = env.int('JOB_RETENTION_DAYS', default=7)
+
+# Embedding backend: 'gemini' (remote text-embedding-004) or 'local' (sentence-transformers on CPU,
+# needs requirements-ml.txt). Chunks record their model and indexes only use the active one, so
+# switching backends requires re-embedding the corpus (`manage.py reembed_chunks`).
+EMBEDDING_BACKEND = env('EMBEDDING_BACKEND', default='gemini')
+LOCAL_EMBEDDING_MODEL = env('LOCAL_EMBEDDING_MODEL', default='sentence-transformers/all-mpnet-base-v2')
+LOCAL_EMBEDDING_BATCH_SIZE = env.int('LOCAL_EMBEDDING_BATCH_SIZE', default=32)
+LOCAL_EMBEDDING_THREADS = env.int('LOCAL_EMBEDDING_THREADS', default=2)
+LOCAL_EMBEDDING_DEVICE = env('LOCAL_EMBEDDING_DEVICE', default='cpu')
+
+# Storage precision for DocumentChunk embeddings: 'float32' or 'float16'
+EMBEDDING_STORAGE_DTYPE = env('EMBEDDING_STORAGE_DTYPE', default='float32')
+
+# Memory-mapped chunk index shared by all workers (written by `manage.py build_vector_index`)
+VECTOR_INDEX_PATH = env('VECTOR_INDEX_PATH', default=str(BASE_DIR / 'vector_index' / 'chunks.idx'))
+# Seconds a worker trusts its view of the corpus generation before re-reading it; chunks
+# changed by other processes are searched within this delay
+VECTOR_INDEX_RECHECK_INTERVAL = env.float('VECTOR_INDEX_RECHECK_INTERVAL', default=1.0)
+
+# Retrieval engine: 'brute' (exact matrix scan), 'ivf' (approximate, built by `manage.py build_ann_index`)
+# or 'int8' / 'pq' (quantized scan with float32 re-rank, built by `manage.py build_quantized_index`;
+# these read both their codes and the re-ranked rows from memory-mapped files, so they are only
+# used when the chunk index file at VECTOR_INDEX_PATH is)
+VECTOR_SEARCH_ENGINE = env('VECTOR_SEARCH_ENGINE', default='brute')
+VECTOR_IVF_PATH = env('VECTOR_IVF_PATH', default=str(BASE_DIR / 'vector_index' / 'chunks.ivf.npz'))
+VECTOR_IVF_NPROBE = env.int('VECTOR_IVF_NPROBE', default=8)
+VECTOR_QUANTIZED_PATH = env('VECTOR_QUANTIZED_PATH', default=str(BASE_DIR / 'vector_index' / 'chunks.quant.npz'))
+# Quantized search re-ranks top_k * VECTOR_QUANTIZED_RERANK candidates with exact scores (0 disables)
+VECTOR_QUANTIZED_RERANK = env.int('VECTOR_QUANTIZED_RERANK', default=10)
+VECTOR_PQ_SUBSPACES = env.int('VECTOR_PQ_SUBSPACES', default=96)
+
+# Chunk retrieval: 'vector', 'lexical' (BM25 only) or 'hybrid' (BM25 + vector fused with
+# reciprocal rank fusion; a confident BM25 match skips the query embedding call)
+RETRIEVAL_MODE = env('RETRIEVAL_MODE', default='hybrid')
+HYBRID_CANDIDATE_MULTIPLIER = env.int('HYBRID_CANDIDATE_MULTIPLIER', default=4)
+LEXICAL_CONFIDENCE_RATIO = env.float('LEXICAL_CONFIDENCE_RATIO', default=1.5)
+
+# Maximal marginal relevance re-ranking: callers that ask for diversified results get the
+# top_k of top_k * MMR_CANDIDATES candidates scored by MMR_LAMBDA * relevance -
+# (1 - MMR_LAMBDA) * similarity to chunks already chosen. The history assistant enables it
+# with HISTORY_ASSISTANT_DIVERSIFY; its context is capped at RETRIEVAL_CONTEXT_TOKEN_BUDGET
+# tokens (0 for no cap).
+MMR_LAMBDA = env.float('MMR_LAMBDA', default=0.7)
+MMR_CANDIDATES = env.int('MMR_CANDIDATES', default=4)
+HISTORY_ASSISTANT_DIVERSIFY = env.bool('HISTORY_ASSISTANT_DIVERSIFY', default=True)
+RETRIEVAL_CONTEXT_TOKEN_BUDGET = env.int('RETRIEVAL_CONTEXT_TOKEN_BUDGET', default=1500)
+
+# Cache shared by all workers (database table by default: run `manage.py createcachetable`).
+# Any django-environ cache URL works, e.g. redis://host:6379/1
+CACHES = {
+    'default': env.cache('CACHE_URL', default='dbcache://smartpikin_cache?MAX_ENTRIES=20000'),
+}
+
+# Query embedding and retrieval result caches: per-process LRU size and shared entry lifetime (seconds)
+RETRIEVAL_CACHE_LOCAL_SIZE = env.int('RETRIEVAL_CACHE_LOCAL_SIZE', default=1024)
+RETRIEVAL_CACHE_TIMEOUT = env.int('RETRIEVAL_CACHE_TIMEOUT', default=60 * 60 * 24)
+
+# Semantic answer cache for the history assistant: answers to queries whose embedding has
+# cosine similarity >= ANSWER_CACHE_THRESHOLD with a stored query are reused.
+# Purge from the admin (Answer cache entries) or with `manage.py answer_cache --purge`.
+ANSWER_CACHE_ENABLED = env.bool('ANSWER_CACHE_ENABLED', default=True)
+ANSWER_CACHE_THRESHOLD = env.float('ANSWER_CACHE_THRESHOLD', default=0.93)
+ANSWER_CACHE_TTL = env.int('ANSWER_CACHE_TTL', default=60 * 60 * 24 * 7)
+ANSWER_CACHE_MAX_ENTRIES = env.int('ANSWER_CACHE_MAX_ENTRIES', default=5000)
+
+# Concurrent LLM calls when the history assistant answers several queries in one request
+HISTORY_QUERY_MAX_WORKERS = env.int('HISTORY_QUERY_MAX_WORKERS', default=4)
+
+# PDF chunking: 'fixed' (300-character slices) or 'sentence' (sentence-aware, token-sized, overlapping)
+INGESTION_CHUNKER = env('INGESTION_CHUNKER', default='fixed')
+CHUNK_TARGET_TOKENS = env.int('CHUNK_TARGET_TOKENS', default=200)
+CHUNK_OVERLAP_TOKENS = env.int('CHUNK_OVERLAP_TOKENS', default=40)
+
+# Near-duplicate elimination during ingestion: chunks whose word-shingle MinHash similarity
+# to an already stored chunk of the same partition (document type, class level, subject) is
+# >= INGESTION_DEDUP_THRESHOLD are not embedded or stored.
+# MINHASH_PERMUTATIONS must be divisible by MINHASH_BANDS. Report with `manage.py dedup_report`.
+INGESTION_DEDUP = env.bool('INGESTION_DEDUP', default=True)
+INGESTION_DEDUP_THRESHOLD = env.float('INGESTION_DEDUP_THRESHOLD', default=0.8)
+MINHASH_PERMUTATIONS = env.int('MINHASH_PERMUTATIONS', default=128)
+MINHASH_BANDS = env.int('MINHASH_BANDS', default=32)
+
 PDFKIT_OPTIONS = {
     'page-size': 'Letter',
     'encoding': 'UTF-8',
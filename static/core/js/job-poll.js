@@ -0,0 +1,51 @@
+// Waits on background jobs (exam papers, theory grading, summaries, report cards).
+// The views queue the slow generation (see ai_core/jobs.py) and answer at once;
+// window.pollJob(statusUrl) polls the job's status with a growing delay and resolves
+// with the job once it has succeeded or failed. A page element with
+// data-job-status-url marks a page waiting on a job: it is reloaded when the job
+// finishes, and the view then shows the result or the error.
+(function () {
+
+  "use strict";
+
+  var FIRST_DELAY = 1000;
+  var MAX_DELAY = 5000;
+
+  function pollJob(statusUrl) {
+    return new Promise(function (resolve, reject) {
+      var delay = FIRST_DELAY;
+
+      function check() {
+        fetch(statusUrl, {
+          credentials: "same-origin",
+          headers: { "Accept": "application/json" }
+        }).then(function (response) {
+          if (!response.ok) {
+            throw new Error("Job status request failed with " + response.status);
+          }
+          return response.json();
+        }).then(function (job) {
+          if (job.status === "succeeded" || job.status === "dead") {
+            resolve(job);
+            return;
+          }
+          delay = Math.min(delay * 1.5, MAX_DELAY);
+          setTimeout(check, delay);
+        }).catch(reject);
+      }
+
+      setTimeout(check, delay);
+    });
+  }
+
+  window.pollJob = pollJob;
+
+  document.querySelectorAll("[data-job-status-url]").forEach(function (element) {
+    pollJob(element.getAttribute("data-job-status-url")).then(function () {
+      window.location.reload();
+    }, function () {
+      element.textContent = "Lost contact with the server. Refresh the page to check on your request.";
+    });
+  });
+
+})();
@@ -0,0 +1,129 @@
+// Streams long-form generations (lesson plans, lesson notes, stories, summaries).
+// Forms marked with data-stream are posted with stream=1; the view answers with
+// server-sent events (see ai_core/streaming.py). Tokens are shown as they arrive,
+// the rendered markdown replaces them as it comes in, and once the content is saved
+// the browser loads the saved result. Browsers without fetch streams submit normally.
+(function () {
+
+  "use strict";
+
+  if (!window.fetch || !window.ReadableStream || !window.TextDecoder) {
+    return;
+  }
+
+  function parseEvent(frame) {
+    var event = "message";
+    var data = "";
+    frame.split("\n").forEach(function (line) {
+      if (line.indexOf("event:") === 0) {
+        event = line.slice(6).trim();
+      } else if (line.indexOf("data:") === 0) {
+        data += line.slice(5).trim();
+      }
+    });
+    return { event: event, data: data ? JSON.parse(data) : {} };
+  }
+
+  function showError(output, message) {
+    output.innerHTML = "";
+    var alert = document.createElement("div");
+    alert.className = "alert alert-danger";
+    alert.textContent = message;
+    output.appendChild(alert);
+  }
+
+  function streamForm(form, event) {
+    event.preventDefault();
+    var button = form.querySelector("[type=submit]");
+    var output = form.parentNode.querySelector(".stream-output");
+    if (!output) {
+      output = document.createElement("div");
+      output.className = "stream-output markdown-body mt-4";
+      form.parentNode.insertBefore(output, form.nextSibling);
+    }
+    output.textContent = "Generating...";
+    if (button) {
+      button.disabled = true;
+    }
+
+    var body = new FormData(form);
+    body.append("stream", "1");
+    var text = "";
+    var rendered = false;
+    var finished = false;
+
+    function fail(message) {
+      finished = true;
+      showError(output, message);
+      if (button) {
+        button.disabled = false;
+      }
+    }
+
+    function handle(message) {
+      if (message.event === "token") {
+        text += message.data.text;
+        if (!rendered) {
+          output.textContent = text;
+        }
+      } else if (message.event === "html") {
+        rendered = true;
+        output.innerHTML = message.data.html;
+      } else if (message.event === "done") {
+        finished = true;
+        window.location.assign(message.data.redirect);
+      } else if (message.event === "error") {
+        fail(message.data.message);
+      }
+    }
+
+    fetch(form.getAttribute("action") || window.location.pathname, {
+      method: "POST",
+      body: body,
+      credentials: "same-origin",
+      headers: { "Accept": "text/event-stream" }
+    }).then(function (response) {
+      var type = response.headers.get("Content-Type") || "";
+      if (type.indexOf("text/event-stream") === -1) {
+        return response.json().then(function (data) {
+          fail(data.error || "Generation failed. Please try again.");
+        }, function () {
+          fail("Generation failed. Please try again.");
+        });
+      }
+      var reader = response.body.getReader();
+      var decoder = new TextDecoder();
+      var buffer = "";
+
+      function read() {
+        return reader.read().then(function (chunk) {
+          if (chunk.done) {
+            if (!finished) {
+              fail("The connection closed early. Your content may still have been saved; check your saved list.");
+            }
+            return;
+          }
+          buffer += decoder.decode(chunk.value, { stream: true });
+          var frames = buffer.split("\n\n");
+          buffer = frames.pop();
+          frames.forEach(function (frame) {
+            if (frame.trim()) {
+              handle(parseEvent(frame));
+            }
+          });
+          return read();
+        });
+      }
+      return read();
+    }).catch(function () {
+      fail("The connection was lost. Your content may still have been saved; check your saved list.");
+    });
+  }
+
+  document.querySelectorAll("form[data-stream]").forEach(function (form) {
+    form.addEventListener("submit", function (event) {
+      streamForm(form, event);
+    });
+  });
+
+})();